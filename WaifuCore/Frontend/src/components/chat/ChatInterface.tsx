@@ -5,21 +5,27 @@ import { Select, SelectContent, SelectItem, SelectTrigger, SelectValue } from ".
 import { Card, CardContent, CardHeader, CardTitle } from "../ui/card";
 import { Badge } from "../ui/badge";
 import { useAudioRecorder } from "../../hooks/use-audio-recorder";
-import { Mic, MicOff, Send, LoaderCircle, Sparkles, Heart, Settings, Volume2, Users, MoreVertical, Copy, Download, RefreshCw, Trash2 } from "lucide-react";
+import { Mic, MicOff, Send, Square, LoaderCircle, Sparkles, Heart, Settings, Volume2, Users, MoreVertical, Copy, Download, RefreshCw, Trash2 } from "lucide-react";
 
 export type ChatMessage = { role: "user" | "assistant"; content: string };
 export type CharacterStatus = { state: "idle" | "thinking" | "speaking"; animation: string; };
 
-const blobToBase64 = (blob: Blob): Promise<string> => {
-  return new Promise((resolve, reject) => {
-    const reader = new FileReader();
-    reader.onloadend = () => {
-      const base64data = (reader.result as string)?.split(",")[1];
-      resolve(base64data);
-    };
-    reader.onerror = reject;
-    reader.readAsDataURL(blob);
-  });
+const AUDIO_HEADER_SIZE = 12;
+const AUDIO_MIME_TYPES: Record<number, string> = { 0: "audio/wav", 1: "audio/mpeg", 2: "audio/ogg" };
+const AUDIO_FORMAT_MIME_TYPES: Record<string, string> = { wav: "audio/wav", mp3: "audio/mpeg", ogg: "audio/ogg" };
+
+// Reply formats this browser can play, most compact first; the server picks the first it supports.
+const playableAudioFormats = () => {
+  const probe = document.createElement("audio");
+  const formats = [];
+  if (probe.canPlayType('audio/ogg; codecs="opus"')) formats.push("opus");
+  if (probe.canPlayType("audio/mpeg")) formats.push("mp3");
+  formats.push("wav");
+  return formats.join(",");
+};
+
+const releaseAudioSource = (src: string) => {
+  if (src.startsWith("blob:")) URL.revokeObjectURL(src);
 };
 
 const API_BASE_URL = "";
@@ -45,6 +51,12 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ onStatusChange, onPlayAni
   const listRef = useRef<HTMLDivElement | null>(null);
   const ws = useRef<WebSocket | null>(null);
   const audioRef = useRef<HTMLAudioElement | null>(null);
+  const audioQueueRef = useRef<string[]>([]);
+  // Session key from the server's hello; a reconnect passes it back to resume the conversation
+  const sessionRef = useRef<string | null>(null);
+  // Latest turn the server has talked about, and the newest one the user interrupted (its late messages are dropped)
+  const turnRef = useRef(0);
+  const staleTurnRef = useRef(0);
   
   // These are the hardcoded default options that show even when backend is not running
   const [llmOptions, setLlmOptions] = useState([
@@ -103,12 +115,58 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ onStatusChange, onPlayAni
   
   useEffect(() => { localStorage.setItem("pref_mic", selectedMic); }, [selectedMic]);
 
+  const stopPlayback = () => {
+    audioQueueRef.current.forEach(releaseAudioSource);
+    audioQueueRef.current = [];
+    if (audioRef.current) { releaseAudioSource(audioRef.current.src); audioRef.current.pause(); audioRef.current.src = ''; audioRef.current = null; }
+  };
+
+  const playNextChunk = () => {
+    if (audioRef.current) releaseAudioSource(audioRef.current.src);
+    const src = audioQueueRef.current.shift();
+    if (!src) {
+      audioRef.current = null;
+      onStatusChange?.({ state: "idle", animation: "neutral" });
+      setCharacterState("idle");
+      return;
+    }
+    const newAudio = new Audio(src);
+    audioRef.current = newAudio;
+    newAudio.onended = () => { if (audioRef.current === newAudio) playNextChunk(); };
+    newAudio.play();
+  };
+
   useEffect(() => {
-    const socket = new WebSocket(`${WS_BASE_URL}/ws/chat?llm=${llm}&tts=${tts}`);
+    // Protocol v2: audio travels as binary frames, control messages stay JSON.
+    const resume = sessionRef.current ? `&session=${sessionRef.current}` : "";
+    const socket = new WebSocket(`${WS_BASE_URL}/ws/chat?llm=${llm}&tts=${tts}&protocol=2&audio=${playableAudioFormats()}${resume}`);
+    socket.binaryType = "arraybuffer";
     ws.current = socket;
     socket.onopen = () => { onStatusChange?.({ state: "idle", animation: "neutral" }); };
     socket.onmessage = (event) => {
+      if (event.data instanceof ArrayBuffer) {
+        // Header: version u8, turn u32, seq u16, format u8, sample rate u32 (big-endian)
+        const header = new DataView(event.data, 0, AUDIO_HEADER_SIZE);
+        if (header.getUint32(1) <= staleTurnRef.current) return;
+        const seq = header.getUint16(5);
+        const mime = AUDIO_MIME_TYPES[header.getUint8(7)] ?? "audio/wav";
+        if (seq === 0) stopPlayback();
+        audioQueueRef.current.push(URL.createObjectURL(new Blob([event.data.slice(AUDIO_HEADER_SIZE)], { type: mime })));
+        if (!audioRef.current) playNextChunk();
+        return;
+      }
       const data = JSON.parse(event.data);
+      if (data.type === "hello") { sessionRef.current = data.session ?? null; return; }
+      // The reply was interrupted (e.g. by a newer message); drop whatever audio is still queued
+      if (data.type === "cancelled") {
+        staleTurnRef.current = Math.max(staleTurnRef.current, data.turn);
+        stopPlayback();
+        return;
+      }
+      if (data.turn !== undefined) {
+        if (data.turn <= staleTurnRef.current) return;
+        turnRef.current = data.turn;
+      }
       if (data.state && data.animation) onStatusChange?.({ state: data.state, animation: data.animation });
       if (data.state) setCharacterState(data.state);
       if (data.action) onPlayAnimation?.(data.action);
@@ -121,19 +179,14 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ onStatusChange, onPlayAni
         });
       }
       if (data.audio) {
-        if (audioRef.current) { audioRef.current.pause(); audioRef.current.src = ''; }
-        const newAudio = new Audio(`data:audio/wav;base64,${data.audio}`);
-        audioRef.current = newAudio;
-        newAudio.play();
-        newAudio.onended = () => {
-          onStatusChange?.({ state: "idle", animation: "neutral" });
-          setCharacterState("idle");
-          if (audioRef.current === newAudio) { audioRef.current = null; }
-        };
+        // Replies arrive sentence by sentence; a chunk with seq 0 (or none) starts a new reply.
+        if (!data.seq) stopPlayback();
+        audioQueueRef.current.push(`data:${AUDIO_FORMAT_MIME_TYPES[data.format] ?? "audio/wav"};base64,${data.audio}`);
+        if (!audioRef.current) playNextChunk();
       }
     };
     socket.onclose = () => onStatusChange?.({ state: "idle", animation: "neutral" });
-    return () => { socket.close(); if (audioRef.current) { audioRef.current.pause(); audioRef.current = null; } };
+    return () => { socket.close(); stopPlayback(); };
   }, [llm, tts, onStatusChange, onPlayAnimation]);
 
   useEffect(() => { localStorage.setItem("pref_llm", llm); localStorage.setItem("pref_tts", tts); }, [llm, tts]);
@@ -144,10 +197,25 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ onStatusChange, onPlayAni
     }
   }, [characterState]);
 
-  const canSend = useMemo(() => (text.trim().length > 0 || !!audioBlob) && characterState === 'idle', [text, audioBlob, characterState]);
+  // Sending while Ananya is thinking or speaking interrupts her (the server cancels the reply in progress)
+  const canSend = useMemo(() => text.trim().length > 0 || !!audioBlob, [text, audioBlob]);
+
+  const interruptReply = () => {
+    staleTurnRef.current = turnRef.current;
+    stopPlayback();
+  };
+
+  const stopReply = () => {
+    if (!ws.current || ws.current.readyState !== WebSocket.OPEN) return;
+    interruptReply();
+    ws.current.send(JSON.stringify({ type: "cancel" }));
+    setCharacterState("idle");
+    onStatusChange?.({ state: "idle", animation: "neutral" });
+  };
 
   const send = async () => {
     if (!canSend || !ws.current || ws.current.readyState !== WebSocket.OPEN) return;
+    if (characterState !== 'idle') interruptReply();
     onPlayAnimation?.(null);
     let userMessageContent = "";
     
@@ -157,8 +225,7 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ onStatusChange, onPlayAni
         setText("");
     } else if (audioBlob) {
         userMessageContent = "🎤 Voice message";
-        const b64 = await blobToBase64(audioBlob);
-        ws.current.send(JSON.stringify({ type: "audio", payload: b64 }));
+        ws.current.send(await audioBlob.arrayBuffer());
         setAudioBlob(null);
         setAudioURL("");
     }
@@ -407,10 +474,10 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ onStatusChange, onPlayAni
                     isRecording 
                       ? "🎤 Recording..." 
                       : characterState !== 'idle' 
-                        ? `Ananya is ${characterState}...` 
+                        ? `Ananya is ${characterState}... type to interrupt` 
                         : "Type your message to Ananya..."
                   }
-                  disabled={isRecording || characterState !== 'idle'}
+                  disabled={isRecording}
                   onKeyDown={(e) => { 
                     if (e.key === "Enter" && !e.shiftKey) { 
                       e.preventDefault(); 
@@ -435,7 +502,6 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ onStatusChange, onPlayAni
             <Button 
               variant={isRecording ? "destructive" : "outline"} 
               onClick={isRecording ? stop : () => start(selectedMic)} 
-              disabled={characterState !== 'idle'}
               className={`h-14 w-14 p-0 rounded-xl ${
                 isRecording 
                   ? "animate-pulse" 
@@ -447,16 +513,19 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({ onStatusChange, onPlayAni
             </Button>
             
             <Button 
-              onClick={send} 
-              disabled={!canSend}
+              onClick={canSend ? send : stopReply} 
+              disabled={!canSend && characterState === 'idle'}
               className="h-14 px-8 bg-gradient-to-r from-pink-500 to-purple-600 hover:from-pink-600 hover:to-purple-700 text-white shadow-lg hover:shadow-xl transition-all duration-300 rounded-xl"
+              title={!canSend && characterState !== 'idle' ? "Stop Ananya's reply" : undefined}
             >
-              {characterState !== 'idle' ? (
+              {canSend || characterState === 'idle' ? (
+                <Send className="h-6 w-6" />
+              ) : characterState === 'thinking' ? (
                 <LoaderCircle className="h-6 w-6 animate-spin" />
               ) : (
-                <Send className="h-6 w-6" />
+                <Square className="h-6 w-6" />
               )}
-              <span className="ml-3 hidden sm:inline text-base font-medium">Send</span>
+              <span className="ml-3 hidden sm:inline text-base font-medium">{canSend || characterState === 'idle' ? "Send" : "Stop"}</span>
             </Button>
           </div>
         </div>
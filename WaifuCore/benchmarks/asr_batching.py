@@ -0,0 +1,86 @@
+# benchmarks/asr_batching.py
+"""
+Throughput vs. latency of the cross-session ASR micro-batcher.
+
+Simulates N voice sessions that each send an utterance, wait for the transcript and
+send the next one, for every combination of max batch size and max wait window.
+
+Run from the WaifuCore directory:
+    python benchmarks/asr_batching.py --model tiny --sessions 8 --rounds 3
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from waifu_core.services.asr_service import ASRService, SERVICE_CONFIG
+from waifu_core.services.asr_scheduler import ASRBatchScheduler
+
+VOICE_DIR = Path(__file__).resolve().parent.parent / "assets" / "character_voices"
+
+
+def load_utterances(asr: ASRService, seconds: float) -> list:
+    """Cuts the bundled character voice samples into utterances of the given length."""
+    utterances = []
+    for path in sorted(VOICE_DIR.glob("*.wav")):
+        samples = asr.load_audio(str(path))
+        step = int(seconds * 16000)
+        utterances += [samples[i:i + step] for i in range(0, len(samples) - step + 1, step)]
+    return utterances
+
+
+async def run_config(asr, utterances, sessions, rounds, batch_size, wait_ms):
+    scheduler = ASRBatchScheduler(asr, max_batch_size=batch_size, max_wait_ms=wait_ms)
+    latencies = []
+
+    async def session(index):
+        for round_index in range(rounds):
+            audio = utterances[(index + round_index) % len(utterances)]
+            started = time.perf_counter()
+            await scheduler.transcribe(audio)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(session(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "throughput": len(latencies) / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(0.95 * (len(latencies) - 1))],
+        "batches": scheduler.batches,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=SERVICE_CONFIG['asr']['model_size'])
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--seconds", type=float, default=3.0, help="length of each utterance")
+    parser.add_argument("--batch-sizes", default="1,4,8")
+    parser.add_argument("--waits", default="0,20,50", help="max wait windows in ms")
+    args = parser.parse_args()
+
+    asr = ASRService(config={**SERVICE_CONFIG['asr'], 'model_size': args.model})
+    utterances = load_utterances(asr, args.seconds)
+    # Untimed warm-up so the first configuration doesn't pay for kernel initialisation
+    asr.transcribe_audio(utterances[0])
+
+    print(f"\nmodel={args.model} sessions={args.sessions} rounds={args.rounds} utterance={args.seconds}s")
+    print(f"{'batch':>5} {'wait ms':>7} {'utt/s':>7} {'p50 s':>7} {'p95 s':>7} {'batches':>7}")
+    for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+        for wait_ms in [float(w) for w in args.waits.split(",")]:
+            if batch_size == 1 and wait_ms != float(args.waits.split(",")[0]):
+                continue  # the wait window is irrelevant without batching
+            result = asyncio.run(run_config(asr, utterances, args.sessions, args.rounds, batch_size, wait_ms))
+            print(f"{batch_size:>5} {wait_ms:>7.0f} {result['throughput']:>7.2f} "
+                  f"{result['p50']:>7.3f} {result['p95']:>7.3f} {result['batches']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# benchmarks/llm_hedging.py
+"""
+Time to first token with and without hedged LLM routing, against two local
+stub servers (benchmarks/stub_llm_server.py): a primary with a slow tail and
+occasional errors, and a steadier secondary.
+
+Run from the WaifuCore directory:
+    python benchmarks/llm_hedging.py --requests 200 --hedge-after-ms 400
+"""
+import argparse
+import asyncio
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+WAIFU_CORE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(WAIFU_CORE_DIR))
+
+from openai import AsyncOpenAI
+from waifu_core.http_pool import HTTPPool
+from waifu_core.services.llm_router import LLMRouter
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_stub(port: int, *options: str) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [sys.executable, str(WAIFU_CORE_DIR / "benchmarks" / "stub_llm_server.py"), "--port", str(port), "--seed", str(port), *options],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.perf_counter() + 30
+    while time.perf_counter() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/stats", timeout=1).close()
+            return server
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.1)
+    server.terminate()
+    sys.exit(f"Stub server on port {port} did not start")
+
+
+def stream_from(client: AsyncOpenAI):
+    async def deltas():
+        stream = await client.chat.completions.create(
+            model="stub", messages=[{"role": "user", "content": "Hi"}], max_tokens=50, stream=True
+        )
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+        finally:
+            await stream.close()
+    return deltas
+
+
+async def run(router: LLMRouter, clients: dict[str, AsyncOpenAI], requests: int, concurrency: int):
+    first_tokens, totals, failures = [], [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        nonlocal failures
+        async with semaphore:
+            attempts = [(key, stream_from(clients[key])) for key in router.rank("primary", list(clients))]
+            started = time.perf_counter()
+            first = None
+            try:
+                async for _ in router.stream(attempts):
+                    if first is None:
+                        first = time.perf_counter() - started
+            except Exception:
+                failures += 1
+                return
+            first_tokens.append(first)
+            totals.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return first_tokens, totals, failures
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[int(fraction * (len(ordered) - 1))] if ordered else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--hedge-after-ms", type=float, default=400)
+    parser.add_argument("--primary", default="--first-token-ms 150 --tail-prob 0.1 --tail-ms 2000 --error-rate 0.03",
+                        help="Options for the primary stub")
+    parser.add_argument("--secondary", default="--first-token-ms 250", help="Options for the secondary stub")
+    args = parser.parse_args()
+
+    ports = {"primary": free_port(), "secondary": free_port()}
+    servers = [start_stub(ports["primary"], *args.primary.split()), start_stub(ports["secondary"], *args.secondary.split())]
+    try:
+        print(f"{'mode':>10} {'ok':>5} {'failed':>6} {'ttft p50 ms':>12} {'p95 ms':>8} {'p99 ms':>8} {'total p50 ms':>13}")
+        for mode, max_attempts in (("single", 1), ("hedged", 2)):
+            pool = HTTPPool({"max_connections": 64, "max_keepalive_connections": 64})
+            clients = {
+                key: AsyncOpenAI(api_key="stub", base_url=f"http://127.0.0.1:{port}/v1",
+                                 http_client=pool.get_async_client(f"http://127.0.0.1:{port}"), max_retries=0)
+                for key, port in ports.items()
+            }
+            router = LLMRouter({"hedge_after_ms": args.hedge_after_ms, "max_attempts": max_attempts})
+            first_tokens, totals, failures = asyncio.run(run(router, clients, args.requests, args.concurrency))
+            print(
+                f"{mode:>10} {len(first_tokens):>5} {failures:>6} {statistics.median(first_tokens) * 1000:>12.1f} "
+                f"{percentile(first_tokens, 0.95) * 1000:>8.1f} {percentile(first_tokens, 0.99) * 1000:>8.1f} "
+                f"{statistics.median(totals) * 1000:>13.1f}"
+            )
+            for key, stats in router.stats().items():
+                print(f"{'':>10} {key}: {stats}")
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
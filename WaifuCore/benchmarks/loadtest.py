@@ -0,0 +1,282 @@
+# benchmarks/loadtest.py
+"""
+Load generator for /ws/chat.
+
+Opens N concurrent sessions that each replay a script of text and audio turns
+and reports throughput, time to first text, time to first audio and whole-turn
+latency (p50/p95/p99), the error rate, and the server's own per-stage timings
+(from the `timings` message each turn ends with).
+
+By default it starts everything it needs locally: stub_llm_server.py as the LLM
+and loadtest_server.py (the real app with stand-in ASR/TTS/memory). Pass --url
+to load an already running server instead.
+
+Run from the WaifuCore directory:
+    python benchmarks/loadtest.py --sessions 20 --turns 5 --save baseline.json
+    python benchmarks/loadtest.py --sessions 20 --turns 5 --compare baseline.json
+    python benchmarks/loadtest.py --sessions 40 --busy --workers 4 --state sqlite
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+import wave
+from pathlib import Path
+
+import websockets
+
+WAIFU_CORE_DIR = Path(__file__).resolve().parent.parent
+
+DEFAULT_SCRIPT = [
+    {"text": "Hi! How are you doing today?"},
+    {"audio_seconds": 2.0},
+    {"text": "What should I cook for dinner tonight?"},
+    {"audio_seconds": 4.0},
+    {"text": "Thanks, talk to you later."},
+]
+
+# Latency metrics compared against a baseline; higher is worse
+COMPARED = ["first_text", "first_audio", "turn"]
+
+
+def silent_wav(seconds: float) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(bytes(2 * int(16000 * seconds)))
+    return buffer.getvalue()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, timeout: float) -> bool:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).close()
+            return True
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.1)
+    return False
+
+
+def spawn_servers(args) -> tuple[str, list[subprocess.Popen]]:
+    """Starts the stub LLM and the stubbed API server; returns the ws URL."""
+    output = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    llm_port, api_port = free_port(), free_port()
+    processes = [subprocess.Popen(
+        [sys.executable, str(WAIFU_CORE_DIR / "benchmarks" / "stub_llm_server.py"), "--port", str(llm_port),
+         "--seed", "0", "--first-token-ms", str(args.llm_first_token_ms), "--token-ms", str(args.llm_token_ms)],
+        stdout=output, stderr=subprocess.STDOUT,
+    )]
+    if not wait_for(f"http://127.0.0.1:{llm_port}/stats", 30):
+        sys.exit("The stub LLM server did not start")
+    processes.append(subprocess.Popen(
+        [sys.executable, str(WAIFU_CORE_DIR / "benchmarks" / "loadtest_server.py"), "--port", str(api_port),
+         "--asr-ms", str(args.asr_ms), "--tts-ms", str(args.tts_ms), "--memory-ms", str(args.memory_ms),
+         "--workers", str(args.workers), *(["--state", args.state] if args.state else []), "--state-url", args.state_url,
+         *(["--busy"] if args.busy else [])],
+        cwd=WAIFU_CORE_DIR, stdout=output, stderr=subprocess.STDOUT,
+        env={**os.environ, "OLLAMA_HOST_URL": f"http://127.0.0.1:{llm_port}", "PYTHONUNBUFFERED": "1"},
+    ))
+    if not wait_for(f"http://127.0.0.1:{api_port}/health", 60):
+        for process in processes:
+            process.terminate()
+        sys.exit("The API server did not start (see --server-log)")
+    return f"ws://127.0.0.1:{api_port}/ws/chat?llm=ollama&tts=stub", processes
+
+
+class Results:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {name: [] for name in COMPARED}
+        self.server_stages: dict[str, list[float]] = {}
+        self.turns = 0
+        self.failed = 0
+        self.errors: dict[str, int] = {}
+
+    def fail(self, reason: str, turns: int = 1):
+        self.failed += turns
+        self.errors[reason] = self.errors.get(reason, 0) + turns
+
+
+async def run_turn(ws, turn: dict, audio_cache: dict, timeout: float) -> dict:
+    """Sends one scripted turn and waits for its `timings` message; returns the measurements."""
+    started = time.perf_counter()
+    if "audio_seconds" in turn:
+        seconds = turn["audio_seconds"]
+        audio = audio_cache.setdefault(seconds, silent_wav(seconds))
+        await ws.send(audio)
+    else:
+        await ws.send(json.dumps({"type": "text", "payload": turn["text"]}))
+
+    measured = {}
+    async with asyncio.timeout(timeout):
+        while True:
+            message = await ws.recv()
+            elapsed = time.perf_counter() - started
+            if isinstance(message, bytes):
+                measured.setdefault("first_audio", elapsed)
+                continue
+            data = json.loads(message)
+            if data.get("type") == "timings":
+                measured["turn"] = elapsed
+                measured["server"] = data["timings"]
+                return measured
+            if data.get("audio"):
+                measured.setdefault("first_audio", elapsed)
+            if data.get("text"):
+                measured.setdefault("first_text", elapsed)
+
+
+async def run_session(index: int, args, script: list[dict], results: Results, audio_cache: dict):
+    await asyncio.sleep(index * args.ramp / max(args.sessions, 1))
+    turns = [script[(index + i) % len(script)] for i in range(args.turns)]
+    url = f"{args.url}{'&' if '?' in args.url else '?'}protocol=2&timings=true&user=load-{index}"
+    completed = 0
+    try:
+        async with websockets.connect(url, max_size=None, open_timeout=args.turn_timeout) as ws:
+            hello = json.loads(await ws.recv())
+            if hello.get("type") != "hello":
+                raise RuntimeError(f"unexpected greeting {hello}")
+            for turn in turns:
+                try:
+                    measured = await run_turn(ws, turn, audio_cache, args.turn_timeout)
+                except TimeoutError:
+                    # The session's remaining turns would queue behind this one
+                    results.fail("timeout", len(turns) - completed)
+                    return
+                completed += 1
+                results.turns += 1
+                for name in COMPARED:
+                    if name in measured:
+                        results.latencies[name].append(measured[name])
+                for stage, ms in measured["server"].items():
+                    results.server_stages.setdefault(stage, []).append(ms / 1000)
+                if args.think_ms:
+                    await asyncio.sleep(args.think_ms / 1000)
+    except (OSError, websockets.WebSocketException, RuntimeError) as e:
+        # A dropped session loses the turn in progress and the ones it had left
+        results.fail(type(e).__name__, len(turns) - completed)
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[round(fraction * (len(ordered) - 1))] if ordered else float("nan")
+
+
+def summarize(results: Results, elapsed: float, args) -> dict:
+    attempted = results.turns + results.failed
+    summary = {
+        "sessions": args.sessions,
+        "turns": results.turns,
+        "failed": results.failed,
+        "error_rate": round(results.failed / attempted, 4) if attempted else 0.0,
+        "errors": results.errors,
+        "throughput_turns_per_s": round(results.turns / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": {},
+        "server_stage_p50_ms": {},
+    }
+    for name, values in results.latencies.items():
+        summary["latency_ms"][name] = {
+            f"p{int(q * 100)}": round(percentile(values, q) * 1000, 1) for q in (0.5, 0.95, 0.99)
+        }
+    for stage, values in sorted(results.server_stages.items()):
+        summary["server_stage_p50_ms"][stage] = round(statistics.median(values) * 1000, 1)
+    return summary
+
+
+def print_summary(summary: dict):
+    print(f"sessions {summary['sessions']}: {summary['turns']} turns ok, {summary['failed']} failed "
+          f"(error rate {summary['error_rate']:.2%}) {summary['errors'] or ''}")
+    print(f"throughput: {summary['throughput_turns_per_s']:.2f} turns/s")
+    print(f"{'latency':>12} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, values in summary["latency_ms"].items():
+        print(f"{name:>12} {values['p50']:>9.1f} {values['p95']:>9.1f} {values['p99']:>9.1f}")
+    print("server stages (p50 ms): " + ", ".join(f"{stage} {ms}" for stage, ms in summary["server_stage_p50_ms"].items()))
+
+
+def compare(summary: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Regressions against a saved run: p95 latencies or throughput worse by more than `tolerance`."""
+    regressions = []
+    for name in COMPARED:
+        now, before = summary["latency_ms"][name]["p95"], baseline["latency_ms"].get(name, {}).get("p95")
+        if before and now > before * (1 + tolerance):
+            regressions.append(f"{name} p95 {before} ms -> {now} ms")
+    now, before = summary["throughput_turns_per_s"], baseline["throughput_turns_per_s"]
+    if before and now < before * (1 - tolerance):
+        regressions.append(f"throughput {before} -> {now} turns/s")
+    if summary["error_rate"] > baseline["error_rate"]:
+        regressions.append(f"error rate {baseline['error_rate']:.2%} -> {summary['error_rate']:.2%}")
+    return regressions
+
+
+async def run(args, script: list[dict]) -> dict:
+    results = Results()
+    audio_cache = {}
+    started = time.perf_counter()
+    await asyncio.gather(*(run_session(i, args, script, results, audio_cache) for i in range(args.sessions)))
+    return summarize(results, time.perf_counter() - started, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=10, help="Concurrent sessions")
+    parser.add_argument("--turns", type=int, default=5, help="Turns per session")
+    parser.add_argument("--script", type=Path, help='JSON list of turns: {"text": ...} or {"audio_seconds": ...}')
+    parser.add_argument("--ramp", type=float, default=1.0, help="Seconds over which the sessions connect")
+    parser.add_argument("--think-ms", type=float, default=0, help="Pause between a session's turns")
+    parser.add_argument("--turn-timeout", type=float, default=60)
+    parser.add_argument("--url", help="ws:// URL of a running server, e.g. ws://127.0.0.1:8000/ws/chat?llm=ollama&tts=kokoro")
+    parser.add_argument("--llm-first-token-ms", type=float, default=300, help="Stub LLM (spawned servers only)")
+    parser.add_argument("--llm-token-ms", type=float, default=20)
+    parser.add_argument("--asr-ms", type=float, default=150, help="Stub ASR (spawned servers only)")
+    parser.add_argument("--tts-ms", type=float, default=80, help="Stub TTS (spawned servers only)")
+    parser.add_argument("--memory-ms", type=float, default=10, help="Stub memory retrieval (spawned servers only)")
+    parser.add_argument("--workers", type=int, default=1, help="API worker processes (spawned servers only)")
+    parser.add_argument("--state", choices=["file", "sqlite", "redis"], help="Session state backend of the spawned server")
+    parser.add_argument("--state-url", default="redis://127.0.0.1:6379/0", help="Redis URL for --state redis")
+    parser.add_argument("--busy", action="store_true", help="Stub ASR/TTS/memory spin on the CPU instead of sleeping")
+    parser.add_argument("--server-log", help="File for the spawned servers' output")
+    parser.add_argument("--save", type=Path, help="Write the summary as JSON")
+    parser.add_argument("--compare", type=Path, help="A summary saved earlier; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown when comparing")
+    args = parser.parse_args()
+
+    script = json.loads(args.script.read_text()) if args.script else DEFAULT_SCRIPT
+    processes = []
+    if not args.url:
+        args.url, processes = spawn_servers(args)
+    try:
+        summary = asyncio.run(run(args, script))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    print_summary(summary)
+    if args.save:
+        args.save.write_text(json.dumps(summary, indent=2))
+    if args.compare:
+        regressions = compare(summary, json.loads(args.compare.read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
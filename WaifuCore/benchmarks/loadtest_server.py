@@ -0,0 +1,175 @@
+# benchmarks/loadtest_server.py
+"""
+Runs the real API server (main_api:app) with deterministic stand-ins for the
+model-backed services, so load tests measure the server's own overhead offline
+on a CPU-only box:
+
+  * ASR returns a fixed transcript after asr_ms + asr_ms_per_second per second
+    of audio, holding an `asr` executor thread the way Whisper would;
+  * TTS returns silent WAV audio sized to the text (~15 characters a second)
+    after tts_ms + tts_ms_per_char per character, on the `tts` executor;
+  * memory retrieval takes memory_ms on the `embedding` executor and finds nothing.
+
+The LLM is whatever OLLAMA_HOST_URL points at (see stub_llm_server.py); connect
+with ?llm=ollama. Any TTS provider name selects the stand-in.
+
+    OLLAMA_HOST_URL=http://127.0.0.1:9101 python benchmarks/loadtest_server.py --port 8010
+
+--workers N runs N worker processes sharing the session state chosen with --state
+(a temporary SQLite file, or the Redis server at --state-url, e.g. one started with
+stub_redis_server.py). The stand-ins sleep by default, which costs no CPU; --busy
+makes them spin instead, so throughput shows how far extra workers scale with cores.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import wave
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from waifu_core.config import service_config
+from waifu_core.executors import run_in_stage
+from waifu_core.services.tts.base_tts import BaseTTSService
+
+TRANSCRIPT = "Tell me something nice about your day."
+TTS_SAMPLE_RATE = 24000
+TTS_CHARS_PER_SECOND = 15
+# Settings handed to the worker processes, which import create_app() on their own
+SETTINGS_ENV = "WAIFU_LOADTEST"
+BUSY = False
+
+
+def hold(ms: float):
+    """Takes `ms` of wall time: asleep, or with --busy spinning on the CPU as inference would."""
+    if not BUSY:
+        time.sleep(ms / 1000)
+        return
+    deadline = time.perf_counter() + ms / 1000
+    while time.perf_counter() < deadline:
+        pass
+
+
+class StubASR:
+    """Stands in for both the ASR service and its batch scheduler."""
+
+    def __init__(self, delay_ms: float, ms_per_second: float):
+        self.delay_ms = delay_ms
+        self.ms_per_second = ms_per_second
+
+    def _transcribe(self, audio: bytes) -> str:
+        seconds = max(len(audio) - 44, 0) / (16000 * 2)  # 16 kHz, 16-bit WAV
+        hold(self.delay_ms + self.ms_per_second * seconds)
+        return TRANSCRIPT
+
+    async def transcribe(self, audio: bytes) -> str:
+        return await run_in_stage("asr", self._transcribe, audio)
+
+
+class StubTTS(BaseTTSService):
+    def __init__(self, delay_ms: float, ms_per_char: float):
+        self.config = {}
+        self.delay_ms = delay_ms
+        self.ms_per_char = ms_per_char
+
+    def cache_identity(self) -> tuple[str, str, str]:
+        return ("stub", "stub", "stub")
+
+    def _render(self, text: str) -> bytes:
+        hold(self.delay_ms + self.ms_per_char * len(text))
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(TTS_SAMPLE_RATE)
+            wav.writeframes(bytes(2 * TTS_SAMPLE_RATE * max(len(text), 1) // TTS_CHARS_PER_SECOND))
+        return buffer.getvalue()
+
+    async def _synthesize(self, text: str, emotion: str) -> bytes | None:
+        return await run_in_stage("tts", self._render, text)
+
+
+class StubMemory:
+    def __init__(self, delay_ms: float):
+        self.delay_ms = delay_ms
+
+    def retrieve_relevant_memories(self, query: str, user_id: str = "user") -> list[str]:
+        hold(self.delay_ms)
+        return []
+
+    def add_memory_batch(self, facts_by_user: dict[str, list[str]]):
+        hold(self.delay_ms)
+
+    def stats(self) -> dict:
+        return {"result_hit_rate": 0.0}
+
+
+def install_stubs(args):
+    """Points the shared registry at the stand-ins and adjusts the config for an offline run."""
+    global BUSY
+    BUSY = args.busy
+    config = service_config()
+    config['registry']['warmup'] = False
+    config['tts'].setdefault('cache', {})['enabled'] = args.tts_cache
+    config['history']['dir'] = str(Path(args.state_dir) / "history")
+    config['http']['prewarm'] = []
+    config['state'] = {
+        **config.get('state', {}),
+        'backend': args.state,
+        'sqlite_path': str(Path(args.state_dir) / "state.db"),
+        'redis_url': args.state_url,
+    }
+
+    from waifu_core.registry import get_registry
+    registry = get_registry()
+    asr = StubASR(args.asr_ms, args.asr_ms_per_second)
+    tts = StubTTS(args.tts_ms, args.tts_ms_per_char)
+    memory = StubMemory(args.memory_ms)
+    registry.get_asr = lambda: asr
+    registry.get_asr_scheduler = lambda: asr
+    registry.get_tts = lambda provider: tts
+    registry.get_memory = lambda: memory
+    registry.warmed_up = True
+
+
+def create_app():
+    """App factory for the worker processes of a --workers run."""
+    install_stubs(argparse.Namespace(**json.loads(os.environ[SETTINGS_ENV])))
+    import main_api
+    return main_api.app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--asr-ms", type=float, default=150, help="Fixed ASR delay")
+    parser.add_argument("--asr-ms-per-second", type=float, default=50, help="ASR delay per second of audio")
+    parser.add_argument("--tts-ms", type=float, default=80, help="Fixed delay per synthesized sentence")
+    parser.add_argument("--tts-ms-per-char", type=float, default=1.0)
+    parser.add_argument("--memory-ms", type=float, default=10, help="Memory retrieval delay")
+    parser.add_argument("--tts-cache", action="store_true", help="Keep the TTS audio cache enabled")
+    parser.add_argument("--busy", action="store_true", help="Stand-ins spin on the CPU instead of sleeping")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes")
+    parser.add_argument("--state", choices=["file", "sqlite", "redis"], help="Session state backend (default: sqlite with several workers)")
+    parser.add_argument("--state-url", default="redis://127.0.0.1:6379/0", help="Redis URL for --state redis")
+    args = parser.parse_args()
+    args.state = args.state or ("sqlite" if args.workers > 1 else "file")
+    args.state_dir = tempfile.mkdtemp(prefix="waifu-loadtest-state-")
+
+    import uvicorn
+    if args.workers > 1:
+        os.environ[SETTINGS_ENV] = json.dumps(vars(args))
+        uvicorn.run("loadtest_server:create_app", factory=True, workers=args.workers, app_dir=str(Path(__file__).resolve().parent),
+                    host="127.0.0.1", port=args.port, log_level="warning")
+        return
+    install_stubs(args)
+    import main_api
+    uvicorn.run(main_api.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
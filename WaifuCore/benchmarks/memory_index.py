@@ -0,0 +1,118 @@
+# benchmarks/memory_index.py
+"""
+Memory retrieval latency: Chroma (filtered by user) vs. the memmap index backend.
+
+Fills both stores with random unit vectors for one user (plus as many for a second
+user, so Chroma's `where` filter has work to do), then times top-k queries
+and the cost of appending a few more memories.
+
+Run from the WaifuCore directory:
+    python benchmarks/memory_index.py --sizes 1000 10000 100000
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import chromadb
+from waifu_core.services.vector_index import MemmapVectorIndex
+
+
+def random_vectors(rng, count: int, dim: int) -> np.ndarray:
+    vectors = rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def timed(fn, repeats: int) -> list[float]:
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def summarize(timings: list[float]) -> str:
+    timings = sorted(timings)
+    p95 = timings[int(0.95 * (len(timings) - 1))]
+    return f"{statistics.median(timings) * 1000:9.3f} {p95 * 1000:9.3f}"
+
+
+def run_size(size: int, dim: int, queries: int, k: int, workdir: Path, rng) -> dict:
+    vectors = random_vectors(rng, size, dim)
+    others = random_vectors(rng, size, dim)
+    ids = [f"user_{i}" for i in range(size)]
+    documents = [f"memory {i}" for i in range(size)]
+    query_vectors = random_vectors(rng, queries, dim)
+    extra = random_vectors(rng, 10, dim)
+
+    client = chromadb.PersistentClient(path=str(workdir / f"chroma_{size}"))
+    collection = client.get_or_create_collection(name="bench_memories", embedding_function=None)
+    batch = client.get_max_batch_size()
+    started = time.perf_counter()
+    for user, rows in (("user", vectors), ("other", others)):
+        for start in range(0, size, batch):
+            end = min(start + batch, size)
+            collection.add(
+                ids=[f"{user}_{i}" for i in range(start, end)],
+                embeddings=rows[start:end].tolist(),
+                documents=documents[start:end],
+                metadatas=[{"user": user}] * (end - start),
+            )
+    chroma_load = time.perf_counter() - started
+
+    index = MemmapVectorIndex(str(workdir / f"memmap_{size}"))
+    started = time.perf_counter()
+    index.append("user", ids, documents, vectors)
+    index.append("other", [f"other_{i}" for i in range(size)], documents, others)
+    memmap_load = time.perf_counter() - started
+
+    query_iter = iter(query_vectors)
+    chroma_query = timed(lambda: collection.query(
+        query_embeddings=[next(query_iter).tolist()], n_results=k, where={"user": "user"}
+    ), queries)
+    query_iter = iter(query_vectors)
+    memmap_query = timed(lambda: index.search("user", next(query_iter), k), queries)
+
+    counter = iter(range(10))
+    chroma_append = timed(lambda: collection.add(
+        ids=[f"user_new_{next(counter)}"], embeddings=[extra[0].tolist()], documents=["new"], metadatas=[{"user": "user"}]
+    ), 10)
+    counter = iter(range(10))
+    memmap_append = timed(lambda: index.append("user", [f"user_new_{next(counter)}"], ["new"], extra[:1]), 10)
+
+    return {
+        "load": (chroma_load, memmap_load),
+        "query": (chroma_query, memmap_query),
+        "append": (chroma_append, memmap_append),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Memories per user")
+    parser.add_argument("--dim", type=int, default=384, help="Embedding size (all-MiniLM-L6-v2 is 384)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=3, help="Memories returned per query")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'size':>8} {'backend':>8} {'load s':>8} {'query p50 ms':>13} {'p95 ms':>9} {'append p50 ms':>14} {'p95 ms':>9}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            result = run_size(size, args.dim, args.queries, args.k, Path(workdir), rng)
+            for column, backend in enumerate(("chroma", "memmap")):
+                print(
+                    f"{size:>8} {backend:>8} {result['load'][column]:>8.2f} "
+                    f"{summarize(result['query'][column]):>23} {summarize(result['append'][column]):>24}"
+                )
+
+
+if __name__ == "__main__":
+    main()
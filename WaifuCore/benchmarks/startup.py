@@ -0,0 +1,116 @@
+# benchmarks/startup.py
+"""
+Cold-start cost of the API server.
+
+Measures, in fresh interpreters:
+  * how long `import main_api` takes, and which packages it spends that time in
+    (from `python -X importtime`);
+  * how long after launching uvicorn `/health` first answers, and optionally
+    when `/ready` reports the models warmed up.
+
+Run from the WaifuCore directory:
+    python benchmarks/startup.py --runs 5 --ready
+"""
+import argparse
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+WAIFU_CORE_DIR = Path(__file__).resolve().parent.parent
+
+
+def time_import(runs: int) -> tuple[list[float], list[tuple[int, str]]]:
+    timings, slowest = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import main_api"],
+            cwd=WAIFU_CORE_DIR, capture_output=True, text=True,
+        )
+        timings.append(time.perf_counter() - started)
+        if result.returncode != 0:
+            sys.exit(f"import main_api failed:\n{result.stderr[-2000:]}")
+        slowest = cost_by_package(result.stderr)
+    return timings, slowest
+
+
+def cost_by_package(importtime_output: str) -> list[tuple[int, str]]:
+    """(microseconds, package) summed over every module of each top-level package, slowest first."""
+    totals = {}
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        try:
+            microseconds = int(own)
+        except ValueError:
+            continue  # The header line
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0) + microseconds
+    return sorted(((us, name) for name, us in totals.items()), reverse=True)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url: str, deadline: float) -> bool:
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            pass
+        time.sleep(0.05)
+    return False
+
+
+def time_readiness(wait_ready: bool, timeout: float) -> tuple[float | None, float | None]:
+    port = free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main_api:app", "--port", str(port), "--log-level", "warning"],
+        cwd=WAIFU_CORE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = started + timeout
+        health = time.perf_counter() - started if wait_for(f"http://127.0.0.1:{port}/health", deadline) else None
+        ready = None
+        if wait_ready and health is not None:
+            ready = time.perf_counter() - started if wait_for(f"http://127.0.0.1:{port}/ready", deadline) else None
+        return health, ready
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Slowest packages to list")
+    parser.add_argument("--ready", action="store_true", help="Also wait for /ready (model warm-up)")
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds to wait for the server")
+    args = parser.parse_args()
+
+    timings, slowest = time_import(args.runs)
+    print(f"import main_api: median {statistics.median(timings):.3f} s, max {max(timings):.3f} s over {args.runs} runs")
+    print("Slowest packages to import (last run):")
+    for microseconds, name in slowest[:args.top]:
+        print(f"  {microseconds / 1e6:7.3f} s  {name}")
+
+    health, ready = time_readiness(args.ready, args.timeout)
+    print(f"/health answering after: {f'{health:.3f} s' if health is not None else 'timed out'}")
+    if args.ready:
+        print(f"/ready after: {f'{ready:.3f} s' if ready is not None else 'timed out'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# benchmarks/stub_llm_server.py
+"""
+A stand-in for an OpenAI-compatible chat completions endpoint (Groq, Ollama),
+with controllable latency and failures, for exercising LLM routing and hedging
+without API keys.
+
+    python benchmarks/stub_llm_server.py --port 9101 --first-token-ms 200 \
+        --tail-prob 0.1 --tail-ms 3000 --error-rate 0.05
+
+Point a provider at it with OLLAMA_HOST_URL=http://127.0.0.1:9101, or
+GROQ_BASE_URL=http://127.0.0.1:9101/v1 (any GROQ_API_KEY will do).
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def create_app(first_token_ms: float, tail_prob: float, tail_ms: float, token_ms: float,
+               error_rate: float, reply: str, seed: int | None = None) -> FastAPI:
+    app = FastAPI()
+    rng = random.Random(seed)
+    counters = {"requests": 0, "errors": 0, "cancelled": 0}
+
+    def first_token_delay() -> float:
+        delay = first_token_ms * rng.uniform(0.8, 1.2)
+        if rng.random() < tail_prob:
+            delay += tail_ms
+        return delay / 1000
+
+    def chunk(model: str, content: str | None, finish: str | None = None) -> str:
+        body = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": content} if content else {}, "finish_reason": finish}],
+        }
+        return f"data: {json.dumps(body)}\n\n"
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "stub")
+        counters["requests"] += 1
+        if rng.random() < error_rate:
+            counters["errors"] += 1
+            return JSONResponse({"error": {"message": "stub overloaded", "type": "server_error"}}, status_code=503)
+        delay = first_token_delay()
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay + token_ms * len(reply.split()) / 1000)
+            return {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }
+
+        async def events():
+            try:
+                await asyncio.sleep(delay)
+                for i, word in enumerate(reply.split(" ")):
+                    if i:
+                        await asyncio.sleep(token_ms / 1000)
+                    yield chunk(model, word if i == 0 else " " + word)
+                yield chunk(model, None, finish="stop")
+                yield "data: [DONE]\n\n"
+            except asyncio.CancelledError:
+                # The client hung up, e.g. it lost a hedge
+                counters["cancelled"] += 1
+                raise
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return counters
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9101)
+    parser.add_argument("--first-token-ms", type=float, default=200, help="Typical time to first token (±20%%)")
+    parser.add_argument("--tail-prob", type=float, default=0.0, help="Chance a request is slow to start")
+    parser.add_argument("--tail-ms", type=float, default=3000, help="Extra delay for those slow requests")
+    parser.add_argument("--token-ms", type=float, default=20, help="Delay between streamed tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Chance a request fails with 503")
+    parser.add_argument("--reply", default="[happy] Hello there, this is the stub model talking.")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    app = create_app(args.first_token_ms, args.tail_prob, args.tail_ms, args.token_ms,
+                     args.error_rate, args.reply, args.seed)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
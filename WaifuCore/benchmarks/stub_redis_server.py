@@ -0,0 +1,254 @@
+# benchmarks/stub_redis_server.py
+"""
+A small in-memory stand-in for a Redis server (RESP2 and RESP3), covering the commands the
+`redis` session state backend uses, so multi-worker load tests run without a
+real Redis installed. Data lives in this one process and is lost when it exits.
+
+    python benchmarks/stub_redis_server.py --port 6390
+    python benchmarks/loadtest.py --workers 4 --state redis --state-url redis://127.0.0.1:6390/0
+
+Supported: HELLO, PING, ECHO, CLIENT, SELECT, GET, SET (EX/PX/NX/XX/GET), DEL, EXISTS,
+EXPIRE, TTL, INCR, INCRBY, RPUSH, LTRIM, LRANGE, LLEN, FLUSHDB, DBSIZE.
+"""
+import argparse
+import asyncio
+import time
+
+
+class Error(Exception):
+    """Sent back to the client as a RESP error."""
+
+
+class Store:
+    def __init__(self):
+        self.data: dict[bytes, bytes | list[bytes]] = {}
+        self.expires: dict[bytes, float] = {}
+        self.commands = 0
+
+    def _live(self, key: bytes):
+        # Keys expire lazily, when next looked at
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self.data.pop(key, None)
+            del self.expires[key]
+        return self.data.get(key)
+
+    def _string(self, key: bytes) -> bytes | None:
+        value = self._live(key)
+        if isinstance(value, list):
+            raise Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def _list(self, key: bytes) -> list[bytes]:
+        value = self._live(key)
+        if value is None:
+            return []
+        if not isinstance(value, list):
+            raise Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def _expire(self, key: bytes, seconds: float | None):
+        if seconds is None:
+            self.expires.pop(key, None)
+        else:
+            self.expires[key] = time.monotonic() + seconds
+
+    def execute(self, name: str, args: list[bytes]):
+        self.commands += 1
+        handler = getattr(self, f"cmd_{name}", None)
+        if handler is None:
+            raise Error(f"ERR unknown command '{name}'")
+        return handler(*args)
+
+    def cmd_ping(self, message: bytes | None = None):
+        return message if message is not None else "PONG"
+
+    def cmd_echo(self, message: bytes):
+        return message
+
+    def cmd_client(self, *args):
+        return "OK"  # SETNAME / SETINFO from redis-py on connect
+
+    def cmd_select(self, db: bytes):
+        return "OK"  # A single database, whichever number is asked for
+
+    def cmd_get(self, key: bytes):
+        return self._string(key)
+
+    def cmd_set(self, key: bytes, value: bytes, *options: bytes):
+        ttl, mode, get = None, None, False
+        options = [option.upper() for option in options]
+        i = 0
+        while i < len(options):
+            if options[i] in (b"EX", b"PX"):
+                ttl = int(options[i + 1]) / (1 if options[i] == b"EX" else 1000)
+                i += 1
+            elif options[i] in (b"NX", b"XX"):
+                mode = options[i]
+            elif options[i] == b"GET":
+                get = True
+            elif options[i] != b"KEEPTTL":
+                raise Error("ERR syntax error")
+            i += 1
+        previous = self._string(key)
+        if (mode == b"NX" and previous is not None) or (mode == b"XX" and previous is None):
+            return previous if get else None
+        self.data[key] = value
+        if b"KEEPTTL" not in options:
+            self._expire(key, ttl)
+        return previous if get else "OK"
+
+    def cmd_del(self, *keys: bytes):
+        removed = 0
+        for key in keys:
+            if self._live(key) is not None:
+                del self.data[key]
+                self.expires.pop(key, None)
+                removed += 1
+        return removed
+
+    def cmd_exists(self, *keys: bytes):
+        return sum(self._live(key) is not None for key in keys)
+
+    def cmd_expire(self, key: bytes, seconds: bytes):
+        if self._live(key) is None:
+            return 0
+        self._expire(key, int(seconds))
+        return 1
+
+    def cmd_ttl(self, key: bytes):
+        if self._live(key) is None:
+            return -2
+        expires = self.expires.get(key)
+        return -1 if expires is None else max(int(expires - time.monotonic()), 0)
+
+    def cmd_incr(self, key: bytes):
+        return self.cmd_incrby(key, b"1")
+
+    def cmd_incrby(self, key: bytes, amount: bytes):
+        value = self._string(key)
+        try:
+            number = int(value or 0) + int(amount)
+        except ValueError:
+            raise Error("ERR value is not an integer or out of range")
+        self.data[key] = str(number).encode()
+        return number
+
+    def cmd_rpush(self, key: bytes, *values: bytes):
+        items = self._list(key)
+        items.extend(values)
+        self.data[key] = items
+        return len(items)
+
+    @staticmethod
+    def _range(items: list, start: bytes, stop: bytes) -> slice:
+        start, stop = int(start), int(stop)
+        length = len(items)
+        start = max(start + length if start < 0 else start, 0)
+        stop = stop + length if stop < 0 else stop
+        return slice(start, stop + 1)
+
+    def cmd_ltrim(self, key: bytes, start: bytes, stop: bytes):
+        items = self._list(key)
+        if items:
+            kept = items[self._range(items, start, stop)]
+            if kept:
+                self.data[key] = kept
+            else:
+                self.cmd_del(key)
+        return "OK"
+
+    def cmd_lrange(self, key: bytes, start: bytes, stop: bytes):
+        items = self._list(key)
+        return items[self._range(items, start, stop)]
+
+    def cmd_llen(self, key: bytes):
+        return len(self._list(key))
+
+    def cmd_flushdb(self, *args):
+        self.data.clear()
+        self.expires.clear()
+        return "OK"
+
+    def cmd_dbsize(self):
+        return sum(self._live(key) is not None for key in list(self.data))
+
+
+def encode(value, resp3: bool = False) -> bytes:
+    if value is None:
+        return b"_\r\n" if resp3 else b"$-1\r\n"
+    if isinstance(value, Error):
+        return b"-" + str(value).encode() + b"\r\n"
+    if isinstance(value, str):
+        return b"+" + value.encode() + b"\r\n"
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    if isinstance(value, dict):
+        if resp3:
+            return b"%%%d\r\n" % len(value) + b"".join(encode(k, resp3) + encode(v, resp3) for k, v in value.items())
+        value = [item for pair in value.items() for item in pair]
+    return b"*%d\r\n" % len(value) + b"".join(encode(item, resp3) for item in value)
+
+
+async def read_command(reader: asyncio.StreamReader) -> list[bytes] | None:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.split()  # Inline command, e.g. from telnet
+    args = []
+    for _ in range(int(line[1:])):
+        length = int((await reader.readline())[1:])
+        args.append((await reader.readexactly(length + 2))[:-2])
+    return args
+
+
+async def serve(host: str, port: int):
+    store = Store()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        protocol = 2
+        try:
+            while (command := await read_command(reader)) is not None:
+                if not command:
+                    continue
+                name = command[0].decode().lower()
+                try:
+                    if name == "hello":
+                        # Protocol negotiation, per connection (redis-py 5+ asks for RESP3)
+                        requested = int(command[1]) if len(command) > 1 else protocol
+                        if requested not in (2, 3):
+                            raise Error("NOPROTO unsupported protocol version")
+                        protocol = requested
+                        reply = {b"server": b"redis", b"version": b"7.0.0", b"proto": protocol, b"mode": b"standalone"}
+                    else:
+                        reply = store.execute(name, command[1:])
+                except Error as e:
+                    reply = e
+                except (TypeError, ValueError, IndexError):
+                    reply = Error(f"ERR wrong arguments for '{name}' command")
+                writer.write(encode(reply, protocol == 3))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print(f"Stub Redis listening on {host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    asyncio.run(serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
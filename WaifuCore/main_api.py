@@ -1,17 +1,38 @@
 # WaifuCore/main_api.py
 import os
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict, Any
+import sys
+import asyncio
+import base64
+import json
+import importlib.util
+import itertools
+import time
+import uuid
+from contextlib import aclosing
+from pathlib import Path
 
+import uvicorn
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 
 sys.path.append(str(Path(__file__).resolve().parent.parent))
 
-from waifu_core.engine import ConversationEngine
+from waifu_core.engine import ConversationEngine, SERVICE_CONFIG, CANNED_LINES
 from waifu_core.models import LLMProvider
+from waifu_core.protocol import (
+    PROTOCOL_V1, PROTOCOL_V2, SUPPORTED_PROTOCOLS, CLOSE_SESSION_MOVED, FORMAT_NAMES, detect_audio_format, pack_audio_frame,
+)
+from waifu_core.registry import get_registry
+from waifu_core.admission import get_admission
+from waifu_core.executors import current_session, executor_stats
+from waifu_core.metrics import TurnTimer, get_metrics
+from waifu_core.http_pool import get_http_pool
+from waifu_core.services.llm_router import get_llm_router
+from waifu_core.services.session_state import WORKER_ID, get_session_state
+from waifu_core.services.tts.audio_cache import get_tts_cache
+from waifu_core.services.tts.audio_encoding import join_audio, negotiate_format
 
 app = FastAPI(title="WaifuCore API")
 
@@ -26,58 +47,341 @@ app.add_middleware(
 class ConnectionManager:
     def __init__(self):
         self.active_connections: dict[WebSocket, ConversationEngine] = {}
-    async def connect(self, websocket: WebSocket, llm_provider: str, tts_provider: str):
+        # Sessions are told apart by id for round-robin scheduling of their ASR/TTS work
+        self.session_ids = itertools.count(1)
+    async def connect(self, websocket: WebSocket, llm_provider: str, tts_provider: str, user_id: str = "user",
+                      audio_format: str = "wav") -> bool:
+        """Accepts the connection once there is room for it; False if it was turned away."""
         await websocket.accept()
-        engine = ConversationEngine(llm_provider=LLMProvider(llm_provider), tts_provider=tts_provider)
+        admission = get_admission()
+
+        async def report_position(position: int):
+            await websocket.send_json({"type": "queued", "position": position})
+        try:
+            admitted = await admission.admit(report_position)
+        except WebSocketDisconnect:
+            return False
+        if not admitted:
+            # 1013: try again later
+            await websocket.close(code=1013, reason="Server busy, try again later")
+            return False
+        try:
+            # The first session for a provider may still load its model; keep that off the event loop.
+            engine = await asyncio.to_thread(
+                ConversationEngine, llm_provider=LLMProvider(llm_provider), tts_provider=tts_provider, user_id=user_id,
+                audio_format=audio_format,
+            )
+        except BaseException:
+            admission.release()
+            raise
         self.active_connections[websocket] = engine
+        return True
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections: del self.active_connections[websocket]
+        if websocket in self.active_connections:
+            self.active_connections.pop(websocket).close()
+            get_admission().release()
     def get_engine(self, websocket: WebSocket) -> ConversationEngine:
         return self.active_connections[websocket]
 
 manager = ConnectionManager()
 
+def register_gauges():
+    """Gauges read on each /metrics scrape, from the same stats /health reports."""
+    metrics = get_metrics()
+    metrics.gauge("waifu_active_sessions", "Open /ws/chat sessions", lambda: len(manager.active_connections))
+    metrics.gauge("waifu_waiting_sessions", "Connections waiting for a session slot",
+                  lambda: get_admission().stats()["waiting_sessions"])
+    metrics.gauge("waifu_waiting_turns", "Turns waiting for a turn slot", lambda: get_admission().stats()["waiting_turns"])
+    metrics.gauge("waifu_rejected_sessions", "Connections turned away with 1013 since startup",
+                  lambda: get_admission().stats()["rejected"] + get_admission().stats()["timed_out"])
+    metrics.gauge("waifu_executor_queued", "Calls waiting for a stage executor thread",
+                  lambda: {(name,): stats["queued"] for name, stats in executor_stats().items()}, ("stage",))
+    metrics.gauge("waifu_executor_running", "Calls running on a stage executor",
+                  lambda: {(name,): stats["running"] for name, stats in executor_stats().items()}, ("stage",))
+
+    def tts_cache_hit_ratio():
+        cache = get_tts_cache()
+        return cache.stats()["hit_rate"] if cache else None
+    metrics.gauge("waifu_tts_cache_hit_ratio", "Share of TTS lookups answered from the audio cache", tts_cache_hit_ratio)
+
+    def memory_cache_hit_ratio():
+        memory = get_registry().find("memory")
+        return memory.stats()["result_hit_rate"] if memory else None
+    metrics.gauge("waifu_memory_cache_hit_ratio", "Share of memory retrievals answered from the result cache", memory_cache_hit_ratio)
+
+    def pending_extraction_turns():
+        extractor = get_registry().find("memory_extractor")
+        return extractor.stats()["pending_turns"] if extractor else None
+    metrics.gauge("waifu_memory_extraction_pending_turns", "Turns waiting for memory extraction", pending_extraction_turns)
+    metrics.gauge("waifu_http_in_flight", "Requests in flight per provider connection pool",
+                  lambda: {(stats["origin"], stats["client"]): stats["in_flight"] for stats in get_http_pool().stats()},
+                  ("origin", "client"))
+
+register_gauges()
+
+@app.on_event("startup")
+async def warm_up_models():
+    # TCP/TLS handshakes with the API providers happen now rather than on the first turn
+    app.state.prewarm_task = asyncio.create_task(get_http_pool().prewarm())
+    registry_config = SERVICE_CONFIG.get('registry', {})
+    if not registry_config.get('warmup', True):
+        return
+    tts_providers = registry_config.get('warmup_tts_providers') or [SERVICE_CONFIG['tts'].get('provider', 'kokoro')]
+    # Runs in the background so the server accepts connections (and answers /ready) while loading.
+    canned_lines = [(text, emotion) for text, emotion, _ in CANNED_LINES.values()]
+    app.state.warmup_task = asyncio.create_task(get_registry().warm_up(tts_providers, canned_lines))
+
+@app.on_event("shutdown")
+async def flush_memories():
+    # Turns still waiting for memory extraction would otherwise be lost
+    extractor = get_registry().find("memory_extractor")
+    if extractor is not None:
+        await extractor.drain()
+    await get_http_pool().aclose()
+
+async def receive_input(websocket: WebSocket) -> tuple[str | None, str | bytes | None]:
+    """Reads one client message and returns (input type, payload), handling both JSON and binary frames."""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    if message.get("bytes") is not None:
+        # Protocol v2: a binary frame is a raw recorded clip
+        return "audio", message["bytes"]
+    data = json.loads(message["text"])
+    payload = data.get("payload")
+    if data.get("type") in ("audio", "audio_chunk") and isinstance(payload, str):
+        payload = base64.b64decode(payload)
+    return data.get("type"), payload
+
+async def send_event(websocket: WebSocket, event, protocol: int, turn_id: int):
+    # Send the main payload with text, state, etc.
+    if event.text is not None or event.action is not None:
+        response = {"state": event.state.value, "animation": event.animation, "text": event.text, "action": event.action}
+        if event.partial:
+            # Streamed, still-growing reply; the final text arrives with the SPEAKING state
+            response["partial"] = True
+        if protocol >= PROTOCOL_V2:
+            response["turn"] = turn_id
+        await websocket.send_json(response)
+
+    # v2 audio is sent sentence by sentence, each chunk in a separate, numbered frame
+    if event.audio and protocol >= PROTOCOL_V2:
+        if event.seq == 0:
+            # Binary frames can't carry the animation, so announce it once per turn
+            await websocket.send_json({"state": event.state.value, "animation": event.animation, "turn": turn_id})
+        await websocket.send_bytes(pack_audio_frame(turn_id, event.seq or 0, event.audio))
+
+async def send_v1_audio(websocket: WebSocket, chunks: list[bytes], animation: str | None):
+    """
+    v1 clients play each audio message in place of the last one, so they get the
+    whole reply at the end of the turn, joined into one clip where the formats allow.
+    """
+    for seq, audio_bytes in enumerate(join_audio(chunks)):
+        audio_b64 = base64.b64encode(audio_bytes).decode('utf-8')
+        # This message also contains the correct animation for the audio
+        audio_format = FORMAT_NAMES[detect_audio_format(audio_bytes)[0]]
+        await websocket.send_json({"audio": audio_b64, "format": audio_format, "animation": animation, "seq": seq})
+        # This tiny sleep is crucial for preventing network packet merging
+        await asyncio.sleep(0.01)
+
 @app.websocket("/ws/chat")
-async def websocket_endpoint(websocket: WebSocket, llm: str = 'gemini', tts: str = 'coqui'):
-    await manager.connect(websocket, llm_provider=llm, tts_provider=tts)
+async def websocket_endpoint(websocket: WebSocket, llm: str = 'gemini', tts: str = 'coqui', protocol: int = PROTOCOL_V1, user: str = 'user', timings: bool | None = None, audio: str | None = None, session: str | None = None):
+    if protocol not in SUPPORTED_PROTOCOLS:
+        protocol = PROTOCOL_V1
+    if timings is None:
+        timings = SERVICE_CONFIG.get('metrics', {}).get('turn_timings', False)
+    # `audio` lists the formats the client can play, most preferred first (e.g. "opus,mp3,wav").
+    # v1 gets a reply's audio joined into one clip, which chained Ogg streams don't allow.
+    audio_format = negotiate_format(audio, SERVICE_CONFIG['tts'].get('output', {}),
+                                    exclude=() if protocol >= PROTOCOL_V2 else ("opus",))
+    # A reconnect passes back the session key from its hello and carries on where it left off,
+    # whichever worker it lands on
+    state = get_session_state()
+    stored = await asyncio.to_thread(state.load_session, session) if session else None
+    if stored is not None:
+        user = stored.get("user", user)
+    else:
+        session = uuid.uuid4().hex
+    # `user` keys the conversation history and memories, so each person gets their own
+    if not await manager.connect(websocket, llm_provider=llm, tts_provider=tts, user_id=user, audio_format=audio_format):
+        return
+    # Everything this session submits to the stage executors is scheduled under its id
+    session_id = next(manager.session_ids)
+    current_session.set(session_id)
+    admission = get_admission()
+    turn_id = stored.get("turn", 0) if stored else 0
+    # Owner of the session in the shared state: this connection on this worker
+    owner = f"{WORKER_ID}#{session_id}"
+
+    def session_data() -> dict:
+        return {"user": user, "llm": llm, "tts": tts, "turn": turn_id, "worker": WORKER_ID, "updated": time.time()}
+
+    # Chunks of the microphone stream the client has open (audio_start ... audio_stop), fed to
+    # the stream by a listener task so the socket keeps being read (a cancel, say) while the
+    # last region of an utterance is transcribed. Streams that were stopped still finish up.
+    stream_inputs: asyncio.Queue | None = None
+    listeners: set[asyncio.Task] = set()
+    # The reply in progress; the socket keeps being read so a new input can interrupt it
+    turn_task: asyncio.Task | None = None
+    # Held while a turn replaces the previous one, which the receive loop and listeners both do
+    turn_lock = asyncio.Lock()
+
+    async def play_turn(engine: ConversationEngine, turn_id: int, audio_input, text_input, timer: TurnTimer):
+        try:
+            # Waiting for a turn slot counts towards the turn's latency
+            with timer.span("turn_queue"):
+                await admission.acquire_turn(session_id)
+            try:
+                v1_audio, v1_animation = [], None
+                async with aclosing(engine.run_turn(audio_input=audio_input, text_input=text_input, timer=timer)) as events:
+                    async for event in events:
+                        if event.audio and protocol < PROTOCOL_V2:
+                            v1_audio.append(event.audio)
+                            v1_animation = event.animation
+                        with timer.span("ws_send"):
+                            await send_event(websocket, event, protocol, turn_id)
+                if v1_audio:
+                    with timer.span("ws_send"):
+                        await send_v1_audio(websocket, v1_audio, v1_animation)
+            finally:
+                admission.release_turn()
+            if timings:
+                # Milliseconds per stage, after the turn's last message
+                await websocket.send_json({"type": "timings", "turn": turn_id, "timings": timer.as_dict()})
+        except WebSocketDisconnect:
+            pass  # The receive loop sees the disconnect as well
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            # Ends the session, as an error in the receive loop does
+            await websocket.close(code=1011, reason=f"Internal Server Error: {e}")
+
+    async def cancel_turn() -> bool:
+        """Stops the reply in progress (LLM stream, TTS, queued sends); True if there was one."""
+        nonlocal turn_task
+        task, turn_task = turn_task, None
+        if task is None or task.done():
+            return False
+        task.cancel()
+        # Returns once the turn has released its executor slots and connections
+        await asyncio.wait([task])
+        return True
+
+    async def start_turn(engine: ConversationEngine, audio_input, text_input, timer: TurnTimer) -> bool:
+        """Starts replying to a new input; False if this connection no longer holds the session."""
+        nonlocal turn_id, turn_task
+        async with turn_lock:
+            # Barge-in: a new input replaces the reply still being generated or spoken
+            if await cancel_turn():
+                await websocket.send_json({"type": "cancelled", "turn": turn_id})
+            turn_id += 1
+            if not await asyncio.to_thread(state.touch_session, session, owner, session_data()):
+                # The client has reconnected since; this connection is a leftover
+                await websocket.close(code=CLOSE_SESSION_MOVED, reason="Session resumed on another connection")
+                return False
+            turn_task = asyncio.create_task(play_turn(engine, turn_id, audio_input, text_input, timer))
+            return True
+
+    async def listen(stream, inputs: asyncio.Queue, engine: ConversationEngine):
+        """Feeds one microphone stream in order; each utterance it finishes starts a turn."""
+        try:
+            while (item := await inputs.get()) is not None:
+                input_type, payload = item
+                # The server decides where the utterance ends; audio_end forces it (push-to-talk release)
+                updates = await (stream.finish() if input_type == "audio_end" else stream.feed(payload))
+                text_input = None
+                for kind, text in updates:
+                    await websocket.send_json({"type": "transcript", "text": text, "final": kind == "final"})
+                    if kind == "final":
+                        text_input = text
+                if not text_input:
+                    continue
+                # The turn counts from the end of speech; the wait for the last region is its ASR time
+                timer = TurnTimer(started=stream.ended_at)
+                timer.record("asr", stream.final_wait_seconds)
+                if not await start_turn(engine, None, text_input, timer):
+                    return
+        except WebSocketDisconnect:
+            pass  # The receive loop sees the disconnect as well
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            await websocket.close(code=1011, reason=f"Internal Server Error: {e}")
+        finally:
+            stream.close()
+
+    def stop_stream():
+        """Ends the open microphone stream once what was sent of it has been processed."""
+        nonlocal stream_inputs
+        if stream_inputs is not None:
+            stream_inputs.put_nowait(None)
+            stream_inputs = None
+
     try:
+        previous_owner = await asyncio.to_thread(state.claim_session, session, owner, session_data())
+        if previous_owner and previous_owner.split("#")[0] != WORKER_ID:
+            print(f"🔀 Session {session[:8]} moved from worker {previous_owner.split('#')[0]} to {WORKER_ID}")
+        session_info = {"session": session, "worker": WORKER_ID, "resumed": stored is not None}
+        if protocol >= PROTOCOL_V2:
+            await websocket.send_json({"type": "hello", "protocol": protocol, "audio_format": audio_format, **session_info})
+        else:
+            await websocket.send_json({"type": "session", **session_info})
         while True:
-            data = await websocket.receive_json()
+            input_type, payload = await receive_input(websocket)
             engine = manager.get_engine(websocket)
-            input_type = data.get("type")
-            payload = data.get("payload")
             text_input = None
-            audio_filepath = None
-            if input_type == "text": text_input = payload
-            elif input_type == "audio":
-                audio_bytes = base64.b64decode(payload)
-                temp_dir = Path("temp_audio"); temp_dir.mkdir(exist_ok=True)
-                temp_audio_path = temp_dir / "user_audio.wav"
-                with open(temp_audio_path, "wb") as f: f.write(audio_bytes)
-                audio_filepath = str(temp_audio_path)
-            
-            async for state, text, audio_bytes, animation, action in engine.run_turn(audio_filepath=audio_filepath, text_input=text_input):
-                # Send the main payload with text, state, etc.
-                response = {"state": state.value, "animation": animation, "text": text, "action": action}
-                if text is not None or action is not None:
-                    await websocket.send_json(response)
-
-                # If audio is ready, send it in a separate, dedicated message
-                if audio_bytes:
-                    audio_b64 = base64.b64encode(audio_bytes).decode('utf-8')
-                    # This message also contains the correct animation for the audio
-                    await websocket.send_json({"audio": audio_b64, "animation": animation})
-                    # This tiny sleep is crucial for preventing network packet merging
-                    await asyncio.sleep(0.01)
+            audio_input = None
+            timer = TurnTimer()
+            if input_type == "cancel":
+                if await cancel_turn():
+                    await websocket.send_json({"type": "cancelled", "turn": turn_id})
+                continue
+            elif input_type == "audio_start":
+                stop_stream()
+                options = payload or {}
+                stream = await engine.open_audio_stream(options.get("format", "pcm16"), options.get("sample_rate"))
+                stream_inputs = asyncio.Queue()
+                listener = asyncio.create_task(listen(stream, stream_inputs, engine))
+                listeners.add(listener)
+                listener.add_done_callback(listeners.discard)
+                continue
+            elif input_type == "audio_stop":
+                stop_stream()
+                continue
+            elif input_type in ("audio_chunk", "audio_end") or (input_type == "audio" and stream_inputs is not None):
+                # Without an open stream there is nothing to add them to, so they are dropped
+                if stream_inputs is not None:
+                    stream_inputs.put_nowait((input_type, payload))
+                continue
+            elif input_type == "text": text_input = payload
+            # The clip is decoded in memory by the ASR service; nothing is written to disk
+            elif input_type == "audio": audio_input = payload
+            else:
+                continue  # Unknown message types (keep-alive pings, newer clients) are ignored
+            if not (text_input or audio_input):
+                # An empty message isn't worth interrupting the reply for
+                continue
+
+            if not await start_turn(engine, audio_input, text_input, timer):
+                break
 
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
         print(f"Client disconnected: {websocket.client.host}")
     except Exception as e:
-        manager.disconnect(websocket)
         import traceback
         traceback.print_exc()
         await websocket.close(code=1011, reason=f"Internal Server Error: {e}")
+    finally:
+        for listener in list(listeners):
+            listener.cancel()
+        if listeners:
+            await asyncio.wait(list(listeners))
+        await cancel_turn()
+        manager.disconnect(websocket)
+        try:
+            await asyncio.to_thread(state.release_session, session, owner)
+        except Exception as e:
+            print(f"Could not release session {session[:8]}: {e}")
 
 def get_available_llm_providers():
     """Get available LLM providers with user-friendly names"""
@@ -102,14 +406,11 @@ def get_available_tts_providers():
     # Check if Coqui TTS is available
     providers.append("coqui")
     
-    # Check if ElevenLabs is available
-    try:
-        import elevenlabs
-        from waifu_core.services.tts.elevenlabs_tts import ElevenLabsTTSService
+    # Check if ElevenLabs is available (without importing it)
+    if importlib.util.find_spec("elevenlabs") is not None:
         providers.append("elevenlabs")
-    except ImportError:
+    else:
         print("ElevenLabs TTS provider is not available")
-        pass
     
     return providers
 
@@ -124,6 +425,8 @@ async def root():
             "/": "This welcome page",
             "/docs": "API documentation (Swagger UI)",
             "/health": "Health check endpoint",
+            "/ready": "Readiness check listing the loaded models and any that failed to warm up",
+            "/metrics": "Prometheus metrics: stage latency histograms and load gauges",
             "/api/settings": "Available LLM and TTS providers",
             "/ws/chat": "WebSocket endpoint for real-time chat"
         },
@@ -140,7 +443,31 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "service": "waifucore-api"}
+    tts_cache = get_tts_cache()
+    extractor = get_registry().find("memory_extractor")
+    memory = get_registry().find("memory")
+    return {
+        "status": "healthy",
+        "service": "waifucore-api",
+        "state": get_session_state().describe(),
+        "admission": get_admission().stats(),
+        "executors": executor_stats(),
+        "tts_cache": tts_cache.stats() if tts_cache else None,
+        "memory_extraction": extractor.stats() if extractor else None,
+        "memory_cache": memory.stats() if memory else None,
+        "http_pools": get_http_pool().stats(),
+        "llm_routing": get_llm_router().stats(),
+    }
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(get_metrics().render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ready")
+async def readiness_check():
+    status = get_registry().status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
 
 @app.get("/api/settings")
 async def get_settings():
@@ -159,5 +486,14 @@ except RuntimeError:
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
-    print(f"--- Starting WaifuCore Headless API on port {port} ---")
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    workers = int(os.environ.get("WEB_CONCURRENCY", SERVICE_CONFIG.get('server', {}).get('workers', 1)))
+    print(f"--- Starting WaifuCore Headless API on port {port} ({workers} worker{'s' if workers > 1 else ''}) ---")
+    if workers > 1:
+        if not get_session_state().shared:
+            print("⚠️ Several workers with the 'file' state backend don't share sessions or histories; use sqlite or redis.")
+        if not SERVICE_CONFIG.get('memory', {}).get('chroma_url'):
+            print("⚠️ Several workers should share a Chroma server (memory.chroma_url) rather than one local db_path.")
+        # Each worker process imports the app itself
+        uvicorn.run("main_api:app", host="0.0.0.0", port=port, workers=workers, app_dir=str(Path(__file__).resolve().parent))
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
@@ -0,0 +1,83 @@
+# tests/conftest.py
+import json
+import socket
+import sys
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+import pytest
+import uvicorn
+from openai import AsyncOpenAI
+
+# The tests import waifu_core and main_api the way the server does, from the WaifuCore directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.stub_llm_server import create_app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ServerThread:
+    """An ASGI app served by uvicorn from a background thread."""
+
+    def __init__(self, app):
+        self.port = free_port()
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started:
+            assert self.thread.is_alive() and time.monotonic() < deadline, "server did not start"
+            time.sleep(0.01)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(5)
+
+
+class StubServer(ServerThread):
+    """benchmarks/stub_llm_server.py served from a background thread."""
+
+    def __init__(self, reply: str, first_token_ms: float = 20, token_ms: float = 5, error_rate: float = 0.0):
+        super().__init__(create_app(first_token_ms, 0.0, 0.0, token_ms, error_rate, reply, seed=0))
+
+    def stats(self) -> dict:
+        with urllib.request.urlopen(f"http://127.0.0.1:{self.port}/stats") as response:
+            return json.load(response)
+
+    def attempt(self, key: str):
+        def start():
+            async def deltas():
+                client = AsyncOpenAI(api_key="stub", base_url=f"http://127.0.0.1:{self.port}/v1", max_retries=0)
+                stream = await client.chat.completions.create(
+                    model="stub", messages=[{"role": "user", "content": "Hi"}], stream=True
+                )
+                try:
+                    async for chunk in stream:
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            yield delta
+                finally:
+                    await stream.close()
+                    await client.close()
+            return deltas()
+        return (key, start)
+
+
+@pytest.fixture
+def stub_llm():
+    servers = []
+
+    def start(**options) -> StubServer:
+        servers.append(StubServer(**options))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.stop()
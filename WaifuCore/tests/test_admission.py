@@ -0,0 +1,181 @@
+# tests/test_admission.py
+import asyncio
+
+from waifu_core.admission import AdmissionController
+from waifu_core.executors import FairScheduler
+
+
+def controller(**config) -> AdmissionController:
+    return AdmissionController({'max_sessions': 1, 'max_waiting': 2, 'max_wait_seconds': 5, **config})
+
+
+def test_unlimited_admits_everyone():
+    async def scenario():
+        admission = AdmissionController({})
+        assert all([await admission.admit() for _ in range(10)])
+        return admission.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["active_sessions"] == 10 and stats["admitted"] == 10
+
+
+def test_waiting_connections_are_told_their_position_and_admitted_in_order():
+    async def scenario():
+        admission = controller()
+        assert await admission.admit()
+        positions = {"b": [], "c": []}
+
+        def report(name):
+            async def on_position(position):
+                positions[name].append(position)
+            return on_position
+
+        b = asyncio.create_task(admission.admit(report("b")))
+        await asyncio.sleep(0)
+        c = asyncio.create_task(admission.admit(report("c")))
+        await asyncio.sleep(0.01)
+        waiting = admission.stats()["waiting_sessions"]
+
+        admission.release()
+        assert await b
+        await asyncio.sleep(0.01)
+        assert not c.done()
+        admission.release()
+        assert await c
+        return positions, waiting, admission.stats()
+
+    positions, waiting, stats = asyncio.run(scenario())
+    assert waiting == 2
+    assert positions == {"b": [1], "c": [2, 1]}
+    assert stats["active_sessions"] == 1 and stats["admitted"] == 3 and stats["waiting_sessions"] == 0
+
+
+def test_full_line_is_turned_away():
+    async def scenario():
+        admission = controller(max_waiting=1)
+        assert await admission.admit()
+        waiting = asyncio.create_task(admission.admit())
+        await asyncio.sleep(0)
+        turned_away = await admission.admit()
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        return turned_away, admission.stats()
+
+    turned_away, stats = asyncio.run(scenario())
+    assert turned_away is False
+    assert stats["rejected"] == 1 and stats["waiting_sessions"] == 0 and stats["active_sessions"] == 1
+
+
+def test_no_line_when_max_waiting_is_zero():
+    async def scenario():
+        admission = controller(max_waiting=0)
+        return await admission.admit(), await admission.admit(), admission.stats()
+
+    first, second, stats = asyncio.run(scenario())
+    assert first is True and second is False and stats["rejected"] == 1
+
+
+def test_waiting_too_long_times_out_and_leaves_the_line():
+    async def scenario():
+        admission = controller(max_wait_seconds=0.05)
+        assert await admission.admit()
+        admitted = await admission.admit()
+        return admitted, admission.stats()
+
+    admitted, stats = asyncio.run(scenario())
+    assert admitted is False
+    assert stats["timed_out"] == 1 and stats["waiting_sessions"] == 0 and stats["active_sessions"] == 1
+
+
+def test_disconnect_while_waiting_moves_the_line_up():
+    async def scenario():
+        admission = controller()
+        assert await admission.admit()
+        positions = []
+
+        async def on_position(position):
+            positions.append(position)
+
+        b = asyncio.create_task(admission.admit())
+        await asyncio.sleep(0)
+        c = asyncio.create_task(admission.admit(on_position))
+        await asyncio.sleep(0.01)
+        b.cancel()
+        await asyncio.gather(b, return_exceptions=True)
+        await asyncio.sleep(0.01)
+        admission.release()
+        return await c, positions, admission.stats()
+
+    admitted, positions, stats = asyncio.run(scenario())
+    assert admitted is True and positions == [2, 1]
+    assert stats["active_sessions"] == 1 and stats["waiting_sessions"] == 0
+
+
+def test_release_with_nobody_waiting_frees_the_slot():
+    async def scenario():
+        admission = controller(max_waiting=0)
+        assert await admission.admit()
+        admission.release()
+        return await admission.admit(), admission.stats()
+
+    admitted, stats = asyncio.run(scenario())
+    assert admitted is True and stats["active_sessions"] == 1
+
+
+def test_turn_slots_are_limited():
+    async def scenario():
+        admission = controller(max_turns=1)
+        await admission.acquire_turn(1)
+        second = asyncio.create_task(admission.acquire_turn(2))
+        await asyncio.sleep(0)
+        busy = admission.stats()
+        admission.release_turn()
+        await second
+        return busy, admission.stats()
+
+    busy, after = asyncio.run(scenario())
+    assert busy["active_turns"] == 1 and busy["waiting_turns"] == 1
+    assert after["active_turns"] == 1 and after["waiting_turns"] == 0
+
+
+def test_fair_scheduler_serves_sessions_round_robin():
+    async def scenario():
+        scheduler = FairScheduler(1)
+        order = []
+
+        async def job(session, name):
+            async with scheduler.slot(session):
+                order.append(name)
+                await asyncio.sleep(0)
+
+        await scheduler.acquire()  # Hold the only slot while the line forms
+        jobs = [asyncio.create_task(job(session, f"{session}{i}"))
+                for session, count in (("A", 3), ("B", 1), ("C", 2)) for i in range(count)]
+        await asyncio.sleep(0)
+        waiting = scheduler.waiting
+        scheduler.release()
+        await asyncio.gather(*jobs)
+        return order, waiting, scheduler
+
+    order, waiting, scheduler = asyncio.run(scenario())
+    assert waiting == 6
+    # One call per session in turn, rather than all of A's calls first
+    assert order == ["A0", "B0", "C0", "A1", "C1", "A2"]
+    assert scheduler.in_use == 0 and scheduler.waiting == 0
+
+
+def test_fair_scheduler_cancelled_waiter_gives_up_its_place():
+    async def scenario():
+        scheduler = FairScheduler(1)
+        await scheduler.acquire("A")
+        b = asyncio.create_task(scheduler.acquire("B"))
+        c = asyncio.create_task(scheduler.acquire("C"))
+        await asyncio.sleep(0)
+        b.cancel()
+        await asyncio.gather(b, return_exceptions=True)
+        scheduler.release()
+        await c
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler.in_use == 1 and scheduler.waiting == 0
@@ -0,0 +1,98 @@
+# tests/test_asr_scheduler.py
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from waifu_core.services import asr_scheduler
+from waifu_core.services.asr_scheduler import ASRBatchScheduler
+from waifu_core.services.asr_service import ASRService, SAMPLE_RATE
+
+# Each fake utterance is a constant signal; its level stands for the language spoken
+LANGUAGES = {1: "en", 2: "de"}
+
+
+def language_of(samples: np.ndarray) -> str:
+    return LANGUAGES[round(float(samples[0]) * 10)]
+
+
+def utterance(level: int, seconds: float = 1.0) -> np.ndarray:
+    return np.full(int(seconds * SAMPLE_RATE), level / 10, dtype=np.float32)
+
+
+class FakeWhisper:
+    """Transcribes a clip as "<language it was decoded in>/<language actually spoken>"."""
+
+    def __init__(self):
+        self.detections = 0
+
+    def detect_language(self, samples):
+        self.detections += 1
+        return language_of(samples), 1.0, []
+
+    def transcribe(self, samples, language=None, **kwargs):
+        return [SimpleNamespace(start=0.0, text=f"{language}/{language_of(samples)}")], None
+
+
+class FakeBatchedPipeline:
+    """
+    Cuts the audio into rows the way faster-whisper does: clip_timestamps in seconds are
+    turned into sample indices (1.2) or taken as sample indices (1.1), then consecutive
+    clips are merged into rows of up to 30 seconds (1.2.0). One segment per row.
+    """
+
+    def __init__(self, model):
+        self.calls = []
+
+    def transcribe(self, audio, language=None, clip_timestamps=(), **kwargs):
+        if asr_scheduler.CLIPS_IN_SECONDS:
+            clip_timestamps = [{k: int(v * SAMPLE_RATE) for k, v in clip.items()} for clip in clip_timestamps]
+        rows = []
+        for clip in clip_timestamps:
+            samples = audio[clip["start"]:clip["end"]]  # A float index is a TypeError here
+            if rows and rows[-1][1] + len(samples) <= 30 * SAMPLE_RATE:
+                rows[-1][1] += len(samples)
+            else:
+                rows.append([clip["start"], len(samples), samples])
+        self.calls.append((language, len(rows)))
+        segments = [SimpleNamespace(start=start / SAMPLE_RATE, text=f"{language}/{language_of(samples)}")
+                    for start, _, samples in rows]
+        return segments, None
+
+
+@pytest.fixture(params=[True, False], ids=["clips-in-seconds", "clips-in-samples"])
+def clip_units(request, monkeypatch):
+    """Both faster-whisper conventions for clip_timestamps."""
+    monkeypatch.setattr(asr_scheduler, "CLIPS_IN_SECONDS", request.param)
+
+
+def make_scheduler(monkeypatch, config: dict) -> ASRBatchScheduler:
+    monkeypatch.setattr(asr_scheduler, "BatchedInferencePipeline", FakeBatchedPipeline)
+    # The real service around a fake model, without loading Whisper
+    service = ASRService.__new__(ASRService)
+    service.model = FakeWhisper()
+    service.config = config
+    return ASRBatchScheduler(service, max_batch_size=8)
+
+
+def test_batch_is_split_by_language(monkeypatch, clip_units):
+    scheduler = make_scheduler(monkeypatch, {})
+    texts = scheduler.process_batch([utterance(1), utterance(2), utterance(1), utterance(2, 2.0)])
+    # Every clip is decoded in the language it was spoken in
+    assert texts == ["en/en", "de/de", "en/en", "de/de"]
+    assert sorted(scheduler.pipeline.calls) == [("de", 2), ("en", 2)]
+
+
+def test_lone_language_is_transcribed_on_its_own(monkeypatch, clip_units):
+    scheduler = make_scheduler(monkeypatch, {})
+    texts = scheduler.process_batch([utterance(1), utterance(2), utterance(1)])
+    assert texts == ["en/en", "de/de", "en/en"]
+    assert scheduler.pipeline.calls == [("en", 2)]
+
+
+def test_configured_language_batches_everything(monkeypatch, clip_units):
+    scheduler = make_scheduler(monkeypatch, {"language": "en"})
+    texts = scheduler.process_batch([utterance(1), utterance(2)])
+    assert texts == ["en/en", "en/de"]
+    assert scheduler.pipeline.calls == [("en", 2)]
+    assert scheduler.asr_service.model.detections == 0
@@ -0,0 +1,53 @@
+# tests/test_audio_cache.py
+import asyncio
+import os
+
+from waifu_core.services.tts.audio_cache import TTSAudioCache
+
+
+def put_all(cache: TTSAudioCache, entries: dict[str, bytes]):
+    async def run():
+        for key, audio in entries.items():
+            await cache.put(key, audio)
+    asyncio.run(run())
+
+
+def test_memory_lru_stays_within_budget():
+    cache = TTSAudioCache(max_memory_bytes=250)
+    put_all(cache, {"a": b"1" * 100, "b": b"2" * 100, "c": b"3" * 100})
+    assert cache.memory_bytes == 200
+    assert asyncio.run(cache.get("a")) is None
+    assert asyncio.run(cache.get("c")) == b"3" * 100
+
+
+def test_disk_store_evicts_least_recently_used(tmp_path):
+    cache = TTSAudioCache(max_memory_bytes=0, disk_dir=str(tmp_path), max_disk_bytes=250)
+    put_all(cache, {"aa1": b"1" * 100, "bb2": b"2" * 100})
+    # Reading aa1 makes bb2 the least recently used
+    assert asyncio.run(cache.get("aa1")) == b"1" * 100
+    put_all(cache, {"cc3": b"3" * 100})
+    assert asyncio.run(cache.get("bb2")) is None
+    assert asyncio.run(cache.get("aa1")) == b"1" * 100
+    assert cache.disk_bytes == 200
+    assert cache.disk_evictions == 1
+    assert sorted(path.name for path in tmp_path.glob("*/*.audio")) == ["aa1.audio", "cc3.audio"]
+
+
+def test_disk_budget_picks_up_existing_files_after_restart(tmp_path):
+    first = TTSAudioCache(max_memory_bytes=0, disk_dir=str(tmp_path), max_disk_bytes=1000)
+    put_all(first, {"old": b"1" * 100, "new": b"2" * 100})
+    os.utime(first._disk_path("old"), (1, 1))
+
+    restarted = TTSAudioCache(max_memory_bytes=0, disk_dir=str(tmp_path), max_disk_bytes=250)
+    put_all(restarted, {"more": b"3" * 100})
+    assert restarted.disk_bytes == 200
+    assert not restarted._disk_path("old").exists()
+    assert restarted._disk_path("new").exists()
+
+
+def test_unreadable_disk_entry_is_a_miss(tmp_path):
+    cache = TTSAudioCache(max_memory_bytes=0, disk_dir=str(tmp_path), max_disk_bytes=1000)
+    # A directory where the entry's file should be: reading it raises IsADirectoryError
+    cache._disk_path("bad").mkdir(parents=True)
+    assert asyncio.run(cache.get("bad")) is None
+    assert cache.misses == 1
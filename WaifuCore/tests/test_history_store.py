@@ -0,0 +1,97 @@
+# tests/test_history_store.py
+import json
+from pathlib import Path
+
+from waifu_core.config import BASE_DIR, resolve_path
+from waifu_core.services import history_store
+from waifu_core.services.history_store import HistoryStore
+
+
+def test_load_tail_returns_the_last_turns_oldest_first(tmp_path, monkeypatch):
+    # Small blocks, so the backwards scan has to cross several of them
+    monkeypatch.setattr(history_store, "TAIL_BLOCK_SIZE", 64)
+    store = HistoryStore(str(tmp_path))
+    for i in range(50):
+        store.append_turn("alice", f"question {i}", f"answer {i}")
+    tail = store.load_tail("alice", 3)
+    assert [turn["user"] for turn in tail] == ["question 47", "question 48", "question 49"]
+    assert tail[-1]["assistant"] == "answer 49"
+    assert len(store.load_tail("alice", 500)) == 50
+    assert store.load_tail("alice", 0) == []
+    assert store.load_tail("bob", 5) == []
+
+
+def test_load_tail_skips_a_torn_last_line(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    store.append_turn("alice", "hello", "hi")
+    with open(store._path("alice"), "a", encoding="utf-8") as f:
+        f.write('{"ts": 1.0, "user": "cut sh')
+    assert [turn["user"] for turn in store.load_tail("alice", 5)] == ["hello"]
+
+
+def test_keys_are_kept_apart_and_sanitized(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    store.append_turn("../evil", "a", "b")
+    assert store._path("../evil").parent == tmp_path
+    assert store.load_tail("evil", 5) == []
+
+
+def test_file_past_compact_bytes_keeps_its_last_turns(tmp_path):
+    store = HistoryStore(str(tmp_path), compact_bytes=2000, keep_turns=5)
+    for i in range(100):
+        store.append_turn("alice", f"question {i}", "x" * 20)
+        assert store._path("alice").stat().st_size <= 2000 + 100
+    lines = store._path("alice").read_text(encoding="utf-8").splitlines()
+    assert all(json.loads(line) for line in lines)
+    assert json.loads(lines[-1])["user"] == "question 99"
+    # Right after a compaction only keep_turns remain; appends grow it back to the limit
+    assert 5 <= len(lines) < 100
+    assert [turn["user"] for turn in store.load_tail("alice", 2)] == ["question 98", "question 99"]
+
+
+def test_summary_round_trip(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    assert store.load_summary("alice") == (None, 0.0)
+    store.save_summary("alice", "They like tea.", 12.5)
+    assert store.load_summary("alice") == ("They like tea.", 12.5)
+
+
+def test_relative_config_paths_resolve_against_the_package(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert resolve_path("waifu_core/history") == BASE_DIR / "waifu_core" / "history"
+    assert resolve_path("/var/lib/waifu") == Path("/var/lib/waifu")
+
+
+def write_legacy(path: Path, turns: int) -> Path:
+    messages = [{"role": "system", "content": "You are Ananya."}]
+    for i in range(turns):
+        messages += [{"role": "user", "content": f"question {i}"}, {"role": "assistant", "content": f"answer {i}"}]
+    path.write_text(json.dumps(messages), encoding="utf-8")
+    return path
+
+
+def test_legacy_import_gives_turns_ordered_timestamps(tmp_path):
+    legacy = write_legacy(tmp_path / "conversation_history.json", 4)
+    store = HistoryStore(str(tmp_path / "history"))
+    store.import_legacy("user", legacy)
+    turns = store.load_tail("user", 10)
+    assert [turn["user"] for turn in turns] == [f"question {i}" for i in range(4)]
+    timestamps = [turn["ts"] for turn in turns]
+    assert 0 < timestamps[0] and timestamps == sorted(set(timestamps))
+    assert timestamps[-1] <= legacy.stat().st_mtime
+    # Turns said after the import come later
+    assert store.append_turn("user", "new", "turn")["ts"] > timestamps[-1]
+
+
+def test_different_keys_never_share_a_file(tmp_path):
+    store = HistoryStore(str(tmp_path / "history"))
+    keys = ["a/b", "a b", "a_b", "a%2Fb", "a.b", "a", "a.summary", "../escape", "user"]
+    for key in keys:
+        store.append_turn(key, f"from {key}", "ok")
+        store.save_summary(key, f"summary of {key}", 1.0)
+    for key in keys:
+        assert [turn["user"] for turn in store.load_tail(key, 5)] == [f"from {key}"]
+        assert store.load_summary(key) == (f"summary of {key}", 1.0)
+    # Everything stays inside the store's directory, and simple keys keep readable names
+    assert not (tmp_path / "escape.jsonl").exists()
+    assert store._path("user").name == "user.jsonl"
@@ -0,0 +1,89 @@
+# tests/test_llm_router.py
+import asyncio
+import time
+
+import pytest
+
+from waifu_core.services.llm_router import LLMRouter
+
+ROUTING = {"hedge_after_ms": 100, "max_attempts": 2}
+
+
+def collect(router: LLMRouter, attempts) -> tuple[list[str], float]:
+    async def run():
+        started = time.perf_counter()
+        deltas = [delta async for delta in router.stream(attempts)]
+        return deltas, time.perf_counter() - started
+    return asyncio.run(run())
+
+
+def wait_for(condition, timeout: float = 3.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_hedge_wins_over_a_slow_primary_and_the_loser_is_cancelled(stub_llm):
+    primary = stub_llm(reply="from the primary", first_token_ms=3000)
+    secondary = stub_llm(reply="from the secondary", first_token_ms=20)
+    router = LLMRouter(ROUTING)
+
+    deltas, elapsed = collect(router, [primary.attempt("primary"), secondary.attempt("secondary")])
+    assert "".join(deltas) == "from the secondary"
+    assert elapsed < 2.0
+    stats = router.stats()
+    assert stats["secondary"]["hedges"] == 1 and stats["secondary"]["hedge_wins"] == 1
+    assert stats["primary"]["cancelled"] == 1 and stats["primary"]["wins"] == 0
+    # The primary's request was really dropped, not left running
+    assert wait_for(lambda: primary.stats()["cancelled"] == 1)
+
+
+def test_failing_primary_falls_back_to_the_next_provider(stub_llm):
+    primary = stub_llm(reply="from the primary", error_rate=1.0)
+    secondary = stub_llm(reply="from the secondary")
+    router = LLMRouter(ROUTING)
+
+    deltas, _ = collect(router, [primary.attempt("primary"), secondary.attempt("secondary")])
+    assert "".join(deltas) == "from the secondary"
+    stats = router.stats()
+    assert stats["primary"]["errors"] == 1 and stats["primary"]["wins"] == 0
+    assert stats["secondary"]["wins"] == 1 and stats["secondary"]["hedges"] == 0
+    assert primary.stats()["errors"] == 1
+
+
+def test_no_hedge_once_the_first_token_has_arrived(stub_llm):
+    # Tokens after the first come slower than hedge_after_ms
+    primary = stub_llm(reply="one two three four", first_token_ms=20, token_ms=150)
+    secondary = stub_llm(reply="from the secondary")
+    router = LLMRouter(ROUTING)
+
+    deltas, _ = collect(router, [primary.attempt("primary"), secondary.attempt("secondary")])
+    assert deltas == ["one", " two", " three", " four"]
+    assert secondary.stats()["requests"] == 0
+
+
+def test_failure_after_the_first_chunk_is_not_retried_elsewhere():
+    started = []
+
+    def attempt(key: str, fail_after_first: bool):
+        async def deltas():
+            started.append(key)
+            yield f"{key} says hi"
+            if fail_after_first:
+                raise ConnectionError("dropped mid-reply")
+            yield " and bye"
+        return (key, deltas)
+
+    async def run():
+        received = []
+        with pytest.raises(ConnectionError):
+            async for delta in LLMRouter(ROUTING).stream([attempt("primary", True), attempt("secondary", False)]):
+                received.append(delta)
+        return received
+
+    # What was already streamed stays the only copy; the reply isn't restarted on another provider
+    assert asyncio.run(run()) == ["primary says hi"]
+    assert started == ["primary"]
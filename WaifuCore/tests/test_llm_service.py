@@ -0,0 +1,115 @@
+# tests/test_llm_service.py
+import asyncio
+import json
+import threading
+
+from waifu_core.services.history_store import HistoryStore
+from waifu_core.services.llm_service import LLMService
+
+
+def bare_service(history_store) -> LLMService:
+    """An LLMService with its history bookkeeping but no provider client."""
+    service = LLMService.__new__(LLMService)
+    service.history_store = history_store
+    service.history_key = "user"
+    service.history_turns = 2
+    service.context_config = {"summary_min_turns": 1000}  # Never start a summary task here
+    service.turns = []
+    service._window_start = 0
+    service.summary, service.summary_through = history_store.load_summary("user")
+    service._summary_backlog = []
+    service._summary_queued_through = service.summary_through
+    service._summary_task = None
+    return service
+
+
+def test_every_migrated_turn_reaches_the_summary(tmp_path):
+    messages = []
+    for i in range(5):
+        messages += [{"role": "user", "content": f"q{i}"}, {"role": "assistant", "content": f"a{i}"}]
+    legacy = tmp_path / "conversation_history.json"
+    legacy.write_text(json.dumps(messages), encoding="utf-8")
+    store = HistoryStore(str(tmp_path / "history"))
+    store.import_legacy("user", legacy)
+
+    service = bare_service(store)
+    service._queue_for_summary(store.load_tail("user", 10))
+    assert [turn["user"] for turn in service._summary_backlog] == ["q0", "q1", "q2", "q3", "q4"]
+    # Queuing the same turns again adds nothing
+    service._queue_for_summary(store.load_tail("user", 10))
+    assert len(service._summary_backlog) == 5
+
+
+def test_turns_are_saved_off_the_event_loop(tmp_path):
+    store = HistoryStore(str(tmp_path / "history"))
+    append_turn = store.append_turn
+    threads = []
+
+    def recording_append(*args):
+        threads.append(threading.current_thread())
+        return append_turn(*args)
+
+    store.append_turn = recording_append
+    service = bare_service(store)
+
+    async def scenario():
+        for i in range(3):
+            await service._save_turn(f"q{i}", f"a{i}")
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(scenario())
+    assert len(threads) == 3 and loop_thread not in threads
+    assert [turn["user"] for turn in store.load_tail("user", 10)] == ["q0", "q1", "q2"]
+    # Memory keeps only the last history_turns turns
+    assert [turn["user"] for turn in service.turns] == ["q1", "q2"]
+    assert service.last_turn["user"] == "q2"
+
+
+def test_legacy_history_is_found_from_any_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = HistoryStore(str(tmp_path / "history"))
+    service = bare_service(store)
+    service.character = {"history_file": "waifu_core/conversation_history_ananya.json"}
+    service.history_turns = 1000
+    # The relative path in character.yaml is taken from the WaifuCore directory
+    assert len(service._load_history()) > 0
+
+
+def streaming_service(tmp_path, deltas: list[str], fail_after: int | None = None) -> LLMService:
+    """A bare service whose provider streams `deltas`, then raises after `fail_after` of them."""
+    service = bare_service(HistoryStore(str(tmp_path / "history")))
+    service.routing = True
+    service._build_context = lambda user_input, memories: None
+
+    async def routed_stream(context):
+        for i, delta in enumerate(deltas):
+            if i == fail_after:
+                raise ConnectionError("provider went away")
+            yield delta
+
+    service._routed_stream = routed_stream
+    return service
+
+
+def stream(service: LLMService) -> list[str]:
+    async def scenario():
+        return [delta async for delta in service.stream_response("Tell me a story.", [])]
+    return asyncio.run(scenario())
+
+
+def test_reply_broken_off_mid_stream_is_not_saved(tmp_path):
+    service = streaming_service(tmp_path, ["[happy] Once upon ", "a time, ", "there was"], fail_after=2)
+    assert stream(service) == ["[happy] Once upon ", "a time, "]
+    # What was said is finished, but not remembered as a complete turn
+    assert service.last_response == ("happy", None, "Once upon a time,")
+    assert service.last_turn is None
+    assert service.history_store.load_tail("user", 5) == []
+    assert service.turns == []
+
+
+def test_complete_streamed_reply_is_saved(tmp_path):
+    service = streaming_service(tmp_path, ["[happy] Once upon ", "a time."])
+    stream(service)
+    assert service.last_response == ("happy", None, "Once upon a time.")
+    assert service.last_turn["assistant"] == "[happy] Once upon a time."
+    assert [turn["user"] for turn in service.history_store.load_tail("user", 5)] == ["Tell me a story."]
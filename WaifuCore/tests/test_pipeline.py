@@ -0,0 +1,141 @@
+# tests/test_pipeline.py
+import asyncio
+
+from waifu_core.pipeline import SentenceSplitter, SpeechPipeline
+
+
+def feed_all(splitter: SentenceSplitter, pieces: list[str]) -> list[str]:
+    sentences = []
+    for piece in pieces:
+        sentences += splitter.feed(piece)
+    rest = splitter.flush()
+    return sentences + ([rest] if rest else [])
+
+
+def test_splits_streamed_text_into_sentences():
+    splitter = SentenceSplitter()
+    text = "Hello there, how are you? I am doing great today! Let me tell you a story."
+    # Token-sized pieces, as an LLM stream delivers them
+    pieces = [text[i:i + 3] for i in range(0, len(text), 3)]
+    assert feed_all(splitter, pieces) == [
+        "Hello there, how are you?", "I am doing great today!", "Let me tell you a story.",
+    ]
+
+
+def test_abbreviations_and_initials_do_not_end_a_sentence():
+    splitter = SentenceSplitter()
+    sentences = feed_all(splitter, ["I saw Dr. Smith and Mrs. Jones with J. R. R. Tolkien. ", "Then we left."])
+    assert sentences == ["I saw Dr. Smith and Mrs. Jones with J. R. R. Tolkien.", "Then we left."]
+
+
+def test_pronoun_i_still_ends_a_sentence():
+    splitter = SentenceSplitter()
+    assert splitter.feed("Nobody saw it but I. ") == ["Nobody saw it but I."]
+
+
+def test_decimals_do_not_end_a_sentence():
+    splitter = SentenceSplitter()
+    assert splitter.feed("Pi is roughly 3.14159 and e is 2.718. ") == ["Pi is roughly 3.14159 and e is 2.718."]
+
+
+def test_short_sentences_merge_until_min_chars():
+    splitter = SentenceSplitter(min_chars=12)
+    assert splitter.feed("Hi! Oh. ") == []
+    assert splitter.feed("That is nice. ") == ["Hi! Oh. That is nice."]
+
+
+def test_long_sentence_breaks_at_a_clause():
+    splitter = SentenceSplitter(max_chars=40)
+    sentences = splitter.feed("This sentence keeps going, and going on and on without a stop")
+    assert sentences == ["This sentence keeps going,"]
+    assert splitter.flush() == "and going on and on without a stop"
+
+
+def test_markup_is_never_cut():
+    splitter = SentenceSplitter()
+    assert splitter.feed("*waves happily. Then smiles.* ") == []
+    assert splitter.feed("Nice to meet you. ") == ["*waves happily. Then smiles.* Nice to meet you."]
+
+
+def test_flush_returns_the_unterminated_rest_once():
+    splitter = SentenceSplitter()
+    assert splitter.feed("This one is complete. And this one is not") == ["This one is complete."]
+    assert splitter.flush() == "And this one is not"
+    assert splitter.flush() is None
+
+
+class SlowForShortTTS:
+    """Takes longer for shorter sentences, so finishing order differs from submission order."""
+
+    def __init__(self):
+        self.started = []
+
+    async def synthesize(self, text: str, emotion: str, audio_format: str = "wav") -> bytes:
+        self.started.append(text)
+        await asyncio.sleep(0.05 / len(text))
+        return text.encode()
+
+
+def test_speech_pipeline_plays_in_submission_order():
+    async def run():
+        tts = SlowForShortTTS()
+        pipeline = SpeechPipeline(tts, clean_text=str.strip)
+        for sentence in ["A much longer first sentence.", "Short.", "", "Mid length one."]:
+            pipeline.submit(sentence)
+        pipeline.close()
+        return [chunk async for chunk in pipeline.drain()]
+
+    chunks = asyncio.run(run())
+    # Empty sentences are skipped and don't take a sequence number
+    assert chunks == [(0, b"A much longer first sentence."), (1, b"Short."), (2, b"Mid length one.")]
+
+
+def test_speech_pipeline_ready_keeps_the_end_marker():
+    async def run():
+        pipeline = SpeechPipeline(SlowForShortTTS(), clean_text=str.strip)
+        pipeline.submit("Only sentence.")
+        pipeline.close()
+        await asyncio.sleep(0.1)
+        ready = pipeline.ready()
+        return ready, [chunk async for chunk in pipeline.drain()]
+
+    ready, rest = asyncio.run(run())
+    assert ready == [(0, b"Only sentence.")]
+    assert rest == []
+
+
+class FailingTTS(SlowForShortTTS):
+    """Raises for any sentence that mentions "boom"."""
+
+    async def synthesize(self, text: str, emotion: str, audio_format: str = "wav") -> bytes:
+        if "boom" in text:
+            raise OSError("encoder exploded")
+        return await super().synthesize(text, emotion, audio_format)
+
+
+def test_speech_pipeline_skips_a_sentence_that_fails_to_synthesize():
+    async def run():
+        pipeline = SpeechPipeline(FailingTTS(), clean_text=str.strip)
+        for sentence in ["First.", "Then boom.", "Last."]:
+            pipeline.submit(sentence)
+        pipeline.close()
+        return await asyncio.wait_for(collect(pipeline), timeout=2)
+
+    async def collect(pipeline):
+        return [chunk async for chunk in pipeline.drain()]
+
+    assert asyncio.run(run()) == [(0, b"First."), (1, b"Last.")]
+
+
+def test_speech_pipeline_drain_ends_when_the_worker_is_cancelled():
+    async def run():
+        pipeline = SpeechPipeline(SlowForShortTTS(), clean_text=str.strip)
+        pipeline.submit("Never finished.")
+        await asyncio.sleep(0)
+        pipeline.cancel()
+        return await asyncio.wait_for(collect(pipeline), timeout=2)
+
+    async def collect(pipeline):
+        return [chunk async for chunk in pipeline.drain()]
+
+    assert asyncio.run(run()) == []
@@ -0,0 +1,58 @@
+# tests/test_registry.py
+import asyncio
+
+from waifu_core.registry import ModelRegistry
+
+
+class FakeTTS:
+    output_format = "wav"
+
+    def __init__(self):
+        self.rendered = []
+
+    async def synthesize(self, text: str, emotion: str, audio_format: str = "wav") -> bytes:
+        self.rendered.append((text, audio_format))
+        return b"audio"
+
+
+class FakeWhisper:
+    def transcribe(self, samples, **kwargs):
+        return [], None
+
+
+class FakeASR:
+    model = FakeWhisper()
+
+
+def broken_registry(tts: FakeTTS) -> ModelRegistry:
+    """A registry whose ASR can't load, but whose TTS, VAD and memory can."""
+    registry = ModelRegistry({'tts': {'output': {'formats': ["wav"]}}})
+
+    def no_asr():
+        raise RuntimeError("CUDA driver not found")
+
+    registry.get_asr = no_asr
+    registry.get_vad = lambda: "vad"
+    registry.get_tts = lambda provider: tts
+    registry.get_memory = lambda: "memory"
+    return registry
+
+
+def test_one_failed_resource_doesnt_hold_back_the_rest():
+    tts = FakeTTS()
+    registry = broken_registry(tts)
+    asyncio.run(registry.warm_up(["kokoro"], [("Hi!", "happy")]))
+
+    status = registry.status()
+    assert status["ready"] is True
+    assert status["failed"] == {"asr": "CUDA driver not found"}
+    # TTS and its canned lines were still warmed up
+    assert tts.rendered == [("Hello.", "wav"), ("Hi!", "wav")]
+
+
+def test_clean_warm_up_reports_no_failures():
+    tts = FakeTTS()
+    registry = broken_registry(tts)
+    registry.get_asr = lambda: FakeASR()
+    asyncio.run(registry.warm_up(["kokoro"]))
+    assert registry.status()["ready"] is True and registry.status()["failed"] == {}
@@ -0,0 +1,63 @@
+# tests/test_streaming_asr.py
+import asyncio
+
+import numpy as np
+import pytest
+
+from waifu_core.services.streaming_asr import FRAME_SAMPLES, StreamingASR
+
+
+class ScoringVAD:
+    """Silero's (batch, samples) -> (batch, frames, 1) signature; scores each frame by its first sample."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, audio: np.ndarray) -> np.ndarray:
+        assert audio.ndim == 2 and audio.shape[1] % FRAME_SAMPLES == 0
+        self.calls.append(audio)
+        return audio.reshape(audio.shape[0], -1, FRAME_SAMPLES)[:, :, :1].copy()
+
+
+def pcm(samples: np.ndarray) -> bytes:
+    return (samples * 32767).astype("<i2").tobytes()
+
+
+def test_each_frame_is_scored_once_with_the_previous_one_as_context():
+    vad = ScoringVAD()
+    stream = StreamingASR(None, vad, {})
+    scores = []
+    stream.endpointer.push = lambda frame, probability: scores.append(round(probability, 2)) or []
+
+    levels = [0.1, 0.2, 0.3, 0.4, 0.5]
+    audio = np.repeat(np.array(levels, dtype=np.float32), FRAME_SAMPLES)
+    stream._process(pcm(audio[:FRAME_SAMPLES * 2 + 100]))
+    stream._process(pcm(audio[FRAME_SAMPLES * 2 + 100:]))
+
+    assert scores == levels
+    # The second call starts with the last frame of the first as context
+    assert len(vad.calls) == 2 and np.allclose(vad.calls[1][0, :FRAME_SAMPLES], 0.2, atol=1e-4)
+
+
+def test_real_silero_model_scores_a_stream():
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("faster_whisper")
+    from waifu_core.registry import get_registry
+
+    texts = []
+
+    async def transcribe(samples):
+        texts.append(len(samples))
+        return "hello"
+
+    async def scenario():
+        stream = StreamingASR(transcribe, get_registry().get_vad(), {})
+        updates = []
+        for _ in range(2):
+            updates += await stream.feed(pcm(np.zeros(16000, dtype=np.float32)))
+        updates += await stream.finish()
+        return updates
+
+    # Silence: scored without error, and nothing to transcribe
+    assert asyncio.run(scenario()) == []
+    assert texts == []
@@ -0,0 +1,65 @@
+# tests/test_tts.py
+import asyncio
+import io
+import wave
+
+from waifu_core.protocol import FORMAT_NAMES, detect_audio_format
+from waifu_core.services.tts import base_tts
+from waifu_core.services.tts.audio_encoding import join_audio, negotiate_format
+from waifu_core.services.tts.base_tts import BaseTTSService
+
+
+def silence_wav(seconds: float = 0.1, sample_rate: int = 24000) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(bytes(int(seconds * sample_rate) * 2))
+    return buffer.getvalue()
+
+
+class SilentTTS(BaseTTSService):
+    def __init__(self):
+        super().__init__({})
+
+    def cache_identity(self) -> tuple[str, str, str]:
+        return ("silent", "none", "none")
+
+    async def _synthesize(self, text: str, emotion: str) -> bytes | None:
+        return silence_wav()
+
+
+def test_failed_encode_falls_back_to_wav(monkeypatch):
+    def broken_encoder(audio, audio_format, bitrate):
+        raise ValueError("encoder 'libopus' not found")
+
+    monkeypatch.setattr(base_tts, "get_tts_cache", lambda: None)
+    monkeypatch.setattr(base_tts, "encode_audio", broken_encoder)
+    audio = asyncio.run(SilentTTS().synthesize("Hello.", "neutral", "opus"))
+    assert audio == silence_wav()
+    assert FORMAT_NAMES[detect_audio_format(audio)[0]] == "wav"
+
+
+def test_join_audio_merges_what_plays_as_one_clip():
+    first, second = silence_wav(0.1), silence_wav(0.2)
+    [joined] = join_audio([first, second])
+    with wave.open(io.BytesIO(joined)) as wav:
+        assert wav.getframerate() == 24000 and wav.getnframes() == 7200
+    mp3 = [b"\xff\xfb\x90\x00one", b"\xff\xfb\x90\x00two"]
+    assert join_audio(mp3) == [b"".join(mp3)]
+
+
+def test_join_audio_keeps_clips_that_cannot_be_joined_in_order():
+    other_rate = silence_wav(0.1, sample_rate=16000)
+    ogg = b"OggS" + bytes(20)
+    mp3 = b"\xff\xfb\x90\x00"
+    clips = [silence_wav(), other_rate, ogg, ogg, mp3]
+    assert join_audio(clips) == clips
+
+
+def test_negotiate_format_skips_excluded_formats(monkeypatch):
+    monkeypatch.setattr("waifu_core.services.tts.audio_encoding.available_formats", lambda: ("opus", "mp3", "wav"))
+    assert negotiate_format("opus,mp3", {}) == "opus"
+    assert negotiate_format("opus,mp3", {}, exclude=("opus",)) == "mp3"
+    assert negotiate_format(None, {"default_format": "opus"}, exclude=("opus",)) == "wav"
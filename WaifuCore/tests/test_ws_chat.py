@@ -0,0 +1,233 @@
+# tests/test_ws_chat.py
+import argparse
+import base64
+import io
+import json
+import os
+import tempfile
+import time
+import wave
+
+import numpy as np
+import pytest
+from websockets.sync.client import connect
+
+from conftest import ServerThread, StubServer
+
+REPLY = "[happy] Hello there, this is the stub model. It is talking to you today."
+REPLY_TEXT = "Hello there, this is the stub model. It is talking to you today."
+
+
+@pytest.fixture(scope="module")
+def chat_url():
+    """The real app, with the load-test stand-ins for ASR, TTS and memory and the stub LLM."""
+    llm = StubServer(reply=REPLY, first_token_ms=20, token_ms=40)
+    previous_host = os.environ.get("OLLAMA_HOST_URL")
+    os.environ["OLLAMA_HOST_URL"] = f"http://127.0.0.1:{llm.port}"
+    from benchmarks.loadtest_server import install_stubs
+    install_stubs(argparse.Namespace(
+        tts_cache=False, asr_ms=10, asr_ms_per_second=0, tts_ms=10, tts_ms_per_char=0, memory_ms=0,
+        busy=False, state="file", state_url="", state_dir=tempfile.mkdtemp(prefix="waifu-test-state-"),
+    ))
+    import main_api
+    api = ServerThread(main_api.app)
+    yield f"ws://127.0.0.1:{api.port}/ws/chat?llm=ollama&tts=stub&protocol=2&timings=true"
+    api.stop()
+    llm.stop()
+    if previous_host is None:
+        os.environ.pop("OLLAMA_HOST_URL", None)
+    else:
+        os.environ["OLLAMA_HOST_URL"] = previous_host
+
+
+class LoudnessVAD:
+    """Stands in for Silero, with its (batch, samples) -> (batch, frames, 1) signature: any frame louder than a whisper is speech."""
+
+    def __call__(self, audio: np.ndarray) -> np.ndarray:
+        from waifu_core.services.streaming_asr import FRAME_SAMPLES
+        assert audio.ndim == 2 and audio.shape[1] % FRAME_SAMPLES == 0
+        frames = audio.reshape(audio.shape[0], -1, FRAME_SAMPLES)
+        return (np.abs(frames).mean(axis=2, keepdims=True) > 0.01).astype(np.float32)
+
+
+@pytest.fixture
+def slow_streaming_asr(chat_url):
+    """Streams use LoudnessVAD, and the stub ASR takes a second and a half per region."""
+    from waifu_core.registry import get_registry
+    registry = get_registry()
+    asr = registry.get_asr_scheduler()
+    delay_ms, registry.get_vad, asr.delay_ms = asr.delay_ms, LoudnessVAD, 1500
+    yield
+    asr.delay_ms = delay_ms
+    del registry.get_vad
+
+
+def speech(seconds: float) -> bytes:
+    """Loud 16 kHz pcm16 noise, which LoudnessVAD takes for speech."""
+    samples = np.random.default_rng(0).integers(-8000, 8000, int(seconds * 16000))
+    return samples.astype("<i2").tobytes()
+
+
+def receive(ws, timeout: float = 10):
+    message = ws.recv(timeout)
+    return message if isinstance(message, bytes) else json.loads(message)
+
+
+def receive_turn(ws) -> list:
+    """Messages up to and including the `timings` one that ends a turn."""
+    messages = []
+    while True:
+        messages.append(receive(ws))
+        if isinstance(messages[-1], dict) and messages[-1].get("type") == "timings":
+            return messages
+
+
+def reply_text(messages: list) -> str:
+    texts = [m["text"] for m in messages if isinstance(m, dict) and m.get("text") and not m.get("partial")]
+    return texts[-1]
+
+
+def turns_of(messages: list) -> set:
+    return {m["turn"] for m in messages if isinstance(m, dict) and "turn" in m}
+
+
+def test_text_turn(chat_url):
+    with connect(chat_url) as ws:
+        assert receive(ws)["type"] == "hello"
+        ws.send(json.dumps({"type": "text", "payload": "Hi!"}))
+        messages = receive_turn(ws)
+        assert reply_text(messages) == REPLY_TEXT
+        assert any(isinstance(m, bytes) for m in messages)
+
+
+def wav_frames(audio: bytes) -> int:
+    with wave.open(io.BytesIO(audio)) as wav:
+        return wav.getnframes()
+
+
+def test_v1_client_gets_the_reply_as_one_audio_message(chat_url):
+    from waifu_core.protocol import unpack_audio_frame
+    with connect(chat_url) as ws:
+        assert receive(ws)["type"] == "hello"
+        ws.send(json.dumps({"type": "text", "payload": "Hi!"}))
+        chunks = [bytes(unpack_audio_frame(m)[4]) for m in receive_turn(ws) if isinstance(m, bytes)]
+    assert len(chunks) == 2  # One per sentence
+
+    with connect(chat_url.replace("protocol=2", "protocol=1")) as ws:
+        assert receive(ws)["type"] == "session"
+        ws.send(json.dumps({"type": "text", "payload": "Hi!"}))
+        messages = receive_turn(ws)
+    audio = [m for m in messages if "audio" in m]
+    # A v1 client plays each audio message in place of the last, so the sentences come joined
+    assert len(audio) == 1 and audio[0]["format"] == "wav"
+    assert wav_frames(base64.b64decode(audio[0]["audio"])) == sum(map(wav_frames, chunks))
+    assert messages.index(audio[0]) > messages.index(next(m for m in messages if m.get("text") == REPLY_TEXT))
+
+
+def test_stray_stream_messages_and_unknown_types_start_no_turn(chat_url):
+    with connect(chat_url) as ws:
+        assert receive(ws)["type"] == "hello"
+        # No stream is open, so none of these is an input
+        ws.send(json.dumps({"type": "ping"}))
+        ws.send(json.dumps({"type": "audio_chunk", "payload": base64.b64encode(bytes(640)).decode()}))
+        ws.send(json.dumps({"type": "audio_end"}))
+        ws.send(json.dumps({"type": "text", "payload": "Hi!"}))
+        messages = receive_turn(ws)
+        # The first reply is to the text, not a canned "no input" one
+        assert turns_of(messages) == {1}
+        assert reply_text(messages) == REPLY_TEXT
+
+
+def test_cancel_is_read_while_an_utterance_is_still_transcribed(chat_url, slow_streaming_asr):
+    with connect(chat_url) as ws:
+        assert receive(ws)["type"] == "hello"
+        ws.send(json.dumps({"type": "text", "payload": "Hi!"}))
+        assert receive(ws)["turn"] == 1  # The reply is under way
+
+        ws.send(json.dumps({"type": "audio_start", "payload": {"format": "pcm16", "sample_rate": 16000}}))
+        audio = speech(1.2)
+        for i in range(0, len(audio), 3200):
+            ws.send(audio[i:i + 3200])
+        ws.send(json.dumps({"type": "audio_end"}))
+        ws.send(json.dumps({"type": "cancel"}))
+
+        events = []
+        while "transcript" not in events:
+            message = receive(ws)
+            if isinstance(message, dict) and (message.get("type") == "cancelled" or message.get("final")):
+                events.append(message["type"])
+        # The cancel was handled before the utterance's transcript was ready
+        assert events[0] == "cancelled"
+        # ...which then starts the next turn (the cancelled one sends no timings)
+        messages = receive_turn(ws)
+        assert messages[-1]["turn"] == 2
+        assert reply_text(messages) == REPLY_TEXT
+
+
+def test_messages_that_are_not_input_leave_the_reply_running(chat_url):
+    with connect(chat_url) as ws:
+        assert receive(ws)["type"] == "hello"
+        ws.send(json.dumps({"type": "text", "payload": "Hi!"}))
+        assert receive(ws)["turn"] == 1  # The reply is under way
+        ws.send(json.dumps({"type": "ping"}))
+        ws.send(json.dumps({"type": "audio_chunk", "payload": base64.b64encode(bytes(640)).decode()}))
+        ws.send(json.dumps({"type": "text", "payload": ""}))
+        ws.send(b"")
+        messages = receive_turn(ws)
+        assert not [m for m in messages if isinstance(m, dict) and m.get("type") == "cancelled"]
+        assert messages[-1]["turn"] == 1
+        assert reply_text(messages) == REPLY_TEXT
+
+
+def test_new_input_and_cancel_interrupt_the_reply(chat_url):
+    with connect(chat_url) as ws:
+        assert receive(ws)["type"] == "hello"
+        ws.send(json.dumps({"type": "text", "payload": "Hi!"}))
+        assert receive(ws)["turn"] == 1
+        ws.send(json.dumps({"type": "text", "payload": "Actually, never mind."}))
+        messages = receive_turn(ws)
+        assert {"type": "cancelled", "turn": 1} in messages
+        assert messages[-1]["turn"] == 2
+
+        ws.send(json.dumps({"type": "text", "payload": "One more thing."}))
+        assert receive(ws)["turn"] == 3
+        ws.send(json.dumps({"type": "cancel"}))
+        while (message := receive(ws)) != {"type": "cancelled", "turn": 3}:
+            assert not (isinstance(message, dict) and message.get("type") == "timings")
+
+
+@pytest.fixture
+def one_session(chat_url, monkeypatch):
+    """Room for a single session, with one more connection allowed to wait for it."""
+    import main_api
+    from waifu_core import admission
+    # Sessions from earlier tests release their slot when the server notices they closed
+    deadline = time.monotonic() + 10
+    while main_api.manager.active_connections and time.monotonic() < deadline:
+        time.sleep(0.05)
+    monkeypatch.setattr(admission, "_admission",
+                        admission.AdmissionController({'max_sessions': 1, 'max_waiting': 1, 'max_wait_seconds': 10}))
+    return admission._admission
+
+
+def test_full_server_queues_then_turns_connections_away(chat_url, one_session):
+    from websockets.exceptions import ConnectionClosed
+    first = connect(chat_url)
+    assert receive(first)["type"] == "hello"
+    second = connect(chat_url)
+    try:
+        assert receive(second) == {"type": "queued", "position": 1}
+        with connect(chat_url) as third:
+            with pytest.raises(ConnectionClosed) as closed:
+                receive(third)
+        assert closed.value.rcvd.code == 1013
+        assert one_session.stats()["rejected"] == 1
+
+        # The first session's slot goes to the connection that waited for it
+        first.close()
+        assert receive(second)["type"] == "hello"
+        second.send(json.dumps({"type": "text", "payload": "Hi!"}))
+        assert reply_text(receive_turn(second)) == REPLY_TEXT
+    finally:
+        first.close()
+        second.close()
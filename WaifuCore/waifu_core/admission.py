@@ -0,0 +1,140 @@
+# waifu_core/admission.py
+import asyncio
+import threading
+import time
+from typing import Awaitable, Callable
+
+from waifu_core.config import service_config
+from waifu_core.executors import FairScheduler
+
+SERVICE_CONFIG = service_config()
+
+
+class AdmissionController:
+    """
+    Caps how many sessions are open and how many turns are processed at once, so
+    a burst of connections can't oversubscribe the CPU that Whisper and Kokoro
+    share. Connections beyond `max_sessions` wait in a bounded FIFO queue and are
+    told their position as it changes; when that queue is full, or a connection
+    has waited `max_wait_seconds`, it is turned away so the client can retry
+    later. Turns beyond `max_turns` wait for a slot, round-robin by session.
+    A limit of 0 means unlimited.
+    """
+
+    def __init__(self, config: dict | None = None):
+        config = SERVICE_CONFIG.get('admission', {}) if config is None else config
+        self.max_sessions = config.get('max_sessions', 0)
+        self.max_waiting = config.get('max_waiting', 0)
+        self.max_wait = config.get('max_wait_seconds', 30)
+        self.max_turns = config.get('max_turns', 0)
+        self._turns = FairScheduler(self.max_turns) if self.max_turns else None
+        self.active = 0
+        # One future per waiting connection, resolved when a session slot is handed to it
+        self._queue: list[asyncio.Future] = []
+        self._moved = asyncio.Event()
+        # Guards the counters, which stats() may read from another thread
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    async def admit(self, on_position: Callable[[int], Awaitable[None]] | None = None) -> bool:
+        """
+        Waits for a session slot, awaiting `on_position(n)` whenever the connection's
+        place in line changes. False if the server is saturated.
+        """
+        with self._lock:
+            if not self.max_sessions or (self.active < self.max_sessions and not self._queue):
+                self.active += 1
+                self.admitted += 1
+                return True
+            if len(self._queue) >= self.max_waiting:
+                self.rejected += 1
+                return False
+
+        ticket = asyncio.get_running_loop().create_future()
+        self._queue.append(ticket)
+        deadline = time.monotonic() + self.max_wait
+        reported = None
+        admitted = False
+        try:
+            while not ticket.done():
+                position = self._queue.index(ticket) + 1
+                if on_position is not None and position != reported:
+                    reported = position
+                    await on_position(position)
+                    continue  # The line may have moved while the client was told
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    with self._lock:
+                        self.timed_out += 1
+                    return False
+                moved = asyncio.ensure_future(self._moved.wait())
+                try:
+                    await asyncio.wait([ticket, moved], timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    moved.cancel()
+            admitted = True
+            with self._lock:
+                self.admitted += 1
+            return True
+        finally:
+            if ticket in self._queue:
+                # Gave up, timed out or disconnected while waiting
+                self._queue.remove(ticket)
+                self._notify()
+            elif not admitted and ticket.done():
+                # A slot was handed over just as the connection gave up
+                self.release()
+
+    def release(self):
+        """Frees a session slot, handing it to the first connection in line."""
+        while self._queue:
+            ticket = self._queue.pop(0)
+            if not ticket.done():
+                ticket.set_result(None)
+                self._notify()
+                return
+        with self._lock:
+            self.active -= 1
+
+    def _notify(self):
+        # Wakes every waiting connection to report its new position
+        self._moved.set()
+        self._moved = asyncio.Event()
+
+    async def acquire_turn(self, session: int | None = None):
+        if self._turns is not None:
+            await self._turns.acquire(session)
+
+    def release_turn(self):
+        if self._turns is not None:
+            self._turns.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_sessions": self.max_sessions,
+                "active_sessions": self.active,
+                "waiting_sessions": len(self._queue),
+                "max_turns": self.max_turns,
+                "active_turns": self._turns.in_use if self._turns else None,
+                "waiting_turns": self._turns.waiting if self._turns else 0,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+            }
+
+
+_admission: AdmissionController | None = None
+_admission_lock = threading.Lock()
+
+
+def get_admission() -> AdmissionController:
+    """Returns the process-wide admission controller shared by every /ws/chat connection."""
+    global _admission
+    if _admission is None:
+        with _admission_lock:
+            if _admission is None:
+                _admission = AdmissionController()
+    return _admission
@@ -0,0 +1,94 @@
+# waifu_core/batching.py
+import asyncio
+from collections import OrderedDict, deque
+
+from waifu_core.executors import current_session, run_in_stage
+
+
+class MicroBatcher:
+    """
+    Collects requests from concurrent sessions and runs them as one batch. A batch
+    closes when `max_batch_size` items are queued or `max_wait_ms` has passed since
+    its first item, which bounds the latency added by waiting for company. When
+    more items are queued than fit, sessions take turns filling the batch.
+    Subclasses implement `process_batch`, which runs on the executor of `stage`.
+    """
+
+    def __init__(self, stage: str, max_batch_size: int = 8, max_wait_ms: float = 30):
+        self.stage = stage
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        # session -> its queued (item, future) pairs, in the order the sessions will be served
+        self._lanes: OrderedDict[int | None, deque] = OrderedDict()
+        self._queued = 0
+        self._arrived: asyncio.Event | None = None
+        self._worker: asyncio.Task | None = None
+        self.batches = 0
+        self.items = 0
+
+    def process_batch(self, items: list) -> list:
+        """Blocking; returns one result per item, in order."""
+        raise NotImplementedError
+
+    async def submit(self, item):
+        if self._worker is None or self._worker.done():
+            self._lanes = OrderedDict()
+            self._queued = 0
+            self._arrived = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self._lanes.setdefault(current_session.get(), deque()).append((item, future))
+        self._queued += 1
+        self._arrived.set()
+        return await future
+
+    def _take_batch(self) -> list:
+        """Up to max_batch_size queued items, taken one per session in turn."""
+        batch = []
+        while self._lanes and len(batch) < self.max_batch_size:
+            session, lane = next(iter(self._lanes.items()))
+            batch.append(lane.popleft())
+            if lane:
+                self._lanes.move_to_end(session)
+            else:
+                del self._lanes[session]
+        self._queued -= len(batch)
+        return batch
+
+    async def _run(self):
+        # The worker serves every session; its executor calls are shared work
+        current_session.set(None)
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._arrived.wait()
+            deadline = loop.time() + self.max_wait
+            while self._queued < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                self._arrived.clear()
+                try:
+                    await asyncio.wait_for(self._arrived.wait(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            batch = self._take_batch()
+            if not self._queued:
+                self._arrived.clear()
+
+            # Callers that gave up while waiting don't need a result
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+            try:
+                results = await run_in_stage(self.stage, self.process_batch, [item for item, _ in batch])
+            except Exception as e:
+                print(f"Batched {self.stage} call failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
@@ -0,0 +1,31 @@
+# waifu_core/config.py
+import os
+from functools import lru_cache
+from pathlib import Path
+
+import yaml
+
+# The WaifuCore directory, which relative paths in services.yaml are taken from
+BASE_DIR = Path(__file__).resolve().parent.parent
+# Resolved from this file rather than the working directory; WAIFU_CONFIG_DIR overrides it
+CONFIG_DIR = Path(os.environ.get("WAIFU_CONFIG_DIR", BASE_DIR / "config"))
+
+
+@lru_cache(maxsize=None)
+def load_config(name: str) -> dict:
+    """Parses config/<name>.yaml once per process; every caller shares the same dict."""
+    return yaml.safe_load((CONFIG_DIR / f"{name}.yaml").read_text(encoding="utf-8"))
+
+
+def resolve_path(path: str | Path) -> Path:
+    """A path from the config: absolute as given, relative to BASE_DIR, never to the working directory."""
+    path = Path(path).expanduser()
+    return path if path.is_absolute() else BASE_DIR / path
+
+
+def service_config() -> dict:
+    return load_config("services")
+
+
+def character_config() -> dict:
+    return load_config("character")
@@ -1,46 +1,52 @@
 # waifu_core/engine.py
+import asyncio
 import re
-from waifu_core.models import LLMProvider, CharacterState
-from waifu_core.services.asr_service import ASRService
+import time
+from contextlib import aclosing
+from waifu_core.models import LLMProvider, CharacterState, TurnEvent
+from waifu_core.pipeline import SentenceSplitter, SpeechPipeline
+from waifu_core.executors import run_in_stage
+from waifu_core.metrics import TurnTimer
 from waifu_core.services.llm_service import LLMService
-from waifu_core.services.memory_service import MemoryService
-from waifu_core.services.tts.coqui_tts import CoquiTTSService
-from waifu_core.services.tts.kokoro_tts import KokoroTTSService
+from waifu_core.registry import ModelRegistry, get_registry
 
-# Try to import ElevenLabs TTS service, handle import error gracefully
-try:
-    from waifu_core.services.tts.elevenlabs_tts import ElevenLabsTTSService
-    ELEVENLABS_AVAILABLE = True
-except ImportError as e:
-    print(f"ElevenLabs TTS service unavailable: {e}")
-    ELEVENLABS_AVAILABLE = False
+from waifu_core.config import service_config, character_config
 
-import yaml
-from pathlib import Path
+from typing import TYPE_CHECKING
 
-SERVICE_CONFIG = yaml.safe_load(Path("config/services.yaml").read_text())
-CHARACTER_CONFIG = yaml.safe_load(Path("config/character.yaml").read_text())
+if TYPE_CHECKING:
+    from waifu_core.services.streaming_asr import StreamingASR
+
+SERVICE_CONFIG = service_config()
+CHARACTER_CONFIG = character_config()
+
+# Fixed replies, pre-rendered into the TTS cache at startup: (text, emotion, animation)
+CANNED_LINES = {
+    "no_input": ("No input received, ji.", "neutral", "neutral"),
+    "not_understood": ("I didn't quite catch that, ji.", "playful", "playful"),
+    "llm_error": ("I'm sorry, I'm having trouble thinking right now. Could you try again?", "neutral", "neutral"),
+}
 
 class ConversationEngine:
-    def __init__(self, llm_provider: LLMProvider, tts_provider: str):
+    def __init__(self, llm_provider: LLMProvider, tts_provider: str, registry: ModelRegistry | None = None, user_id: str = "user",
+                 audio_format: str = "wav"):
         print(f"--- Creating ConversationEngine with LLM: {llm_provider.value}, TTS: {tts_provider} ---")
+        # Models and clients come from the shared registry; the engine only owns per-session state.
+        registry = registry or get_registry()
+        self.registry = registry
         self.state = CharacterState.IDLE
-        self.asr_service = ASRService()
-        self.llm_service = LLMService(provider=llm_provider)
-        
-        if tts_provider.lower() == "coqui":
-            self.tts_service = CoquiTTSService(config=SERVICE_CONFIG['tts']['coqui'])
-        elif tts_provider.lower() == "kokoro":
-            self.tts_service = KokoroTTSService(config=SERVICE_CONFIG['tts']['kokoro'])
-        elif tts_provider.lower() == "elevenlabs":
-            if ELEVENLABS_AVAILABLE:
-                self.tts_service = ElevenLabsTTSService(config=SERVICE_CONFIG['tts']['elevenlabs'])
-            else:
-                raise ValueError(f"ElevenLabs TTS provider is not available. Please install the 'elevenlabs' package.")
-        else:
-            raise ValueError(f"Invalid TTS provider selected: {tts_provider}")
-            
-        self.memory_service = MemoryService()
+        self.user_id = user_id
+        # Negotiated with the client: "wav", "opus" or "mp3"
+        self.audio_format = audio_format
+        self.asr_service = registry.get_asr()
+        self.asr_scheduler = registry.get_asr_scheduler()
+        self.llm_service = LLMService(
+            provider=llm_provider, client=registry.get_llm_client(llm_provider), history_key=user_id,
+            client_factory=registry.get_llm_client,
+        )
+        self.tts_service = registry.get_tts(tts_provider)
+        self.memory_service = registry.get_memory()
+        self.memory_extractor = registry.get_memory_extractor()
         self.emotion_map = CHARACTER_CONFIG['emotion_map']
 
     def _clean_text_for_tts(self, text: str) -> str:
@@ -49,47 +55,155 @@ class ConversationEngine:
         cleaned_text = re.sub(r'[\*\(\[].*?[\*\)\]]', '', text)
         return " ".join(cleaned_text.split())
 
-    async def run_turn(self, audio_filepath: str | None = None, text_input: str | None = None):
-        # The generator now yields 5 values: state, text, audio, animation, action
+    def _animation_for(self, emotion: str) -> str:
+        return self.emotion_map.get(emotion, self.emotion_map.get("default", {}))['animation']
+
+    async def open_audio_stream(self, audio_format: str = "pcm16", sample_rate: int | None = None) -> "StreamingASR":
+        """Starts streaming input; the stream yields transcripts to pass to run_turn as text."""
+        # Imported here: it pulls in faster-whisper, which the registry also loads lazily
+        from waifu_core.services.streaming_asr import StreamingASR
+        # Loading Silero blocks, so a session that streams before warm-up has loaded it waits in a thread
+        vad = await asyncio.to_thread(self.registry.get_vad)
+        return StreamingASR(
+            self.asr_scheduler.transcribe, vad,
+            SERVICE_CONFIG['asr'].get('streaming', {}), audio_format, sample_rate,
+        )
+
+    def close(self):
+        """Called when the session ends; its pending turns don't wait for more company."""
+        self.memory_extractor.request_flush(self.user_id)
+
+    async def _canned_reply(self, name: str):
+        """Yields a fixed reply with its (normally cached) audio."""
+        text, emotion, animation = CANNED_LINES[name]
+        self.state = CharacterState.IDLE
+        yield TurnEvent(self.state, text=text, animation=animation)
+        audio_bytes = await self.tts_service.synthesize(text, emotion, self.audio_format)
+        if audio_bytes:
+            yield TurnEvent(self.state, audio=audio_bytes, animation=animation, seq=0)
+
+    async def run_turn(self, audio_input: bytes | None = None, text_input: str | None = None, timer: TurnTimer | None = None):
+        """
+        Yields TurnEvents: state changes, (partial) text and numbered audio chunks.
+        Stage timings go to `timer` (and the /metrics histograms); stages that stream
+        to the client include the time the consumer spends sending.
+        """
+        timer = timer or TurnTimer()
+        cancelled = False
+        try:
+            # Closed explicitly so a cancelled turn stops its LLM request and TTS right away
+            async with aclosing(self._run_turn(audio_input, text_input, timer)) as events:
+                async for event in events:
+                    if event.audio:
+                        timer.mark("first_audio")
+                    yield event
+        except (asyncio.CancelledError, GeneratorExit):
+            # Barge-in: the user moved on before the reply was finished
+            cancelled = True
+            self.state = CharacterState.IDLE
+            timer.mark("cancelled")
+            raise
+        finally:
+            if not cancelled:
+                timer.finish()
+
+    async def _run_turn(self, audio_input: bytes | None, text_input: str | None, timer: TurnTimer):
         self.state = CharacterState.LISTENING
-        yield self.state, None, None, None, None
+        yield TurnEvent(self.state)
         
-        if audio_filepath:
-            user_input = self.asr_service.transcribe_audio(audio_filepath)
+        if audio_input:
+            # Batched with whatever other sessions are transcribing at the same moment
+            with timer.span("asr"):
+                user_input = await self.asr_scheduler.transcribe(audio_input)
         elif text_input:
             user_input = text_input
         else:
-            self.state = CharacterState.IDLE
-            yield self.state, "No input received, ji.", None, "neutral", None
+            async for event in self._canned_reply("no_input"):
+                yield event
             return
             
         if not user_input or len(user_input) < 2:
-            self.state = CharacterState.IDLE
-            yield self.state, "I didn't quite catch that, ji.", None, "playful", None
+            async for event in self._canned_reply("not_understood"):
+                yield event
             return
 
         self.state = CharacterState.THINKING
-        yield self.state, None, None, "thinking", None
+        yield TurnEvent(self.state, animation="thinking")
         
-        relevant_memories = self.memory_service.retrieve_relevant_memories(user_input)
-        # LLM service now returns emotion, action, and text
-        emotion, action, ananya_text_raw = await self.llm_service.generate_response(user_input, relevant_memories)
+        with timer.span("memory_retrieval"):
+            relevant_memories = await run_in_stage("embedding", self.memory_service.retrieve_relevant_memories, user_input, self.user_id)
 
-        ananya_text_for_tts = self._clean_text_for_tts(ananya_text_raw)
-        ananya_text_for_ui = ananya_text_raw
+        # Sentences go to TTS as soon as they are complete, so speech starts before the reply is finished.
+        pipeline_config = SERVICE_CONFIG['tts'].get('pipeline', {})
+        splitter = SentenceSplitter(pipeline_config.get('min_chars', 12), pipeline_config.get('max_chars', 200))
+        pipelined = pipeline_config.get('enabled', True)
+        speech = None
+        animation = "thinking"
+        fed_chars = 0
+        deltas = None
+        llm_started = time.perf_counter()
+        try:
+            if self.llm_service.config.get('stream', True):
+                # Forward the reply as it is generated
+                partial_message = ""
+                deltas = self.llm_service.stream_response(user_input, relevant_memories)
+                async for delta in deltas:
+                    if not partial_message:
+                        timer.record("llm_first_token", time.perf_counter() - llm_started)
+                    partial_message += delta
+                    partial_text = self.llm_service.visible_text(partial_message)
+                    if not partial_text:
+                        continue
+                    if speech is None:
+                        # The leading tags are complete once there is visible text
+                        emotion, _, _ = self.llm_service.split_tags(partial_message)
+                        speech = SpeechPipeline(self.tts_service, self._clean_text_for_tts, emotion, timer, self.audio_format)
+                    if pipelined:
+                        for sentence in splitter.feed(partial_text[fed_chars:]):
+                            speech.submit(sentence)
+                        fed_chars = len(partial_text)
+                    yield TurnEvent(self.state, text=partial_text, animation=animation, partial=True)
+                    for seq, audio_bytes in speech.ready():
+                        if self.state != CharacterState.SPEAKING:
+                            self.state = CharacterState.SPEAKING
+                            animation = self._animation_for(emotion)
+                        yield TurnEvent(self.state, audio=audio_bytes, animation=animation, seq=seq)
+                emotion, action, ananya_text_raw = self.llm_service.last_response
+            else:
+                # LLM service now returns emotion, action, and text
+                emotion, action, ananya_text_raw = await self.llm_service.generate_response(user_input, relevant_memories)
+            timer.record("llm", time.perf_counter() - llm_started)
 
-        self.state = CharacterState.SPEAKING
-        animation = self.emotion_map.get(emotion, self.emotion_map.get("default", {}))['animation']
-        
-        # Yield the action along with other state
-        yield self.state, ananya_text_for_ui, None, animation, action
-        
-        audio_output_bytes = await self.tts_service.synthesize(ananya_text_for_tts, emotion)
-        
-        yield self.state, ananya_text_for_ui, audio_output_bytes, animation, action
+            ananya_text_for_ui = ananya_text_raw
+            if speech is None:
+                speech = SpeechPipeline(self.tts_service, self._clean_text_for_tts, emotion, timer, self.audio_format)
+            if pipelined:
+                for sentence in splitter.feed(ananya_text_raw[fed_chars:]):
+                    speech.submit(sentence)
+                rest = splitter.flush()
+                if rest:
+                    speech.submit(rest)
+            else:
+                speech.submit(ananya_text_raw)
+            speech.close()
+
+            self.state = CharacterState.SPEAKING
+            animation = self._animation_for(emotion)
+            
+            # Yield the action along with other state
+            yield TurnEvent(self.state, text=ananya_text_for_ui, animation=animation, action=action)
+            
+            async for seq, audio_bytes in speech.drain():
+                yield TurnEvent(self.state, audio=audio_bytes, animation=animation, seq=seq)
+        finally:
+            if speech is not None:
+                speech.cancel()
+            if deltas is not None:
+                await deltas.aclose()
         
-        new_memories = await self.llm_service.extract_memories()
-        self.memory_service.add_memories(new_memories)
+        # Memories are extracted in the background, batched with this user's next turns
+        if self.llm_service.last_turn is not None:
+            self.memory_extractor.submit(self.llm_service, self.user_id, self.llm_service.last_turn)
 
         self.state = CharacterState.IDLE
-        yield self.state, ananya_text_for_ui, audio_output_bytes, animation, action
\ No newline at end of file
+        yield TurnEvent(self.state, text=ananya_text_for_ui, animation=animation, action=action)
@@ -0,0 +1,196 @@
+# waifu_core/executors.py
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from waifu_core.config import service_config
+
+SERVICE_CONFIG = service_config()
+
+# Used for stages missing from the `executors` section of services.yaml
+DEFAULT_STAGE_CONFIG = {'max_workers': 1, 'max_queue': 32}
+
+# The /ws/chat session on whose behalf work is submitted; None for shared background work
+current_session: ContextVar[int | None] = ContextVar("current_session", default=None)
+
+
+class FairScheduler:
+    """
+    Hands out `capacity` slots. Callers that have to wait are served round-robin
+    by session: a freed slot goes to the next session in line rather than to the
+    oldest call, so one chatty session can't starve the others.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.in_use = 0
+        # session -> its waiting callers, in the order the sessions will be served
+        self._waiting: OrderedDict[int | None, deque[asyncio.Future]] = OrderedDict()
+        # Guards in_use and the line, which stats readers may look at from another thread
+        self._lock = threading.Lock()
+
+    @property
+    def waiting(self) -> int:
+        with self._lock:
+            return sum(len(waiters) for waiters in self._waiting.values())
+
+    async def acquire(self, session: int | None = None):
+        with self._lock:
+            if self.in_use < self.capacity and not self._waiting:
+                self.in_use += 1
+                return
+            future = asyncio.get_running_loop().create_future()
+            self._waiting.setdefault(session, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as the caller gave up
+                self.release()
+            else:
+                with self._lock:
+                    waiters = self._waiting.get(session)
+                    if waiters is not None and future in waiters:
+                        waiters.remove(future)
+                        if not waiters:
+                            del self._waiting[session]
+            raise
+
+    def release(self):
+        # The slot passes straight to the next session in line, which then goes to the back
+        with self._lock:
+            while self._waiting:
+                session, waiters = next(iter(self._waiting.items()))
+                future = waiters.popleft()
+                if waiters:
+                    self._waiting.move_to_end(session)
+                else:
+                    del self._waiting[session]
+                if not future.done():
+                    future.set_result(None)
+                    return
+            self.in_use -= 1
+
+    @asynccontextmanager
+    async def slot(self, session: int | None = None):
+        await self.acquire(session)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class StageExecutor:
+    """
+    Runs the blocking work of one pipeline stage (ASR, TTS, embedding) on its own
+    thread pool, so a multi-second model call never stalls the event loop.
+    At most `max_workers` calls run at once and at most `max_queue` more wait for a
+    worker; callers beyond that wait on the event loop without holding a thread.
+    Waiting calls get a worker round-robin by session (see `current_session`).
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"waifu-{name}")
+        self._slots = FairScheduler(max_workers + max_queue)
+        # A call is only handed to the pool once a thread is free, so the pool never queues
+        self._workers = FairScheduler(max_workers)
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+
+    async def run(self, fn, *args, **kwargs):
+        session = current_session.get()
+        async with self._slots.slot(session):
+            call = {'state': 'queued'}
+            with self._lock:
+                self.queued += 1
+            loop = asyncio.get_running_loop()
+            try:
+                await self._workers.acquire(session)
+                try:
+                    future = self._pool.submit(self._call, call, fn, args, kwargs)
+                except BaseException:
+                    self._workers.release()
+                    raise
+                # Held until the thread is done, even if the caller stops waiting for it
+                future.add_done_callback(lambda _: self._release_worker(loop))
+                return await asyncio.wrap_future(future)
+            finally:
+                with self._lock:
+                    # Cancelled before a worker picked it up: it will never run
+                    if call['state'] == 'queued':
+                        call['state'] = 'abandoned'
+                        self.queued -= 1
+
+    def _release_worker(self, loop: asyncio.AbstractEventLoop):
+        try:
+            loop.call_soon_threadsafe(self._workers.release)
+        except RuntimeError:
+            pass  # The event loop is already closed
+
+    def _call(self, call, fn, args, kwargs):
+        with self._lock:
+            if call['state'] == 'queued':
+                self.queued -= 1
+            call['state'] = 'running'
+            self.running += 1
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.busy_seconds += time.perf_counter() - started
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "busy_seconds": round(self.busy_seconds, 3),
+            }
+
+
+_executors: dict[str, StageExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(stage: str) -> StageExecutor:
+    """Returns the process-wide executor for a stage, created from services.yaml on first use."""
+    executor = _executors.get(stage)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(stage)
+            if executor is None:
+                config = {**DEFAULT_STAGE_CONFIG, **SERVICE_CONFIG.get('executors', {}).get(stage, {})}
+                executor = StageExecutor(stage, config['max_workers'], config['max_queue'])
+                _executors[stage] = executor
+    return executor
+
+
+async def run_in_stage(stage: str, fn, *args, **kwargs):
+    """Runs a blocking call on the executor of the given stage and awaits its result."""
+    return await get_executor(stage).run(fn, *args, **kwargs)
+
+
+def executor_stats() -> dict:
+    return {name: executor.stats() for name, executor in list(_executors.items())}
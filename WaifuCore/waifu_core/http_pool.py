@@ -0,0 +1,231 @@
+# waifu_core/http_pool.py
+import asyncio
+import importlib.util
+import threading
+from urllib.parse import urlsplit
+
+import httpx
+
+from waifu_core.config import service_config
+
+SERVICE_CONFIG = service_config()
+
+# HTTP/2 needs the optional `h2` package; without it the pools speak HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class PoolStats:
+    """In-flight request counts for one pool; requests beyond max_connections wait for a connection."""
+
+    def __init__(self, origin: str, max_connections: int, http2: bool):
+        self.origin = origin
+        self.max_connections = max_connections
+        self.http2 = http2
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.saturated_requests = 0
+        self._lock = threading.Lock()
+
+    def started(self):
+        with self._lock:
+            self.in_flight += 1
+            self.requests += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            if self.in_flight > self.max_connections:
+                self.saturated_requests += 1
+
+    def finished(self, failed: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            if failed:
+                self.errors += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "origin": self.origin,
+            "http2": self.http2,
+            "max_connections": self.max_connections,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "saturation": round(self.in_flight / self.max_connections, 3) if self.max_connections else 0.0,
+            "requests": self.requests,
+            "saturated_requests": self.saturated_requests,
+            "errors": self.errors,
+        }
+
+
+class _MeteredStream(httpx.AsyncByteStream, httpx.SyncByteStream):
+    """Keeps a request counted as in flight until its (possibly streamed) body is closed."""
+
+    def __init__(self, stream, stats: PoolStats):
+        self._stream = stream
+        self._stats = stats
+        self._closed = False
+
+    def _finish(self):
+        if not self._closed:
+            self._closed = True
+            self._stats.finished()
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._finish()
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._finish()
+
+
+class _MeteredAsyncTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncHTTPTransport, stats: PoolStats):
+        self._transport = transport
+        self._stats = stats
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self._stats.started()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self._stats.finished(failed=True)
+            raise
+        response.stream = _MeteredStream(response.stream, self._stats)
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class _MeteredTransport(httpx.BaseTransport):
+    def __init__(self, transport: httpx.HTTPTransport, stats: PoolStats):
+        self._transport = transport
+        self._stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self._stats.started()
+        try:
+            response = self._transport.handle_request(request)
+        except BaseException:
+            self._stats.finished(failed=True)
+            raise
+        response.stream = _MeteredStream(response.stream, self._stats)
+        return response
+
+    def close(self):
+        self._transport.close()
+
+
+class HTTPPool:
+    """
+    Process-wide keep-alive HTTP clients, one per provider origin (Groq, Ollama,
+    the Coqui server, ElevenLabs), so every session reuses warm TCP/TLS
+    connections. Each origin gets its own connection limits from the `http`
+    section of services.yaml, optionally overridden per host.
+    """
+
+    def __init__(self, config: dict | None = None):
+        self.config = config or SERVICE_CONFIG.get('http', {})
+        self._async_clients: dict[str, httpx.AsyncClient] = {}
+        self._sync_clients: dict[str, httpx.Client] = {}
+        self._stats: dict[tuple[str, str], PoolStats] = {}
+        self._lock = threading.Lock()
+
+    def _settings(self, origin: str) -> dict:
+        settings = {key: value for key, value in self.config.items() if key not in ('hosts', 'prewarm')}
+        settings.update((self.config.get('hosts') or {}).get(urlsplit(origin).hostname, {}))
+        return settings
+
+    def _client_options(self, origin: str, kind: str) -> tuple[dict, dict, PoolStats]:
+        settings = self._settings(origin)
+        limits = httpx.Limits(
+            max_connections=settings.get('max_connections', 20),
+            max_keepalive_connections=settings.get('max_keepalive_connections', 10),
+            keepalive_expiry=settings.get('keepalive_expiry', 60),
+        )
+        http2 = settings.get('http2', True) and HTTP2_AVAILABLE and origin.startswith("https")
+        stats = PoolStats(origin, limits.max_connections, http2)
+        self._stats[(kind, origin)] = stats
+        transport_options = {"limits": limits, "http2": http2, "retries": settings.get('connect_retries', 1)}
+        client_options = {
+            "base_url": origin,
+            "timeout": httpx.Timeout(settings.get('timeout', 60), connect=settings.get('connect_timeout', 5)),
+        }
+        return transport_options, client_options, stats
+
+    def get_async_client(self, url: str) -> httpx.AsyncClient:
+        """The shared async client for the origin of `url`."""
+        origin = _origin(url)
+        with self._lock:
+            client = self._async_clients.get(origin)
+            if client is None:
+                transport_options, client_options, stats = self._client_options(origin, "async")
+                transport = _MeteredAsyncTransport(httpx.AsyncHTTPTransport(**transport_options), stats)
+                client = self._async_clients[origin] = httpx.AsyncClient(transport=transport, **client_options)
+            return client
+
+    def get_sync_client(self, url: str) -> httpx.Client:
+        """The shared blocking client for the origin of `url`, for SDKs that run on executor threads."""
+        origin = _origin(url)
+        with self._lock:
+            client = self._sync_clients.get(origin)
+            if client is None:
+                transport_options, client_options, stats = self._client_options(origin, "sync")
+                transport = _MeteredTransport(httpx.HTTPTransport(**transport_options), stats)
+                client = self._sync_clients[origin] = httpx.Client(transport=transport, **client_options)
+            return client
+
+    async def prewarm(self, urls: list[str] | None = None):
+        """Opens a connection to each URL's origin ahead of the first real request."""
+        urls = self.config.get('prewarm', []) if urls is None else urls
+
+        async def warm(url: str):
+            try:
+                # Any response will do: the point is the TCP and TLS handshake
+                await self.get_async_client(url).head(url)
+                print(f"Prewarmed HTTP connection to {_origin(url)}")
+            except httpx.HTTPError as e:
+                print(f"Could not prewarm {_origin(url)}: {e}")
+
+        await asyncio.gather(*(warm(url) for url in urls))
+
+    def stats(self) -> list[dict]:
+        return [dict(stats.as_dict(), client=kind) for (kind, _), stats in list(self._stats.items())]
+
+    async def aclose(self):
+        for client in list(self._async_clients.values()):
+            await client.aclose()
+        for client in list(self._sync_clients.values()):
+            client.close()
+        self._async_clients.clear()
+        self._sync_clients.clear()
+
+
+_pool: HTTPPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_http_pool() -> HTTPPool:
+    """Returns the process-wide HTTP pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = HTTPPool()
+    return _pool
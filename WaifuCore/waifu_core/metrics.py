@@ -0,0 +1,179 @@
+# waifu_core/metrics.py
+import threading
+import time
+from contextlib import contextmanager
+
+from waifu_core.config import service_config
+
+SERVICE_CONFIG = service_config()
+
+# Seconds; spans from a cached TTS hit (~1 ms) to a slow LLM reply
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """A Prometheus histogram: cumulative bucket counts, sum and count per label set."""
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket..., sum, count]
+        self._series: dict[tuple, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            for bound, count in zip(self.buckets, values):
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {count}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {values[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {values[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {values[-1]}")
+        return lines
+
+
+class Gauge:
+    """
+    A gauge read when /metrics is scraped. `callback` returns a number, or a dict
+    from label values (a tuple matching `labelnames`) to numbers.
+    """
+
+    def __init__(self, name: str, help: str, callback, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.labelnames = labelnames
+
+    def render(self) -> list[str]:
+        try:
+            value = self.callback()
+        except Exception as e:
+            print(f"Metrics gauge {self.name} failed: {e}")
+            return []
+        if value is None:
+            return []
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        series = value if isinstance(value, dict) else {(): value}
+        for key, number in series.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {float(number)}")
+        return lines
+
+
+class MetricsRegistry:
+    """Every histogram and gauge of the process, rendered in the Prometheus text format."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._metrics: dict[str, Histogram | Gauge] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Histogram:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, help, labelnames, self.buckets)
+            return self._metrics[name]
+
+    def gauge(self, name: str, help: str, callback, labelnames: tuple[str, ...] = ()) -> Gauge:
+        with self._lock:
+            self._metrics[name] = Gauge(name, help, callback, labelnames)
+            return self._metrics[name]
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+_metrics: MetricsRegistry | None = None
+_metrics_lock = threading.Lock()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Returns the process-wide metrics registry."""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = MetricsRegistry(SERVICE_CONFIG.get('metrics', {}).get('buckets') or DEFAULT_BUCKETS)
+    return _metrics
+
+
+def stage_histogram() -> Histogram:
+    return get_metrics().histogram("waifu_stage_seconds", "Time spent in each stage of a conversation turn", ("stage",))
+
+
+@contextmanager
+def span(stage: str):
+    """Times a block and records it in the stage histogram."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_histogram().observe(time.perf_counter() - started, stage=stage)
+
+
+class TurnTimer:
+    """
+    The timing breakdown of one turn. Spans add up per stage (a turn may send many
+    messages); marks record how long after the start of the turn something first
+    happened. Both also go to the stage histogram.
+    """
+
+    def __init__(self, started: float | None = None):
+        self.started = started or time.perf_counter()
+        self.stages: dict[str, float] = {}
+
+    def record(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        stage_histogram().observe(seconds, stage=stage)
+
+    @contextmanager
+    def span(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def mark(self, stage: str):
+        if stage not in self.stages:
+            self.record(stage, time.perf_counter() - self.started)
+
+    def finish(self):
+        self.mark("turn")
+
+    def as_dict(self) -> dict[str, float]:
+        """Milliseconds per stage."""
+        return {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()}
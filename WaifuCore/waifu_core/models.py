@@ -1,5 +1,6 @@
 # waifu_core/models.py
 from pydantic import BaseModel
+from dataclasses import dataclass
 from enum import Enum, auto
 
 class LLMProvider(str, Enum):
@@ -16,4 +17,15 @@ class CharacterState(str, Enum):
     IDLE = "idle"
     LISTENING = "listening"
     THINKING = "thinking"
-    SPEAKING = "speaking"
\ No newline at end of file
+    SPEAKING = "speaking"
+
+@dataclass
+class TurnEvent:
+    """One update from ConversationEngine.run_turn for the client."""
+    state: CharacterState
+    text: str | None = None
+    audio: bytes | None = None
+    animation: str | None = None
+    action: str | None = None
+    partial: bool = False      # text is a still-growing streamed reply
+    seq: int | None = None     # order of this audio chunk within the turn
@@ -0,0 +1,137 @@
+# waifu_core/pipeline.py
+import asyncio
+import re
+
+from waifu_core.metrics import TurnTimer
+
+# A sentence ends at terminal punctuation (optionally followed by closing quotes) and whitespace.
+SENTENCE_END = re.compile(r'[.!?…]+["\')\]]*\s+')
+# Clause boundaries, only used to break up sentences that run past max_chars.
+CLAUSE_END = re.compile(r'[,;:—]\s+')
+# A period after one of these (or after a lone initial, as in "J. R. R.") doesn't end the sentence.
+ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc", "e.g", "i.e", "approx"}
+WORD_BEFORE = re.compile(r'(\S+)$')
+
+
+class SentenceSplitter:
+    """
+    Incrementally cuts streamed text into sentences (or clauses, for very long
+    sentences) that are ready to be synthesized on their own.
+    """
+
+    def __init__(self, min_chars: int = 12, max_chars: int = 200):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.buffer = ""
+
+    def _inside_markup(self, text: str) -> bool:
+        # Never cut inside *actions*, (asides) or [tags]; the TTS cleaner needs them whole.
+        return text.count("*") % 2 == 1 or text.count("(") > text.count(")") or text.count("[") > text.count("]")
+
+    def _is_abbreviation(self, text: str) -> bool:
+        # `text` ends right before the punctuation that would end the sentence
+        word = WORD_BEFORE.search(text)
+        if word is None:
+            return False
+        word = word.group(1).lstrip("\"'([")
+        # A lone capital is an initial, except the pronoun "I"
+        return word.lower() in ABBREVIATIONS or (len(word) == 1 and word.isupper() and word != "I")
+
+    def feed(self, text: str) -> list[str]:
+        """Adds newly generated text and returns every sentence it completed."""
+        self.buffer += text
+        sentences = []
+        while True:
+            cut = None
+            for match in SENTENCE_END.finditer(self.buffer):
+                if match.group().rstrip() == "." and self._is_abbreviation(self.buffer[:match.start()]):
+                    continue
+                if match.end() >= self.min_chars and not self._inside_markup(self.buffer[:match.end()]):
+                    cut = match.end()
+                    break
+            if cut is None and len(self.buffer) > self.max_chars:
+                clauses = [m.end() for m in CLAUSE_END.finditer(self.buffer, 0, self.max_chars)
+                           if not self._inside_markup(self.buffer[:m.end()])]
+                if clauses:
+                    cut = clauses[-1]
+            if cut is None:
+                return sentences
+            sentences.append(self.buffer[:cut].strip())
+            self.buffer = self.buffer[cut:]
+
+    def flush(self) -> str | None:
+        """Returns whatever text is left once the reply is complete."""
+        rest, self.buffer = self.buffer.strip(), ""
+        return rest or None
+
+
+class SpeechPipeline:
+    """
+    Synthesizes sentences in the background, one at a time and in order, so the
+    first sentence is being spoken while the LLM is still writing the next ones.
+    Finished audio comes back as (sequence number, audio bytes) pairs.
+    """
+
+    def __init__(self, tts_service, clean_text, emotion: str = "neutral", timer: TurnTimer | None = None,
+                 audio_format: str = "wav"):
+        self.tts_service = tts_service
+        self.timer = timer or TurnTimer()
+        self.clean_text = clean_text
+        self.emotion = emotion
+        self.audio_format = audio_format
+        self._sentences: asyncio.Queue = asyncio.Queue()
+        self._audio: asyncio.Queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+        self._next_seq = 0
+
+    def submit(self, sentence: str):
+        tts_text = self.clean_text(sentence)
+        if tts_text:
+            self._sentences.put_nowait(tts_text)
+
+    def close(self):
+        """Marks the end of the reply; no more sentences will be submitted."""
+        self._sentences.put_nowait(None)
+
+    async def _run(self):
+        try:
+            while True:
+                tts_text = await self._sentences.get()
+                if tts_text is None:
+                    break
+                try:
+                    with self.timer.span("tts"):
+                        audio_bytes = await self.tts_service.synthesize(tts_text, self.emotion, self.audio_format)
+                except Exception as e:
+                    # One sentence goes unspoken rather than the rest of the reply
+                    print(f"TTS synthesis failed, skipping sentence: {e}")
+                    continue
+                if audio_bytes:
+                    self._audio.put_nowait((self._next_seq, audio_bytes))
+                    self._next_seq += 1
+        finally:
+            # drain() waits for this, however the worker ends
+            self._audio.put_nowait(None)
+
+    def ready(self) -> list[tuple[int, bytes]]:
+        """Audio chunks that have finished synthesizing, without waiting for more."""
+        chunks = []
+        while not self._audio.empty():
+            chunk = self._audio.get_nowait()
+            if chunk is None:
+                # Keep the end marker for drain()
+                self._audio.put_nowait(None)
+                break
+            chunks.append(chunk)
+        return chunks
+
+    async def drain(self):
+        """Yields the remaining audio chunks in order until the pipeline is closed and empty."""
+        while True:
+            chunk = await self._audio.get()
+            if chunk is None:
+                return
+            yield chunk
+
+    def cancel(self):
+        self._worker.cancel()
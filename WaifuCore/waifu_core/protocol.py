@@ -0,0 +1,86 @@
+# waifu_core/protocol.py
+"""
+Wire format of the /ws/chat WebSocket.
+
+Version 1 (default) carries everything as JSON, audio included as base64 strings.
+
+Version 2 is requested with `?protocol=2` at connect time. Control messages stay
+JSON, but audio travels as binary frames:
+  - client -> server: a binary frame is one recorded clip (webm/ogg/wav bytes).
+  - server -> client: a binary frame is AUDIO_HEADER followed by the audio bytes.
+
+Streaming input works with either version. After
+{"type": "audio_start", "payload": {"format": "pcm16" | "opus", "sample_rate": 16000}}
+the client sends microphone chunks as they are recorded: binary frames (v2) or
+{"type": "audio_chunk", "payload": <base64>} (v1). pcm16 is little-endian 16-bit
+mono; opus chunks are single raw Opus packets. The server detects the end of each
+utterance itself and answers with {"type": "transcript", "text": ..., "final": bool}
+messages, the final one followed by the reply. {"type": "audio_end"} ends the
+current utterance at once; {"type": "audio_stop"} closes the stream.
+
+Reply audio is WAV unless the client lists the formats it can play with
+`?audio=opus,mp3,wav` (first supported one wins; the v2 hello names the choice).
+Each chunk states its actual format, in the v2 frame header or the v1 "format"
+field, since some TTS providers (ElevenLabs) always answer in MP3.
+
+v2 streams the reply's audio sentence by sentence. v1 clients play each audio
+message in place of the previous one, so they get the whole reply at the end of
+the turn, normally as a single message (WAV or MP3; a v1 session is never given
+Opus). Only chunks that cannot be joined, such as WAVs at different sample rates,
+arrive as separate messages, numbered by "seq".
+
+A reply can be interrupted: any new input (text, a clip, or a final transcript)
+or {"type": "cancel"} stops the turn in progress, and the server confirms with
+{"type": "cancelled", "turn": ...} before anything of the next turn is sent.
+
+When the server is at its session limit a new connection waits in line, receiving
+{"type": "queued", "position": n} as its place changes, before the session starts
+(the v2 hello comes after). If the line is full or the wait runs out the server
+closes the connection with code 1013 (try again later).
+
+Every session has a key, sent in the v2 hello (v1: a {"type": "session"} message)
+along with the worker serving it. Reconnecting with `?session=<key>` resumes the
+conversation (user, turn numbering) on any worker sharing the session state; an
+older connection still holding the session is closed with CLOSE_SESSION_MOVED.
+"""
+import struct
+
+PROTOCOL_V1 = 1
+PROTOCOL_V2 = 2
+SUPPORTED_PROTOCOLS = (PROTOCOL_V1, PROTOCOL_V2)
+
+# Close code for a connection whose session was resumed by a newer one
+CLOSE_SESSION_MOVED = 4001
+
+# version, turn id, sequence number within the turn, audio format, sample rate (0 if unknown)
+AUDIO_HEADER = struct.Struct("!BIHBI")
+AUDIO_FRAME_VERSION = 1
+
+FORMAT_WAV = 0
+FORMAT_MP3 = 1
+FORMAT_OGG = 2
+FORMAT_NAMES = {FORMAT_WAV: "wav", FORMAT_MP3: "mp3", FORMAT_OGG: "ogg"}
+
+
+def detect_audio_format(audio_bytes: bytes) -> tuple[int, int]:
+    """Sniffs the container format (and, for WAV, the sample rate) of TTS output."""
+    if audio_bytes[:4] == b"RIFF" and audio_bytes[8:12] == b"WAVE":
+        # The canonical WAV header keeps the sample rate at byte 24
+        return FORMAT_WAV, int.from_bytes(audio_bytes[24:28], "little")
+    if audio_bytes[:4] == b"OggS":
+        return FORMAT_OGG, 0
+    return FORMAT_MP3, 0
+
+
+def pack_audio_frame(turn_id: int, seq: int, audio_bytes: bytes) -> bytes:
+    audio_format, sample_rate = detect_audio_format(audio_bytes)
+    header = AUDIO_HEADER.pack(AUDIO_FRAME_VERSION, turn_id, seq, audio_format, sample_rate)
+    return header + audio_bytes
+
+
+def unpack_audio_frame(frame: bytes) -> tuple[int, int, int, int, memoryview]:
+    """Returns (turn id, seq, format, sample rate, audio) for a server audio frame."""
+    version, turn_id, seq, audio_format, sample_rate = AUDIO_HEADER.unpack_from(frame)
+    if version != AUDIO_FRAME_VERSION:
+        raise ValueError(f"Unsupported audio frame version: {version}")
+    return turn_id, seq, audio_format, sample_rate, memoryview(frame)[AUDIO_HEADER.size:]
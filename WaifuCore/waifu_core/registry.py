@@ -0,0 +1,223 @@
+# waifu_core/registry.py
+import asyncio
+import json
+import threading
+import time
+
+import numpy as np
+from waifu_core.config import service_config
+
+from typing import TYPE_CHECKING
+
+from waifu_core.models import LLMProvider
+from waifu_core.services.llm_service import create_llm_client
+
+# Provider modules pull in torch, faster-whisper, chromadb... so each is imported
+# only when its resource is first built, keeping startup (and /health) fast.
+if TYPE_CHECKING:
+    from waifu_core.services.asr_service import ASRService
+    from waifu_core.services.asr_scheduler import ASRBatchScheduler
+    from faster_whisper.vad import SileroVADModel
+    from waifu_core.services.streaming_asr import BatchedVAD
+    from waifu_core.services.memory_service import MemoryService
+    from waifu_core.services.memory_extractor import MemoryExtractor
+
+SERVICE_CONFIG = service_config()
+
+
+def _config_key(config) -> str:
+    """Stable string form of a config dict so it can be part of a registry key."""
+    return json.dumps(config, sort_keys=True, default=str)
+
+
+class ModelRegistry:
+    """
+    Process-wide home for the heavy, shareable resources (Whisper, TTS models,
+    the Chroma client, LLM API clients). Each resource is built lazily on first
+    use and then reused by every ConversationEngine, so connecting a new socket
+    only costs the per-session state.
+    """
+
+    def __init__(self, config: dict | None = None):
+        self.config = config or SERVICE_CONFIG
+        self._lock = threading.Lock()
+        self._key_locks: dict[tuple, threading.Lock] = {}
+        self._resources: dict[tuple, object] = {}
+        self._load_seconds: dict[tuple, float] = {}
+        self.warmed_up = False
+        # Resource -> why its warm-up failed; it is loaded on first use instead
+        self.warmup_failures: dict[str, str] = {}
+
+    def _get_or_create(self, kind: str, name: str, config, factory):
+        key = (kind, name, _config_key(config))
+        resource = self._resources.get(key)
+        if resource is not None:
+            return resource
+
+        # One lock per key: loading Whisper must not block a TTS lookup.
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            resource = self._resources.get(key)
+            if resource is None:
+                print(f"--- Loading shared {kind} resource '{name}' ---")
+                started = time.perf_counter()
+                resource = factory()
+                self._load_seconds[key] = time.perf_counter() - started
+                self._resources[key] = resource
+        return resource
+
+    def get_asr(self) -> "ASRService":
+        config = self.config['asr']
+
+        def factory():
+            from waifu_core.services.asr_service import ASRService
+            return ASRService(config)
+        return self._get_or_create("asr", config['model_size'], config, factory)
+
+    def get_asr_scheduler(self) -> "ASRBatchScheduler":
+        config = self.config['asr']
+
+        def factory():
+            from waifu_core.services.asr_scheduler import ASRBatchScheduler
+            return ASRBatchScheduler(
+                self.get_asr(),
+                max_batch_size=config.get('max_batch_size', 8),
+                max_wait_ms=config.get('max_wait_ms', 30),
+            )
+        return self._get_or_create("asr_scheduler", config['model_size'], config, factory)
+
+    def get_vad(self) -> "SileroVADModel | BatchedVAD":
+        def factory():
+            import faster_whisper
+            from faster_whisper.vad import get_vad_model
+            model = get_vad_model()
+            # Up to 1.2.0 it scores a batch of streams per call, from 1.2.1 a single 1-D one
+            if tuple(int(part) for part in faster_whisper.__version__.split(".")[:3]) >= (1, 2, 1):
+                from waifu_core.services.streaming_asr import BatchedVAD
+                model = BatchedVAD(model)
+            return model
+        return self._get_or_create("vad", "silero", None, factory)
+
+    def get_tts(self, tts_provider: str):
+        provider = tts_provider.lower()
+        tts_config = self.config['tts']
+        if provider == "coqui":
+            def factory():
+                from waifu_core.services.tts.coqui_tts import CoquiTTSService
+                return CoquiTTSService(config=tts_config['coqui'])
+        elif provider == "kokoro":
+            def factory():
+                from waifu_core.services.tts.kokoro_tts import KokoroTTSService
+                return KokoroTTSService(config=tts_config['kokoro'])
+        elif provider == "elevenlabs":
+            def factory():
+                from waifu_core.services.tts.elevenlabs_tts import ElevenLabsTTSService, ELEVENLABS_AVAILABLE
+                if not ELEVENLABS_AVAILABLE:
+                    raise ValueError(f"ElevenLabs TTS provider is not available. Please install the 'elevenlabs' package.")
+                return ElevenLabsTTSService(config=tts_config['elevenlabs'])
+        else:
+            raise ValueError(f"Invalid TTS provider selected: {tts_provider}")
+        return self._get_or_create("tts", provider, tts_config[provider], factory)
+
+    def get_memory(self) -> "MemoryService":
+        config = self.config['memory']
+
+        def factory():
+            from waifu_core.services.memory_service import MemoryService
+            return MemoryService()
+        return self._get_or_create("memory", config['db_path'], config, factory)
+
+    def get_memory_extractor(self) -> "MemoryExtractor":
+        config = self.config['memory'].get('extraction', {})
+
+        def factory():
+            from waifu_core.services.memory_extractor import MemoryExtractor
+            return MemoryExtractor(
+                self.get_memory(),
+                every_turns=config.get('every_turns', 3),
+                max_wait_seconds=config.get('max_wait_seconds', 60),
+            )
+        return self._get_or_create("memory_extractor", self.config['memory']['db_path'], config, factory)
+
+    def get_llm_client(self, llm_provider: LLMProvider):
+        config = self.config['llm']['models'].get(llm_provider.value)
+        return self._get_or_create("llm", llm_provider.value, config, lambda: create_llm_client(llm_provider))
+
+    async def warm_up(self, tts_providers: list[str], canned_lines: list[tuple[str, str]] = ()):
+        """
+        Loads the configured models and runs one dummy transcription and synthesis through them.
+        `canned_lines` are (text, emotion) pairs rendered into the TTS cache ahead of time,
+        in every audio format a session may negotiate.
+        """
+        print("--- Warming up shared models ---")
+        # Each resource warms up on its own: one that fails is loaded on first use instead,
+        # and the rest still get ready. Model loads block, so they run in a worker thread.
+        try:
+            async def warm_asr():
+                asr = await asyncio.to_thread(self.get_asr)
+                # One second of silence is enough to initialise Whisper's kernels.
+                silence = np.zeros(16000, dtype=np.float32)
+                await asyncio.to_thread(lambda: list(asr.model.transcribe(silence, beam_size=1)[0]))
+
+            await self._warm("asr", warm_asr())
+            await self._warm("vad", asyncio.to_thread(self.get_vad))
+
+            from waifu_core.services.tts.audio_encoding import available_formats
+            output_formats = [name for name in self.config['tts'].get('output', {}).get('formats', ["wav"])
+                              if name in available_formats()] or ["wav"]
+
+            async def warm_tts(provider: str):
+                tts = await asyncio.to_thread(self.get_tts, provider)
+                await tts.synthesize("Hello.", "neutral")
+                # Providers with their own output format (ElevenLabs' MP3) answer every session alike
+                formats = output_formats if tts.output_format == "wav" else [tts.output_format]
+                for text, emotion in canned_lines:
+                    for audio_format in formats:
+                        await tts.synthesize(text, emotion, audio_format)
+
+            for provider in tts_providers:
+                await self._warm(f"tts:{provider}", warm_tts(provider))
+            await self._warm("memory", asyncio.to_thread(self.get_memory))
+        finally:
+            self.warmed_up = True
+        if self.warmup_failures:
+            print(f"--- Warm-up complete, except for: {', '.join(self.warmup_failures)} ---")
+        else:
+            print("--- Warm-up complete ---")
+
+    async def _warm(self, name: str, warming):
+        try:
+            await warming
+        except Exception as e:
+            print(f"Warm-up of {name} failed: {e}")
+            self.warmup_failures[name] = str(e) or type(e).__name__
+
+    def find(self, kind: str):
+        """Returns an already loaded resource of `kind` without loading one, or None."""
+        for (resource_kind, _, _), resource in list(self._resources.items()):
+            if resource_kind == kind:
+                return resource
+        return None
+
+    def status(self) -> dict:
+        """Reports which resources are loaded and how long each took."""
+        loaded = [
+            {"kind": kind, "name": name, "load_seconds": round(self._load_seconds.get((kind, name, cfg), 0.0), 3)}
+            for (kind, name, cfg) in list(self._resources)
+        ]
+        return {"ready": self.warmed_up, "loaded": loaded, "failed": dict(self.warmup_failures)}
+
+
+_registry: ModelRegistry | None = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> ModelRegistry:
+    """Returns the process-wide registry, creating it on first use."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
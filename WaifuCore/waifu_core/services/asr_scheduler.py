@@ -0,0 +1,100 @@
+# waifu_core/services/asr_scheduler.py
+import bisect
+import numpy as np
+import faster_whisper
+from faster_whisper import BatchedInferencePipeline
+
+from waifu_core.batching import MicroBatcher
+from waifu_core.executors import run_in_stage
+from waifu_core.services.asr_service import ASRService, SAMPLE_RATE
+
+# Whisper's encoder window; longer utterances can't share a batch slot
+MAX_BATCHED_SECONDS = 30
+# clip_timestamps are sample indices up to faster-whisper 1.1, seconds from 1.2 on
+CLIPS_IN_SECONDS = tuple(int(part) for part in faster_whisper.__version__.split(".")[:2]) >= (1, 2)
+
+
+class ASRBatchScheduler(MicroBatcher):
+    """
+    Micro-batches transcription across sessions. Utterances that arrive within
+    `max_wait_ms` of each other (up to `max_batch_size` of them) go through
+    faster-whisper's batched inference as one CTranslate2 call, and each caller
+    gets its own transcript back from `transcribe`. Whisper decodes a whole batch
+    in one language, so unless `asr.language` is set each utterance's language is
+    detected first and utterances only share a batch with others in the same one.
+    """
+
+    def __init__(self, asr_service: ASRService, max_batch_size: int = 8, max_wait_ms: float = 30):
+        super().__init__("asr", max_batch_size, max_wait_ms)
+        self.asr_service = asr_service
+        self.pipeline = BatchedInferencePipeline(model=asr_service.model)
+
+    async def transcribe(self, audio: bytes | np.ndarray | str) -> str:
+        if self.max_batch_size <= 1:
+            return await run_in_stage("asr", self.asr_service.transcribe_audio, audio)
+
+        # Decoding is per-utterance work, so it happens before joining the batch
+        samples = await run_in_stage("asr", self.asr_service.load_audio, audio)
+        return await self.submit(samples)
+
+    def process_batch(self, utterances: list[np.ndarray]) -> list[str]:
+        texts = [""] * len(utterances)
+        batched = []
+        for i, samples in enumerate(utterances):
+            if len(samples) > MAX_BATCHED_SECONDS * SAMPLE_RATE:
+                texts[i] = self.asr_service.transcribe_audio(samples)
+            elif len(samples):
+                batched.append(i)
+        if len(batched) == 1:
+            texts[batched[0]] = self.asr_service.transcribe_audio(utterances[batched[0]])
+            return texts
+
+        by_language: dict[str, list[int]] = {}
+        for i in batched:
+            by_language.setdefault(self.asr_service.detect_language(utterances[i]), []).append(i)
+        for language, group in by_language.items():
+            if len(group) == 1:
+                texts[group[0]] = self._transcribe_one(utterances[group[0]], language)
+            else:
+                for i, text in zip(group, self._transcribe_batch([utterances[i] for i in group], language)):
+                    texts[i] = text
+        return texts
+
+    def _transcribe_one(self, samples: np.ndarray, language: str) -> str:
+        segments, _ = self.asr_service.model.transcribe(
+            samples, language=language, beam_size=self.asr_service.config.get('beam_size', 5)
+        )
+        return " ".join(segment.text for segment in segments).strip()
+
+    def _transcribe_batch(self, utterances: list[np.ndarray], language: str) -> list[str]:
+        """Transcribes utterances in one language as a single batched call."""
+        # Lay the utterances end to end, each padded with silence to a whole encoder window,
+        # and mark each one as its own clip: every clip becomes one row of the batch (1.2
+        # merges clips shorter than a window), and segment start times tell us whose it is.
+        window = MAX_BATCHED_SECONDS * SAMPLE_RATE
+        audio = np.zeros(window * len(utterances), dtype=np.float32)
+        starts, clips = [], []
+        for i, samples in enumerate(utterances):
+            offset = i * window
+            audio[offset:offset + len(samples)] = samples
+            starts.append(offset / SAMPLE_RATE)
+            if CLIPS_IN_SECONDS:
+                clips.append({"start": offset / SAMPLE_RATE, "end": (offset + window) / SAMPLE_RATE})
+            else:
+                clips.append({"start": offset, "end": offset + window})
+
+        print(f"🎯 Transcribing a batch of {len(utterances)} utterances ({language})...")
+        segments, _ = self.pipeline.transcribe(
+            audio,
+            language=language,
+            beam_size=self.asr_service.config.get('beam_size', 5),
+            clip_timestamps=clips,
+            batch_size=len(utterances),
+            without_timestamps=True,
+        )
+        parts = [[] for _ in utterances]
+        for segment in segments:
+            # Small tolerance for the sample rounding of clip boundaries
+            slot = max(bisect.bisect_right(starts, segment.start + 0.01) - 1, 0)
+            parts[slot].append(segment.text)
+        return [" ".join(part).strip() for part in parts]
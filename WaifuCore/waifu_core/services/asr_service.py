@@ -1,14 +1,19 @@
 # waifu_core/services/asr_service.py
+import io
+import numpy as np
 from faster_whisper import WhisperModel
-import yaml
-from pathlib import Path
+from faster_whisper.audio import decode_audio
+from waifu_core.config import service_config
 
-SERVICE_CONFIG = yaml.safe_load(Path("config/services.yaml").read_text())
+SERVICE_CONFIG = service_config()
+
+# Whisper expects 16 kHz mono float32 samples
+SAMPLE_RATE = 16000
 
 class ASRService:
-    def __init__(self):
+    def __init__(self, config: dict | None = None):
         print("Initializing ASR Service...")
-        self.config = SERVICE_CONFIG['asr']
+        self.config = config or SERVICE_CONFIG['asr']
         self.model = WhisperModel(
             self.config['model_size'],
             device=self.config['device'],
@@ -16,10 +21,33 @@ class ASRService:
         )
         print("ASR Service Initialized.")
 
-    def transcribe_audio(self, audio_filepath: str) -> str:
-        """Transcribes an audio file."""
+    def load_audio(self, audio: bytes | np.ndarray | str) -> np.ndarray:
+        """
+        Turns an upload into 16 kHz mono float32 samples without touching the disk.
+        Accepts encoded bytes in any container PyAV understands (webm/opus, ogg, wav...),
+        an already decoded NumPy buffer, or a file path.
+        """
+        if isinstance(audio, np.ndarray):
+            if audio.dtype == np.int16:
+                return audio.astype(np.float32) / 32768.0
+            return audio.astype(np.float32, copy=False)
+        if isinstance(audio, (bytes, bytearray, memoryview)):
+            return decode_audio(io.BytesIO(audio), sampling_rate=SAMPLE_RATE)
+        return decode_audio(audio, sampling_rate=SAMPLE_RATE)
+
+    def detect_language(self, samples: np.ndarray) -> str:
+        """The configured language, or the one Whisper hears in this utterance."""
+        if self.config.get('language'):
+            return self.config['language']
+        language, _, _ = self.model.detect_language(samples)
+        return language
+
+    def transcribe_audio(self, audio: bytes | np.ndarray | str) -> str:
+        """Transcribes encoded audio bytes, a 16 kHz float32 buffer, or an audio file."""
         print("🎯 Transcribing...")
-        segments, _ = self.model.transcribe(audio_filepath, beam_size=5)
+        samples = self.load_audio(audio)
+        segments, _ = self.model.transcribe(samples, language=self.config.get('language'),
+                                            beam_size=self.config.get('beam_size', 5))
         transcription = " ".join([segment.text for segment in segments])
         print(f"Transcription: '{transcription.strip()}'")
-        return transcription.strip()
\ No newline at end of file
+        return transcription.strip()
@@ -0,0 +1,92 @@
+# waifu_core/services/context_builder.py
+from dataclasses import dataclass
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except ImportError:
+    _ENCODING = None
+
+# Role markers and separators the chat format adds around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text: str) -> int:
+    """Token count of `text`; exact with tiktoken installed, otherwise a ~4 chars/token estimate."""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return len(text) // 4 + 1
+
+
+def _turn_tokens(turn: dict) -> int:
+    return count_tokens(turn['user']) + count_tokens(turn['assistant']) + 2 * MESSAGE_OVERHEAD_TOKENS
+
+
+@dataclass
+class Context:
+    """One prompt's worth of context, renderable for either chat-style or single-prompt providers."""
+    system: str
+    turns: list[dict]
+    user_input: str
+    first_turn: int  # Index of the oldest included turn; everything before it is left to the summary
+    tokens: int
+
+    def as_messages(self) -> list[dict]:
+        messages = [{"role": "system", "content": self.system}]
+        for turn in self.turns:
+            messages.append({"role": "user", "content": turn['user']})
+            messages.append({"role": "assistant", "content": turn['assistant']})
+        messages.append({"role": "user", "content": self.user_input})
+        return messages
+
+    def as_prompt(self) -> str:
+        parts = [f"System instructions: {self.system}"]
+        for turn in self.turns:
+            parts.append(f"User: {turn['user']}")
+            parts.append(f"Assistant: {turn['assistant']}")
+        parts.append(f"User: {self.user_input}")
+        return "\n".join(parts)
+
+
+class ContextBuilder:
+    """
+    Fills a token budget in priority order: the system prompt and the new user input
+    always go in, then as many memories as fit, then the rolling summary, then the
+    newest turns, stopping at the first turn that no longer fits.
+    """
+
+    def __init__(self, budget_tokens: int = 3000, reserve_tokens: int = 200):
+        # The reply is generated inside the same context window, so its room is set aside
+        self.available = max(budget_tokens - reserve_tokens, 0)
+
+    def build(self, system_prompt: str, memories: list[str], summary: str | None,
+              turns: list[dict], user_input: str) -> Context:
+        used = count_tokens(system_prompt) + count_tokens(user_input) + 2 * MESSAGE_OVERHEAD_TOKENS
+
+        kept_memories = []
+        for memory in memories:
+            cost = count_tokens(memory) + 1
+            if used + cost > self.available:
+                break
+            kept_memories.append(memory)
+            used += cost
+
+        system = system_prompt
+        if kept_memories:
+            system += "\n\nYou remember these facts about the user:\n- " + "\n- ".join(kept_memories)
+        if summary:
+            summary_block = f"\n\nSummary of your earlier conversation with the user:\n{summary}"
+            cost = count_tokens(summary_block)
+            if used + cost <= self.available:
+                system += summary_block
+                used += cost
+
+        first_turn = len(turns)
+        while first_turn > 0:
+            cost = _turn_tokens(turns[first_turn - 1])
+            if used + cost > self.available:
+                break
+            used += cost
+            first_turn -= 1
+
+        return Context(system, turns[first_turn:], user_input, first_turn, used)
@@ -0,0 +1,160 @@
+# waifu_core/services/history_store.py
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from urllib.parse import quote
+
+from waifu_core.config import resolve_path, service_config
+
+SERVICE_CONFIG = service_config()
+
+# Bytes read per step when scanning a history file backwards for its tail
+TAIL_BLOCK_SIZE = 8192
+
+
+def read_legacy_history(legacy_path: Path) -> list[dict]:
+    """Turn records from the old whole-file JSON history (a list of chat messages)."""
+    with open(legacy_path, "r", encoding="utf-8") as f:
+        messages = json.load(f)
+    pairs = []
+    pending_user = None
+    for message in messages:
+        if message.get("role") == "user":
+            pending_user = message["content"]
+        elif message.get("role") == "assistant" and pending_user is not None:
+            pairs.append((pending_user, message["content"]))
+            pending_user = None
+    # The old file has no timestamps. Turns a second apart, ending when the file was last
+    # written, keep them in order and older than anything said since (the rolling summary
+    # picks up turns by timestamp, so none may be 0).
+    last_written = Path(legacy_path).stat().st_mtime
+    return [
+        {"ts": last_written - (len(pairs) - i), "user": user, "assistant": assistant}
+        for i, (user, assistant) in enumerate(pairs)
+    ]
+
+
+class HistoryStore:
+    """
+    Append-only conversation history, one JSONL file per user or session. Each turn
+    is a single appended line, so saving costs the same however long the history is;
+    loading reads only the tail of the file. A file that grows past `compact_bytes`
+    is rewritten to its last `keep_turns` turns.
+    """
+
+    def __init__(self, directory: str, compact_bytes: int = 1024 * 1024, keep_turns: int = 200):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.compact_bytes = compact_bytes
+        self.keep_turns = keep_turns
+        self._lock = threading.Lock()
+        self._key_locks: dict[str, threading.Lock] = {}
+
+    def _path(self, key: str) -> Path:
+        # Percent-escaped, so no two keys share a file and none reaches outside the directory
+        # (quote() leaves "." and "~" alone; "." would also clash with the file suffixes)
+        name = quote(key, safe="-_").replace(".", "%2E").replace("~", "%7E")
+        return self.directory / f"{name}.jsonl"
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def append_turn(self, key: str, user: str, assistant: str) -> dict:
+        record = {"ts": time.time(), "user": user, "assistant": assistant}
+        with self._key_lock(key):
+            with open(self._path(key), "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                size = f.tell()
+            if size > self.compact_bytes:
+                self._compact(key)
+        return record
+
+    def load_tail(self, key: str, turns: int) -> list[dict]:
+        """Returns the last `turns` turns as {"ts", "user", "assistant"} records, oldest first."""
+        path = self._path(key)
+        if turns <= 0 or not path.exists():
+            return []
+        with self._key_lock(key):
+            lines = self._read_tail_lines(path, turns)
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A line cut short by a crash mid-write; the rest of the file is still good
+                print(f"Skipping unreadable history record in {path.name}")
+        return records
+
+    def _read_tail_lines(self, path: Path, count: int) -> list[str]:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            data = b""
+            # One extra newline is needed to know the first kept line is complete
+            while position > 0 and data.count(b"\n") <= count:
+                step = min(TAIL_BLOCK_SIZE, position)
+                position -= step
+                f.seek(position)
+                data = f.read(step) + data
+        lines = [line for line in data.decode("utf-8", errors="replace").splitlines() if line.strip()]
+        return lines[-count:]
+
+    def _compact(self, key: str):
+        """Rewrites a history file to its last `keep_turns` turns. Caller holds the key lock."""
+        path = self._path(key)
+        lines = self._read_tail_lines(path, self.keep_turns)
+        tmp_path = path.with_suffix(".jsonl.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("".join(line + "\n" for line in lines))
+        os.replace(tmp_path, path)
+        print(f"Compacted history '{key}' to its last {len(lines)} turns.")
+
+    def import_legacy(self, key: str, legacy_path: Path):
+        """
+        Converts an old whole-file JSON history (a list of chat messages) into turn
+        records. Does nothing once the key has a history of its own.
+        """
+        with self._key_lock(key):
+            path = self._path(key)
+            if path.exists():
+                return
+            records = read_legacy_history(legacy_path)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+        print(f"Imported {len(records)} turns from '{legacy_path}' into history '{key}'.")
+
+    def load_summary(self, key: str) -> tuple[str | None, float]:
+        """Returns the cached rolling summary and the timestamp of the last turn it covers."""
+        try:
+            data = json.loads(self._path(key).with_suffix(".summary.json").read_text(encoding="utf-8"))
+            return data.get("summary"), data.get("through_ts", 0.0)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None, 0.0
+
+    def save_summary(self, key: str, summary: str, through_ts: float):
+        path = self._path(key).with_suffix(".summary.json")
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"summary": summary, "through_ts": through_ts}, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+
+_store: HistoryStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_history_store() -> HistoryStore:
+    """Returns the process-wide history store configured in services.yaml."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = SERVICE_CONFIG.get('history', {})
+                _store = HistoryStore(
+                    directory=resolve_path(config.get('dir', 'waifu_core/history')),
+                    compact_bytes=config.get('compact_bytes', 1024 * 1024),
+                    keep_turns=config.get('keep_turns', 200),
+                )
+    return _store
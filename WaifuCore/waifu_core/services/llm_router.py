@@ -0,0 +1,213 @@
+# waifu_core/services/llm_router.py
+import asyncio
+import statistics
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Callable
+
+from waifu_core.config import service_config
+
+SERVICE_CONFIG = service_config()
+
+# (provider key, function starting a fresh reply stream from that provider)
+Attempt = tuple[str, Callable[[], AsyncIterator[str]]]
+
+
+class ProviderStats:
+    """Rolling first-token latency and error rate of one provider/model."""
+
+    def __init__(self, window: int):
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.outcomes: deque[bool] = deque(maxlen=window)  # True for a failed request
+        self.last_error_at = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.wins = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.cancelled = 0
+
+    def record_latency(self, seconds: float):
+        self.latencies.append(seconds)
+
+    def record_outcome(self, failed: bool):
+        self.outcomes.append(failed)
+        if failed:
+            self.errors += 1
+            self.last_error_at = time.monotonic()
+
+    def error_rate(self) -> float:
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def p50(self) -> float:
+        return statistics.median(self.latencies) if self.latencies else 0.0
+
+    def p95(self) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[round(0.95 * (len(ordered) - 1))]
+
+    def as_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate(), 3),
+            "first_token_p50_ms": round(self.p50() * 1000, 1),
+            "first_token_p95_ms": round(self.p95() * 1000, 1),
+            "wins": self.wins,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "cancelled": self.cancelled,
+        }
+
+
+class LLMRouter:
+    """
+    Orders LLM providers by their recent first-token latency and error rate, and
+    streams a reply from the best one. If no token has arrived `hedge_after_ms`
+    after a request started, the next provider is asked as well; the first to
+    produce a token wins and the other request is cancelled. A provider that fails
+    before its first token is failed over to the same way.
+    """
+
+    def __init__(self, config: dict | None = None):
+        config = SERVICE_CONFIG['llm'].get('routing', {}) if config is None else config
+        self.hedge_after = config.get('hedge_after_ms', 1500) / 1000
+        self.max_attempts = max(config.get('max_attempts', 2), 1)
+        self.prefer_session_provider = config.get('prefer_session_provider', True)
+        self.window = config.get('window', 50)
+        self.max_error_rate = config.get('max_error_rate', 0.5)
+        self.min_samples = config.get('min_samples', 4)
+        self.cooldown_seconds = config.get('cooldown_seconds', 30)
+        self._stats: dict[str, ProviderStats] = {}
+        self._lock = threading.Lock()
+
+    def _get_stats(self, key: str) -> ProviderStats:
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = ProviderStats(self.window)
+            return stats
+
+    def is_healthy(self, key: str) -> bool:
+        stats = self._get_stats(key)
+        if len(stats.outcomes) < self.min_samples or stats.error_rate() <= self.max_error_rate:
+            return True
+        # Unhealthy providers get another chance once they have been quiet for a while
+        return time.monotonic() - stats.last_error_at >= self.cooldown_seconds
+
+    def rank(self, preferred: str, candidates: list[str]) -> list[str]:
+        """Healthy providers before unhealthy ones, faster before slower; untried ones count as fast."""
+        def score(key: str) -> tuple[bool, float]:
+            return not self.is_healthy(key), self._get_stats(key).p50()
+
+        others = sorted((key for key in dict.fromkeys(candidates) if key != preferred), key=score)
+        if self.prefer_session_provider and self.is_healthy(preferred):
+            return [preferred] + others
+        return sorted([preferred] + others, key=score)
+
+    async def stream(self, attempts: list[Attempt]) -> AsyncIterator[str]:
+        """Yields the reply of whichever attempt produces a first token first."""
+        queue = list(attempts[:self.max_attempts])
+        # __anext__ task -> (key, stream, started, is_hedge)
+        pending: dict[asyncio.Future, tuple[str, AsyncIterator[str], float, bool]] = {}
+        last_error: Exception | None = None
+
+        def launch(hedge: bool):
+            key, start = queue.pop(0)
+            stream = start()
+            stats = self._get_stats(key)
+            stats.requests += 1
+            if hedge:
+                stats.hedges += 1
+                print(f"⏱️ No token yet, hedging with {key}")
+            pending[asyncio.ensure_future(stream.__anext__())] = (key, stream, time.monotonic(), hedge)
+
+        async def cancel(task: asyncio.Future):
+            key, stream, started, _ = pending.pop(task)
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+            await stream.aclose()
+            stats = self._get_stats(key)
+            stats.cancelled += 1
+            # Slower than the winner by at least this much, which is worth remembering
+            stats.record_latency(time.monotonic() - started)
+
+        winner = None
+        try:
+            launch(hedge=False)
+            while winner is None:
+                if not pending:
+                    if queue:
+                        launch(hedge=False)  # Fail over to the next provider
+                        continue
+                    raise last_error or RuntimeError("No LLM provider available")
+                latest_start = max(started for _, _, started, _ in pending.values())
+                timeout = max(latest_start + self.hedge_after - time.monotonic(), 0) if queue else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch(hedge=True)
+                    continue
+                for task in done:
+                    if winner is not None:
+                        await cancel(task)
+                        continue
+                    key, stream, started, hedge = pending.pop(task)
+                    stats = self._get_stats(key)
+                    try:
+                        first = task.result()
+                    except StopAsyncIteration:
+                        first = ""
+                    except Exception as e:
+                        print(f"LLM provider {key} failed: {e}")
+                        stats.record_outcome(failed=True)
+                        last_error = e
+                        continue
+                    stats.record_latency(time.monotonic() - started)
+                    stats.wins += 1
+                    if hedge:
+                        stats.hedge_wins += 1
+                    winner = (key, stream, first)
+            for task in list(pending):
+                await cancel(task)
+
+            key, stream, first = winner
+            try:
+                if first:
+                    yield first
+                async for delta in stream:
+                    yield delta
+            except Exception:
+                self._get_stats(key).record_outcome(failed=True)
+                raise
+            self._get_stats(key).record_outcome(failed=False)
+        finally:
+            # Also reached when the consumer stops early
+            for task in list(pending):
+                await cancel(task)
+            if winner is not None:
+                await winner[1].aclose()
+
+    def stats(self) -> dict:
+        with self._lock:
+            items = list(self._stats.items())
+        return {key: dict(stats.as_dict(), healthy=self.is_healthy(key)) for key, stats in items}
+
+
+_router: LLMRouter | None = None
+_router_lock = threading.Lock()
+
+
+def get_llm_router() -> LLMRouter:
+    """Returns the process-wide router, so latency stats are shared by every session."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = LLMRouter()
+    return _router
@@ -1,29 +1,39 @@
 # waifu_core/services/llm_service.py
-import json
 import re
 import os
 from pathlib import Path
 from waifu_core.models import LLMProvider
-import yaml
+from waifu_core.services.session_state import get_session_state
+from waifu_core.services.context_builder import Context, ContextBuilder
+from waifu_core.services.llm_router import get_llm_router
+from waifu_core.config import resolve_path, service_config, character_config
+from waifu_core.http_pool import get_http_pool
+from waifu_core.metrics import span
 import ast
+import asyncio
 
-# Import different clients
-try:
-    import google.generativeai as genai
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
-    print("Google Generative AI library not found. Install with: pip install google-generativeai")
+# Client libraries are imported when their provider is first used; google-generativeai alone takes seconds
+genai = None
 
-try:
-    from openai import AsyncOpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
-    print("OpenAI library not found. Install with: pip install openai")
+def _import_gemini():
+    global genai
+    if genai is None:
+        try:
+            import google.generativeai
+        except ImportError:
+            raise ImportError("Google Generative AI library not found. Install with: pip install google-generativeai")
+        genai = google.generativeai
+    return genai
+
+def _import_openai():
+    try:
+        from openai import AsyncOpenAI
+    except ImportError:
+        raise ImportError("OpenAI library required for Groq and Ollama. Install with: pip install openai")
+    return AsyncOpenAI
 
-SERVICE_CONFIG = yaml.safe_load(Path("config/services.yaml").read_text())
-CHARACTER_CONFIG = yaml.safe_load(Path("config/character.yaml").read_text())
+SERVICE_CONFIG = service_config()
+CHARACTER_CONFIG = character_config()
 
 def _load_dotenv_if_present() -> None:
     current_dir = Path(__file__).resolve().parent
@@ -48,113 +58,279 @@ def _load_dotenv_if_present() -> None:
             return
     print("--- .env file not found in candidate paths. Relying on system environment variables. ---")
 
+def create_llm_client(provider: LLMProvider):
+    """Builds the API client for a provider. Clients are stateless, so one can serve every session."""
+    _load_dotenv_if_present()
+
+    if provider == LLMProvider.GEMINI:
+        return _init_gemini(provider)
+    elif provider.value.startswith("groq-"):
+        return _init_groq()
+    elif provider == LLMProvider.OLLAMA:
+        return _init_ollama()
+    else:
+        raise ValueError(f"Unsupported LLM provider: {provider}")
+
+def _init_gemini(provider: LLMProvider):
+    """Initialize Gemini AI client"""
+    _import_gemini()
+    
+    api_key = os.environ.get("GEMINI_API_KEY") or SERVICE_CONFIG.get('gemini_api_key')
+    if not api_key:
+        raise ValueError("Gemini API key not found. Set GEMINI_API_KEY environment variable or add to services.yaml")
+    
+    genai.configure(api_key=api_key)
+    model = genai.GenerativeModel(SERVICE_CONFIG['llm']['models'][provider.value])
+    print("Gemini AI client initialized")
+    return model
+
+def _init_groq():
+    """Initialize Groq client"""
+    AsyncOpenAI = _import_openai()
+    
+    api_key = os.environ.get("GROQ_API_KEY")
+    if not api_key:
+        raise ValueError("Groq API key not found")
+    
+    base_url = os.environ.get("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
+    return AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=get_http_pool().get_async_client(base_url)
+    )
+
+def _init_ollama():
+    """Initialize Ollama client"""
+    AsyncOpenAI = _import_openai()
+    
+    ollama_host = os.environ.get("OLLAMA_HOST_URL", "http://localhost:11434")
+    client = AsyncOpenAI(
+        api_key="ollama",
+        base_url=f"{ollama_host}/v1",
+        http_client=get_http_pool().get_async_client(ollama_host)
+    )
+    print(f"Ollama client configured to use base URL: {ollama_host}/v1")
+    return client
+
 class LLMService:
-    def __init__(self, provider: LLMProvider):
+    def __init__(self, provider: LLMProvider, client=None, history_key: str = "user", client_factory=None):
         print(f"Initializing LLM Service with provider: {provider.value.upper()}")
         self.config = SERVICE_CONFIG['llm']
         self.character = CHARACTER_CONFIG
         self.provider = provider
         
-        _load_dotenv_if_present()
-
+        # The client may be shared (see ModelRegistry); only the history is per-session.
+        if client is None:
+            client = create_llm_client(provider)
         if self.provider == LLMProvider.GEMINI:
-            self._init_gemini()
-        elif self.provider.value.startswith("groq-"):
-            self._init_groq()
-        elif self.provider == LLMProvider.OLLAMA:
-            self._init_ollama()
+            _import_gemini()
+            self.model = client
         else:
-            raise ValueError(f"Unsupported LLM provider: {provider}")
+            self.client = client
+
+        # Routing mode: the reply may come from another provider when this one is slow or failing
+        self.routing_config = self.config.get('routing', {})
+        self.routing = self.routing_config.get('enabled', False)
+        self.router = get_llm_router() if self.routing else None
+        self.client_factory = client_factory or create_llm_client
+        self._route_clients = {provider: client}
         
-        self.history_path = Path(self.character['history_file'])
-        self.history_path.parent.mkdir(exist_ok=True, parents=True)
-        self.history = self._load_history()
+        # History is appended per turn to a store keyed by user/session; only the tail is kept in memory.
+        # With a shared state backend every worker reads and writes the same history.
+        self.history_key = history_key
+        self.history_store = get_session_state().history
+        self.history_turns = SERVICE_CONFIG.get('history', {}).get('tail_turns', 20)
+        self.turns = self._load_history()
+
+        # Prompts are built to a token budget; turns that fall out of it are folded into a rolling summary
+        self.context_config = self.config.get('context', {})
+        self.context_builder = ContextBuilder(
+            budget_tokens=self.context_config.get('budget_tokens', 3000),
+            reserve_tokens=self.config['max_tokens'],
+        )
+        self.summary, self.summary_through = self.history_store.load_summary(self.history_key)
+        self._summary_backlog: list[dict] = []
+        self._summary_queued_through = self.summary_through
+        self._summary_task: asyncio.Task | None = None
+        self._window_start = 0
+        self.last_turn = None
         print("LLM Service Initialized.")
 
-    def _init_gemini(self):
-        """Initialize Gemini AI client"""
-        if not GEMINI_AVAILABLE:
-            raise ImportError("Google Generative AI library not found. Install with: pip install google-generativeai")
-        
-        api_key = os.environ.get("GEMINI_API_KEY") or SERVICE_CONFIG.get('gemini_api_key')
-        if not api_key:
-            raise ValueError("Gemini API key not found. Set GEMINI_API_KEY environment variable or add to services.yaml")
-        
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel(self.config['models'][self.provider.value])
-        print("Gemini AI client initialized")
-
-    def _init_groq(self):
-        """Initialize Groq client"""
-        if not OPENAI_AVAILABLE:
-            raise ImportError("OpenAI library required for Groq. Install with: pip install openai")
-        
-        api_key = os.environ.get("GROQ_API_KEY")
-        if not api_key:
-            raise ValueError("Groq API key not found")
-        
-        self.client = AsyncOpenAI(
-            api_key=api_key,
-            base_url="https://api.groq.com/openai/v1"
+    def _load_history(self):
+        # One-time migration of the old single-file history into the default user's store
+        legacy_path = resolve_path(self.character['history_file'])
+        if self.history_key == "user" and legacy_path.exists():
+            self.history_store.import_legacy(self.history_key, legacy_path)
+
+        return self.history_store.load_tail(self.history_key, self.history_turns)
+
+    async def _save_turn(self, user_input: str, assistant_message: str):
+        # The append is a disk write (or a round trip to Redis); keep it off the event loop
+        self.last_turn = await asyncio.to_thread(
+            self.history_store.append_turn, self.history_key, user_input, assistant_message
         )
+        self.turns.append(self.last_turn)
+        # Turns outside the last prompt's window, or about to leave memory, belong in the summary
+        overflow = max(self._window_start, len(self.turns) - self.history_turns)
+        self._queue_for_summary(self.turns[:overflow])
+        # The store keeps everything; memory only needs the turns that can still reach a prompt
+        if len(self.turns) > self.history_turns:
+            self._window_start = max(self._window_start - (len(self.turns) - self.history_turns), 0)
+            self.turns = self.turns[-self.history_turns:]
 
-    def _init_ollama(self):
-        """Initialize Ollama client"""
-        if not OPENAI_AVAILABLE:
-            raise ImportError("OpenAI library required for Ollama. Install with: pip install openai")
-        
-        ollama_host = os.environ.get("OLLAMA_HOST_URL", "http://localhost:11434")
-        self.client = AsyncOpenAI(
-            api_key="ollama",
-            base_url=f"{ollama_host}/v1"
+    def _build_context(self, user_input: str, memories: list[str]):
+        context = self.context_builder.build(
+            self.character['system_prompt'], memories, self.summary, self.turns, user_input
         )
-        print(f"Ollama client configured to use base URL: {ollama_host}/v1")
+        self._window_start = context.first_turn
+        return context
 
-    def _load_history(self):
-        if self.history_path.exists():
-            with open(self.history_path, "r", encoding='utf-8') as f:
-                return json.load(f)
-        return [{"role": "system", "content": self.character['system_prompt']}]
+    def _queue_for_summary(self, turns: list[dict]):
+        for turn in turns:
+            if (turn['ts'] or 0) > self._summary_queued_through:
+                self._summary_backlog.append(turn)
+                self._summary_queued_through = turn['ts']
+        min_turns = self.context_config.get('summary_min_turns', 4)
+        if len(self._summary_backlog) >= min_turns and (self._summary_task is None or self._summary_task.done()):
+            # Runs after the reply has gone out; the next prompt picks up the new summary
+            self._summary_task = asyncio.create_task(self._update_summary())
+
+    async def _update_summary(self):
+        """Folds the queued turns into the rolling summary with one incremental LLM call."""
+        turns, self._summary_backlog = self._summary_backlog, []
+        conversation_log = "\n".join(f"user: {t['user']}\nassistant: {t['assistant']}" for t in turns)
+        prompt = self.character['summary_prompt'].format(
+            summary=self.summary or "(nothing yet)", conversation_log=conversation_log
+        )
+        print(f"📚 Folding {len(turns)} older turns into the conversation summary...")
+        with span("summary"):
+            summary = await self._complete(prompt, self.context_config.get('summary_max_tokens', 200))
+        if not summary:
+            # Keep the turns for the next attempt
+            self._summary_backlog = turns + self._summary_backlog
+            return
+        self.summary = summary.strip()
+        self.summary_through = turns[-1]['ts'] or 0
+        await asyncio.to_thread(self.history_store.save_summary, self.history_key, self.summary, self.summary_through)
+
+    async def _complete(self, prompt: str, max_tokens: int) -> str | None:
+        """One-off, deterministic completion for housekeeping prompts."""
+        try:
+            if self.provider == LLMProvider.GEMINI:
+                response = await self.model.generate_content_async(
+                    prompt,
+                    generation_config=genai.types.GenerationConfig(temperature=0.0, max_output_tokens=max_tokens)
+                )
+                return response.text
+            response = await self.client.chat.completions.create(
+                model=self.config['models'][self.provider.value],
+                messages=[{"role": "system", "content": prompt}],
+                temperature=0.0,
+                max_tokens=max_tokens,
+            )
+            return response.choices[0].message.content
+        except Exception as e:
+            print(f"LLM completion error: {e}")
+            return None
+
+    def _route_client(self, provider: LLMProvider):
+        """The client for a routing candidate, or None if it can't be created (e.g. no API key)."""
+        if provider not in self._route_clients:
+            try:
+                self._route_clients[provider] = self.client_factory(provider)
+            except Exception as e:
+                print(f"LLM provider {provider.value} unavailable for routing: {e}")
+                self._route_clients[provider] = None
+        return self._route_clients[provider]
+
+    def _stream_from(self, provider: LLMProvider, client, context: Context):
+        if provider == LLMProvider.GEMINI:
+            return self._stream_gemini_response(context, client)
+        return self._stream_openai_compatible_response(context, client, provider)
 
-    def _save_history(self):
-        with open(self.history_path, "w", encoding='utf-8') as f:
-            json.dump(self.history, f, indent=2, ensure_ascii=False)
+    def _routed_stream(self, context: Context):
+        """Streams the reply through the router, hedging across the configured providers."""
+        candidates = []
+        for value in self.routing_config.get('providers', []):
+            try:
+                candidates.append(LLMProvider(value))
+            except ValueError:
+                print(f"Unknown LLM provider in routing config: {value}")
+        by_key = {provider.value: provider for provider in [self.provider] + candidates}
+        attempts = []
+        for key in self.router.rank(self.provider.value, list(by_key)):
+            client = self._route_client(by_key[key])
+            if client is not None:
+                # Bind the loop variables now; the router starts streams lazily
+                attempts.append((key, lambda provider=by_key[key], client=client: self._stream_from(provider, client, context)))
+        return self.router.stream(attempts)
+
+    async def _generate_routed_response(self, context: Context) -> tuple[str, str | None, str]:
+        try:
+            assistant_message = "".join([delta async for delta in self._routed_stream(context)])
+        except Exception as e:
+            print(f"LLM routing error: {e}")
+            return "neutral", None, "I'm sorry, I'm having trouble thinking right now. Could you try again?"
+        await self._save_turn(context.user_input, assistant_message)
+        return self._parse_response(assistant_message)
 
     async def generate_response(self, user_input: str, memories: list[str]) -> tuple[str, str | None, str]:
         print("🧠 Thinking...")
+        self.last_turn = None
+        context = self._build_context(user_input, memories)
         
-        memory_context = "You remember these facts about the user:\n- " + "\n- ".join(memories) if memories else ""
-        full_user_input = f"{memory_context}\n\nUser: {user_input}".strip()
-        
+        if self.routing:
+            return await self._generate_routed_response(context)
         if self.provider == LLMProvider.GEMINI:
-            return await self._generate_gemini_response(full_user_input)
+            return await self._generate_gemini_response(context)
         else:
-            return await self._generate_openai_compatible_response(full_user_input)
+            return await self._generate_openai_compatible_response(context)
 
-    async def _generate_gemini_response(self, user_input: str) -> tuple[str, str | None, str]:
-        """Generate response using Gemini API"""
-        # For Gemini, we need to handle conversation differently
-        # Convert history to Gemini format
-        conversation_parts = []
-        
-        # Add system prompt as first message
-        system_prompt = self.character['system_prompt']
-        conversation_parts.append(f"System instructions: {system_prompt}")
+    async def stream_response(self, user_input: str, memories: list[str]):
+        """
+        Streaming counterpart of generate_response: yields text deltas as the provider
+        produces them. Once the stream is exhausted the turn is saved to history and the
+        parsed (emotion, action, text) tuple is available as `self.last_response`; a reply
+        the provider broke off part-way is not saved.
+        """
+        print("🧠 Thinking (streaming)...")
+        self.last_response = None
+        self.last_turn = None
+        context = self._build_context(user_input, memories)
         
-        # Add conversation history (last few messages)
-        for msg in self.history[-6:]:  # Keep last 6 messages for context
-            if msg['role'] == 'system':
-                continue
-            elif msg['role'] == 'user':
-                conversation_parts.append(f"User: {msg['content']}")
-            elif msg['role'] == 'assistant':
-                conversation_parts.append(f"Assistant: {msg['content']}")
+        if self.routing:
+            deltas = self._routed_stream(context)
+        else:
+            deltas = self._stream_from(self.provider, self._route_clients[self.provider], context)
         
-        # Add current user input
-        conversation_parts.append(f"User: {user_input}")
+        chunks = []
+        try:
+            async for delta in deltas:
+                chunks.append(delta)
+                yield delta
+        except Exception as e:
+            print(f"LLM streaming error: {e}")
+            if not chunks:
+                # Nothing reached the user yet, so fall back like the non-streaming path does
+                fallback = "I'm sorry, I'm having trouble thinking right now. Could you try again?"
+                self.last_response = ("neutral", None, fallback)
+                yield fallback
+                return
+            # The reply broke off: finish saying what was sent, but a truncated reply isn't
+            # kept in the history or mined for memories (last_turn stays None)
+            self.last_response = self._parse_response("".join(chunks))
+            return
+        finally:
+            # Stops the provider request at once if the turn is cancelled mid-reply
+            await deltas.aclose()
         
-        # Create the full prompt
-        full_prompt = "\n".join(conversation_parts)
+        assistant_message = "".join(chunks)
+        await self._save_turn(user_input, assistant_message)
+        self.last_response = self._parse_response(assistant_message)
+
+    async def _generate_gemini_response(self, context: Context) -> tuple[str, str | None, str]:
+        """Generate response using Gemini API"""
+        full_prompt = context.as_prompt()
         
         try:
             # Use Gemini's generate_content method
@@ -169,9 +345,7 @@ class LLMService:
             assistant_message = response.text
             
             # Update history
-            self.history.append({"role": "user", "content": user_input})
-            self.history.append({"role": "assistant", "content": assistant_message})
-            self._save_history()
+            await self._save_turn(context.user_input, assistant_message)
             
             return self._parse_response(assistant_message)
             
@@ -180,25 +354,58 @@ class LLMService:
             # Fallback response
             return "neutral", None, "I'm sorry, I'm having trouble thinking right now. Could you try again?"
 
-    async def _generate_openai_compatible_response(self, user_input: str) -> tuple[str, str | None, str]:
-        """Generate response using OpenAI-compatible APIs (Groq, Ollama)"""
-        self.history.append({"role": "user", "content": user_input})
+    async def _stream_gemini_response(self, context: Context, model):
+        """Stream a response from the Gemini API"""
+        response = await model.generate_content_async(
+            context.as_prompt(),
+            generation_config=genai.types.GenerationConfig(
+                temperature=self.config['temperature'],
+                max_output_tokens=self.config['max_tokens'],
+            ),
+            stream=True,
+        )
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # No text part (e.g. a safety block or a finish-only chunk)
+                continue
+            if text:
+                yield text
 
+    async def _generate_openai_compatible_response(self, context: Context) -> tuple[str, str | None, str]:
+        """Generate response using OpenAI-compatible APIs (Groq, Ollama)"""
         response = await self.client.chat.completions.create(
             model=self.config['models'][self.provider.value],
-            messages=self.history,
+            messages=context.as_messages(),
             temperature=self.config['temperature'],
             max_tokens=self.config['max_tokens'],
         )
         
         assistant_message = response.choices[0].message.content
-        self.history.append({"role": "assistant", "content": assistant_message})
-        self._save_history()
+        await self._save_turn(context.user_input, assistant_message)
 
         return self._parse_response(assistant_message)
 
-    def _parse_response(self, assistant_message: str) -> tuple[str, str | None, str]:
-        """Parse emotion, action, and text from assistant response"""
+    async def _stream_openai_compatible_response(self, context: Context, client, provider: LLMProvider):
+        """Stream a response from OpenAI-compatible APIs (Groq, Ollama)"""
+        stream = await client.chat.completions.create(
+            model=self.config['models'][provider.value],
+            messages=context.as_messages(),
+            temperature=self.config['temperature'],
+            max_tokens=self.config['max_tokens'],
+            stream=True,
+        )
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+        finally:
+            # Hands the connection back to the pool when a hedged request is cancelled
+            await stream.close()
+
+    def split_tags(self, assistant_message: str) -> tuple[str, str | None, str]:
         emotion = "neutral"
         action = None
         text = assistant_message
@@ -215,12 +422,35 @@ class LLMService:
             action = action_match.group(1).lower()
             text = text[action_match.end():].lstrip()
         
-        print(f"LLM Response (Emotion: {emotion}, Action: {action}): '{text.strip()}'")
         return emotion, action, text.strip()
 
-    async def extract_memories(self) -> list[str]:
+    def _parse_response(self, assistant_message: str) -> tuple[str, str | None, str]:
+        """Parse emotion, action, and text from assistant response"""
+        emotion, action, text = self.split_tags(assistant_message)
+        print(f"LLM Response (Emotion: {emotion}, Action: {action}): '{text}'")
+        return emotion, action, text
+
+    def visible_text(self, partial_message: str) -> str | None:
+        """
+        Returns the user-facing part of a partially streamed reply, or None while the
+        leading [emotion]/[action:...] tags are still arriving and can't be stripped yet.
+        """
+        remainder = partial_message
+        for _ in range(2):
+            if not remainder.startswith("["):
+                break
+            if "]" not in remainder:
+                return None
+            remainder = remainder[remainder.index("]") + 1:].lstrip()
+        if not remainder:
+            return None
+        return self.split_tags(partial_message)[2] or None
+
+    async def extract_memories(self, turns: list[dict] | None = None) -> list[str]:
+        """Extracts facts about the user from `turns` (default: the last two) with one prompt."""
         print("📝 Checking for new memories...")
-        conversation_log = "\n".join([f"{msg['role']}: {msg['content']}" for msg in self.history[-4:]])
+        turns = self.turns[-2:] if turns is None else turns
+        conversation_log = "\n".join(f"user: {t['user']}\nassistant: {t['assistant']}" for t in turns)
         
         prompt = self.character['memory_extraction_prompt'].format(conversation_log=conversation_log)
         
@@ -0,0 +1,117 @@
+# waifu_core/services/memory_extractor.py
+import asyncio
+import time
+from typing import TYPE_CHECKING
+
+from waifu_core.executors import current_session, run_in_stage
+from waifu_core.metrics import span
+
+if TYPE_CHECKING:
+    from waifu_core.services.memory_service import MemoryService
+
+
+class MemoryExtractor:
+    """
+    Background worker that turns finished conversation turns into long-term memories.
+    Turns are queued per user and extracted in groups: once a user has `every_turns`
+    pending turns, or the oldest has waited `max_wait_seconds`, all of them go into a
+    single extraction prompt. Facts from every user extracted in the same pass are
+    written to Chroma with one collection.add.
+    """
+
+    def __init__(self, memory_service: "MemoryService", every_turns: int = 3, max_wait_seconds: float = 60):
+        self.memory_service = memory_service
+        self.every_turns = max(every_turns, 1)
+        self.max_wait_seconds = max_wait_seconds
+        # user_id -> (llm_service, [turns], time the first pending turn arrived)
+        self._pending: dict[str, tuple[object, list[dict], float]] = {}
+        self._flush_requested: set[str] = set()
+        self._wake: asyncio.Event | None = None
+        self._worker: asyncio.Task | None = None
+        self.turns = 0
+        self.prompts = 0
+        self.facts = 0
+
+    def submit(self, llm_service, user_id: str, turn: dict):
+        """Queues a finished turn; returns immediately."""
+        if self._worker is None or self._worker.done():
+            self._wake = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+        _, turns, first_seen = self._pending.get(user_id, (None, [], time.monotonic()))
+        turns.append(turn)
+        # The newest session's client does the extraction for everything the user has pending
+        self._pending[user_id] = (llm_service, turns, first_seen)
+        self.turns += 1
+        if len(turns) >= self.every_turns:
+            self._wake.set()
+
+    def request_flush(self, user_id: str):
+        """Extracts a user's pending turns at the next opportunity, e.g. when their session ends."""
+        if user_id in self._pending and self._wake is not None:
+            self._flush_requested.add(user_id)
+            self._wake.set()
+
+    async def drain(self):
+        """Extracts everything still pending; used at shutdown."""
+        if self._pending:
+            await self._extract(list(self._pending))
+
+    def _due(self) -> list[str]:
+        now = time.monotonic()
+        return [
+            user_id for user_id, (_, turns, first_seen) in self._pending.items()
+            if len(turns) >= self.every_turns
+            or now - first_seen >= self.max_wait_seconds
+            or user_id in self._flush_requested
+        ]
+
+    async def _run(self):
+        # Extraction serves every session; its executor calls are shared background work
+        current_session.set(None)
+        while True:
+            timeout = None
+            if self._pending:
+                oldest = min(first_seen for _, _, first_seen in self._pending.values())
+                timeout = max(oldest + self.max_wait_seconds - time.monotonic(), 0)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            due = self._due()
+            if due:
+                await self._extract(due)
+
+    async def _extract(self, user_ids: list[str]):
+        with span("memory_extraction"):
+            await self._extract_batches(user_ids)
+
+    async def _extract_batches(self, user_ids: list[str]):
+        batches = {user_id: self._pending.pop(user_id) for user_id in user_ids if user_id in self._pending}
+        self._flush_requested.difference_update(user_ids)
+
+        async def extract(llm_service, turns):
+            try:
+                return await llm_service.extract_memories(turns)
+            except Exception as e:
+                print(f"Memory extraction failed: {e}")
+                return []
+
+        results = await asyncio.gather(*(extract(llm, turns) for llm, turns, _ in batches.values()))
+        self.prompts += len(batches)
+        facts_by_user = {user_id: facts for user_id, facts in zip(batches, results) if facts}
+        if not facts_by_user:
+            return
+        self.facts += sum(len(facts) for facts in facts_by_user.values())
+        try:
+            await run_in_stage("embedding", self.memory_service.add_memory_batch, facts_by_user)
+        except Exception as e:
+            print(f"Storing extracted memories failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "pending_turns": sum(len(turns) for _, turns, _ in self._pending.values()),
+            "turns": self.turns,
+            "prompts": self.prompts,
+            "facts": self.facts,
+        }
@@ -1,12 +1,37 @@
 # waifu_core/services/memory_service.py
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
 import chromadb
+import numpy as np
 from chromadb.utils import embedding_functions
 from waifu_core.models import LLMProvider
-import yaml
-from pathlib import Path
+from waifu_core.services.vector_index import MemmapVectorIndex
+from waifu_core.services.session_state import get_session_state
+from waifu_core.config import service_config
 
 # Load config here to avoid circular dependency with engine
-SERVICE_CONFIG = yaml.safe_load(Path("config/services.yaml").read_text())
+SERVICE_CONFIG = service_config()
+
+def normalize_fact(fact: str) -> str:
+    """Case, whitespace and trailing punctuation don't make a fact different."""
+    return re.sub(r"\s+", " ", fact).strip().rstrip(".!?").strip().lower()
+
+def memory_id(user_id: str, fact: str) -> str:
+    """Content-derived ID, stable across processes (unlike the salted built-in hash())."""
+    digest = hashlib.sha256(normalize_fact(fact).encode("utf-8")).hexdigest()[:32]
+    return f"{user_id}_{digest}"
+
+def _running_average(average: float, sample: float) -> float:
+    return sample if average == 0.0 else 0.9 * average + 0.1 * sample
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    embeddings = np.atleast_2d(embeddings)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
 
 class MemoryService:
     def __init__(self):
@@ -14,42 +39,217 @@ class MemoryService:
         self.config = SERVICE_CONFIG['memory']
         self.embedding_function = embedding_functions.DefaultEmbeddingFunction()
         
-        self.client = chromadb.PersistentClient(path=self.config['db_path'])
+        # PersistentClient is single-process; several workers share a Chroma server instead
+        chroma_url = self.config.get('chroma_url')
+        if chroma_url:
+            url = urlparse(chroma_url)
+            self.client = chromadb.HttpClient(host=url.hostname, port=url.port or 8000, ssl=url.scheme == "https")
+        else:
+            self.client = chromadb.PersistentClient(path=self.config['db_path'])
         
         self.collection = self.client.get_or_create_collection(
             name="yuki_memories",
             embedding_function=self.embedding_function
         )
+
+        # Other workers may add memories; a per-user generation in the shared state says when they did
+        self.state = get_session_state()
+        self._shared_generations: dict[str, int] = {}
+
+        # Optional "memmap" backend: Chroma stays the system of record, reads come from per-user matrices
+        self.index = None
+        if self.config.get('backend', 'chroma') == 'memmap':
+            if self.state.shared:
+                # The matrices only ever grow from this process's own writes
+                print("The memmap memory index is per-process; with shared session state, memories are queried from Chroma.")
+            else:
+                self.index = MemmapVectorIndex(self.config.get('index_dir', f"{self.config['db_path']}/memmap_index"))
+
+        # Repeated inputs ("Hi", "hello") are common, so query embeddings and per-user results are cached
+        self._lock = threading.Lock()
+        self._query_embeddings: OrderedDict[str, list[float]] = OrderedDict()
+        self._results: dict[str, OrderedDict[str, list[str]]] = {}
+        self._generations: dict[str, int] = {}
+        self.counters = {
+            "fast_path": 0, "result_hits": 0, "result_misses": 0,
+            "embedding_hits": 0, "embedding_misses": 0, "seconds_saved": 0.0,
+        }
+        # Running averages of what a miss costs, used to estimate the time the caches save
+        self._embed_seconds = 0.0
+        self._query_seconds = 0.0
         print("Long-Term Memory Service ready.")
 
     def add_memories(self, facts: list[str], user_id: str = "user"):
-        if not facts:
+        self.add_memory_batch({user_id: facts})
+
+    def add_memory_batch(self, facts_by_user: dict[str, list[str]]):
+        """
+        Stores facts for any number of users with one existence check and one collection.add.
+        A fact whose embedding is within `dedupe_similarity` of one the user already has (or of
+        another fact in the same batch) is merged into it instead of being stored again.
+        """
+        entries = {}
+        for user_id, user_facts in facts_by_user.items():
+            for fact in user_facts:
+                entries.setdefault(memory_id(user_id, fact), (user_id, fact))
+        if not entries:
             return
 
-        memory_ids = [f"{user_id}_{hash(fact)}" for fact in facts]
-        
         # Filter out memories that already exist
-        existing_memories = self.collection.get(ids=memory_ids)['ids']
-        new_facts = [fact for fact, mem_id in zip(facts, memory_ids) if mem_id not in existing_memories]
-        new_memory_ids = [mem_id for mem_id in memory_ids if mem_id not in existing_memories]
+        existing_memories = set(self.collection.get(ids=list(entries))['ids'])
+        candidates = [(mem_id, user_id, fact) for mem_id, (user_id, fact) in entries.items() if mem_id not in existing_memories]
+        if not candidates:
+            return
 
+        embeddings = _normalize(np.asarray(self.embedding_function([fact for _, _, fact in candidates]), dtype=np.float32))
+        threshold = self.config.get('dedupe_similarity', 0.9)
+        new_ids, new_facts, new_metadatas, new_embeddings = [], [], [], []
+        merged: dict[str, dict] = {}
+        for user_id in dict.fromkeys(user_id for _, user_id, _ in candidates):
+            rows = [i for i, (_, candidate_user, _) in enumerate(candidates) if candidate_user == user_id]
+            nearest = self._nearest_existing(user_id, embeddings[rows])
+            accepted: list[int] = []
+            for row, match in zip(rows, nearest):
+                mem_id, _, fact = candidates[row]
+                if match is not None and match[1] >= threshold:
+                    existing_id, _, metadata = match
+                    metadata = merged.get(existing_id, metadata)
+                    merged[existing_id] = {**metadata, "mentions": metadata.get("mentions", 1) + 1}
+                    print(f"Memory '{fact}' merged into an existing one.")
+                    continue
+                if accepted and float(np.max(embeddings[accepted] @ embeddings[row])) >= threshold:
+                    continue
+                accepted.append(row)
+                new_ids.append(mem_id)
+                new_facts.append(fact)
+                new_metadatas.append({"user": user_id, "mentions": 1})
+                new_embeddings.append(embeddings[row].tolist())
+
+        if self.index is not None:
+            for user_id in dict.fromkeys(metadata["user"] for metadata in new_metadatas):
+                self._ensure_indexed(user_id)
+        if merged:
+            self.collection.update(ids=list(merged), metadatas=list(merged.values()))
         if not new_facts:
             return
-            
         print(f"Adding {len(new_facts)} new memories: {new_facts}")
         self.collection.add(
             documents=new_facts,
-            metadatas=[{"user": user_id}] * len(new_facts),
-            ids=new_memory_ids
+            metadatas=new_metadatas,
+            embeddings=new_embeddings,
+            ids=new_ids
         )
+        if self.index is not None:
+            for user_id in dict.fromkeys(metadata["user"] for metadata in new_metadatas):
+                rows = [i for i, metadata in enumerate(new_metadatas) if metadata["user"] == user_id]
+                self.index.append(user_id, [new_ids[i] for i in rows], [new_facts[i] for i in rows],
+                                  [new_embeddings[i] for i in rows])
+        changed_users = set(metadata["user"] for metadata in new_metadatas)
+        self._invalidate(changed_users)
+        if self.state.shared:
+            for user_id in changed_users:
+                # Our own caches were just cleared, so this worker is already up to date
+                self._shared_generations[user_id] = self.state.bump_memory_generation(user_id)
 
-    def retrieve_relevant_memories(self, query: str, user_id: str = "user") -> list[str]:
-        if not query:
-            return []
-            
+    def _nearest_existing(self, user_id: str, embeddings: np.ndarray) -> list[tuple[str, float, dict] | None]:
+        """For each embedding, the user's most similar stored memory as (id, cosine similarity, metadata)."""
         results = self.collection.query(
-            query_texts=[query],
-            n_results=self.config['retrieval_results'],
-            where={"user": user_id}
+            query_embeddings=embeddings.tolist(),
+            n_results=1,
+            where={"user": user_id},
+            include=["embeddings", "metadatas"],
         )
-        return results['documents'][0] if results and results['documents'] else []
\ No newline at end of file
+        nearest = []
+        for i in range(len(embeddings)):
+            ids = results['ids'][i] if results['ids'] else []
+            if not ids:
+                nearest.append(None)
+                continue
+            stored = _normalize(np.asarray(results['embeddings'][i], dtype=np.float32))[0]
+            nearest.append((ids[0], float(stored @ embeddings[i]), results['metadatas'][i][0] or {}))
+        return nearest
+
+    def retrieve_relevant_memories(self, query: str, user_id: str = "user") -> list[str]:
+        normalized = normalize_fact(query or "")
+        # Greetings and one-word replies don't carry anything worth looking up
+        if len(normalized) < self.config.get('min_query_chars', 4):
+            self.counters["fast_path"] += 1
+            return []
+
+        if self.state.shared:
+            shared_generation = self.state.memory_generation(user_id)
+            if self._shared_generations.get(user_id) != shared_generation:
+                self._invalidate([user_id])
+                self._shared_generations[user_id] = shared_generation
+
+        with self._lock:
+            cached = self._results.get(user_id, {}).get(normalized)
+            if cached is not None:
+                self._results[user_id].move_to_end(normalized)
+                self.counters["result_hits"] += 1
+                self.counters["seconds_saved"] += self._embed_seconds + self._query_seconds
+                return list(cached)
+            self.counters["result_misses"] += 1
+            generation = self._generations.get(user_id, 0)
+
+        embedding = self._embed_query(normalized)
+        started = time.perf_counter()
+        if self.index is not None:
+            self._ensure_indexed(user_id)
+            memories = self.index.search(user_id, embedding, self.config['retrieval_results'])
+        else:
+            results = self.collection.query(
+                query_embeddings=[embedding],
+                n_results=self.config['retrieval_results'],
+                where={"user": user_id}
+            )
+            memories = results['documents'][0] if results and results['documents'] else []
+        self._query_seconds = _running_average(self._query_seconds, time.perf_counter() - started)
+
+        with self._lock:
+            # A write for this user while we were querying makes the result stale
+            if self._generations.get(user_id, 0) == generation:
+                user_results = self._results.setdefault(user_id, OrderedDict())
+                user_results[normalized] = memories
+                while len(user_results) > self.config.get('result_cache_size', 128):
+                    user_results.popitem(last=False)
+        return memories
+
+    def _ensure_indexed(self, user_id: str):
+        """Copies a user's memories from Chroma into the memmap index the first time they are needed."""
+        if self.index.has_user(user_id):
+            return
+        stored = self.collection.get(where={"user": user_id}, include=["documents", "embeddings"])
+        print(f"Indexing {len(stored['ids'])} memories for '{user_id}' into the memmap index...")
+        self.index.append(user_id, stored['ids'], stored['documents'], stored['embeddings'])
+
+    def _embed_query(self, normalized: str) -> list[float]:
+        with self._lock:
+            embedding = self._query_embeddings.get(normalized)
+            if embedding is not None:
+                self._query_embeddings.move_to_end(normalized)
+                self.counters["embedding_hits"] += 1
+                self.counters["seconds_saved"] += self._embed_seconds
+                return embedding
+            self.counters["embedding_misses"] += 1
+
+        started = time.perf_counter()
+        embedding = np.asarray(self.embedding_function([normalized])[0], dtype=np.float32).tolist()
+        self._embed_seconds = _running_average(self._embed_seconds, time.perf_counter() - started)
+        with self._lock:
+            self._query_embeddings[normalized] = embedding
+            while len(self._query_embeddings) > self.config.get('query_cache_size', 512):
+                self._query_embeddings.popitem(last=False)
+        return embedding
+
+    def _invalidate(self, user_ids):
+        with self._lock:
+            for user_id in set(user_ids):
+                self._results.pop(user_id, None)
+                self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+    def stats(self) -> dict:
+        stats = dict(self.counters, seconds_saved=round(self.counters["seconds_saved"], 3))
+        lookups = stats["result_hits"] + stats["result_misses"]
+        stats["result_hit_rate"] = round(stats["result_hits"] / lookups, 3) if lookups else 0.0
+        return stats
@@ -0,0 +1,453 @@
+# waifu_core/services/session_state.py
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+from waifu_core.config import resolve_path, service_config
+from waifu_core.services.history_store import HistoryStore, get_history_store, read_legacy_history
+
+SERVICE_CONFIG = service_config()
+
+# Identifies this process among the workers (and hosts) sharing the session state
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class SessionState(ABC):
+    """
+    Everything about a conversation that has to outlive one connection and be
+    visible to every worker: the history (`history`, with the HistoryStore
+    interface), session metadata for reconnects, and a per-user memory generation
+    that tells workers when their cached memory lookups went stale.
+
+    A session is owned by one connection at a time, named `worker#connection`.
+    `claim_session` takes it over (a reconnect may land on any worker);
+    `touch_session` renews the lease before each turn and fails once another
+    connection has claimed the session, so the stale one can close.
+    All methods block; call them off the event loop.
+    """
+
+    backend = ""
+    # True when other processes see the same state (and can change it under us)
+    shared = False
+    history: HistoryStore
+
+    def __init__(self, session_ttl_seconds: float = 86400, owner_lease_seconds: float = 300):
+        self.session_ttl = session_ttl_seconds
+        self.owner_lease = owner_lease_seconds
+
+    @abstractmethod
+    def load_session(self, session_id: str) -> dict | None:
+        """The metadata saved for a session, or None if it is unknown or expired."""
+        pass
+
+    @abstractmethod
+    def claim_session(self, session_id: str, owner: str, data: dict) -> str | None:
+        """Makes `owner` the session's connection and saves its metadata; returns the previous owner."""
+        pass
+
+    @abstractmethod
+    def touch_session(self, session_id: str, owner: str, data: dict) -> bool:
+        """Renews the lease and saves the metadata; False if another connection owns the session now."""
+        pass
+
+    @abstractmethod
+    def release_session(self, session_id: str, owner: str):
+        """Gives up ownership (if still held) when the connection closes; the metadata stays for reconnects."""
+        pass
+
+    @abstractmethod
+    def memory_generation(self, user_id: str) -> int:
+        pass
+
+    @abstractmethod
+    def bump_memory_generation(self, user_id: str) -> int:
+        """Called after a user's memories change, so every worker drops its cached lookups."""
+        pass
+
+    def describe(self) -> dict:
+        return {"backend": self.backend, "shared": self.shared, "worker": WORKER_ID}
+
+
+class LocalSessionState(SessionState):
+    """
+    The single-worker default: history in the JSONL files of HistoryStore, session
+    metadata and memory generations in process memory.
+    """
+
+    backend = "file"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.history = get_history_store()
+        self._lock = threading.Lock()
+        # session id -> (metadata, expires at); session id -> (owner, lease expires at)
+        self._sessions: dict[str, tuple[dict, float]] = {}
+        self._owners: dict[str, tuple[str, float]] = {}
+        self._generations: dict[str, int] = {}
+
+    def load_session(self, session_id: str) -> dict | None:
+        with self._lock:
+            data, expires = self._sessions.get(session_id, (None, 0.0))
+            return dict(data) if data is not None and expires > time.time() else None
+
+    def _owner(self, session_id: str) -> str | None:
+        owner, expires = self._owners.get(session_id, (None, 0.0))
+        return owner if expires > time.time() else None
+
+    def _save(self, session_id: str, owner: str, data: dict):
+        now = time.time()
+        self._sessions[session_id] = (dict(data), now + self.session_ttl)
+        self._owners[session_id] = (owner, now + self.owner_lease)
+
+    def claim_session(self, session_id: str, owner: str, data: dict) -> str | None:
+        with self._lock:
+            previous = self._owner(session_id)
+            self._save(session_id, owner, data)
+            return previous
+
+    def touch_session(self, session_id: str, owner: str, data: dict) -> bool:
+        with self._lock:
+            if self._owner(session_id) not in (None, owner):
+                return False
+            self._save(session_id, owner, data)
+            return True
+
+    def release_session(self, session_id: str, owner: str):
+        with self._lock:
+            if self._owner(session_id) == owner:
+                del self._owners[session_id]
+
+    def memory_generation(self, user_id: str) -> int:
+        return self._generations.get(user_id, 0)
+
+    def bump_memory_generation(self, user_id: str) -> int:
+        with self._lock:
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            return self._generations[user_id]
+
+
+class SharedSessionState(SessionState):
+    """Base of the backends shared between workers; they keep the history themselves."""
+
+    shared = True
+
+    def __init__(self, keep_turns: int = 200, **kwargs):
+        super().__init__(**kwargs)
+        self.keep_turns = keep_turns
+        self.history = self
+        self._imported: set[str] = set()
+
+    @abstractmethod
+    def append_turn(self, key: str, user: str, assistant: str) -> dict:
+        pass
+
+    @abstractmethod
+    def _load_turns(self, key: str, turns: int) -> list[dict]:
+        pass
+
+    @abstractmethod
+    def _store_turns(self, key: str, records: list[dict]):
+        """Writes a whole history for a key that has none yet."""
+        pass
+
+    @abstractmethod
+    def load_summary(self, key: str) -> tuple[str | None, float]:
+        pass
+
+    @abstractmethod
+    def save_summary(self, key: str, summary: str, through_ts: float):
+        pass
+
+    def load_tail(self, key: str, turns: int) -> list[dict]:
+        """Returns the last `turns` turns as {"ts", "user", "assistant"} records, oldest first."""
+        if turns <= 0:
+            return []
+        records = self._load_turns(key, turns)
+        if not records and key not in self._imported:
+            # Histories written by the file backend carry over when switching to a shared one
+            self._imported.add(key)
+            file_store = get_history_store()
+            records = file_store.load_tail(key, self.keep_turns)
+            if records:
+                self._store_turns(key, records)
+                print(f"Imported {len(records)} turns of '{key}' from {file_store.directory} into the {self.backend} state.")
+                records = records[-turns:]
+        return records
+
+    def import_legacy(self, key: str, legacy_path: Path):
+        """Converts the old whole-file JSON history, unless the key already has a history."""
+        if self.load_tail(key, 1):
+            return
+        records = read_legacy_history(legacy_path)
+        self._store_turns(key, records[-self.keep_turns:])
+        print(f"Imported {len(records)} turns from '{legacy_path}' into history '{key}'.")
+
+
+class SQLiteSessionState(SharedSessionState):
+    """
+    Session state in one SQLite database (WAL mode), shared by the workers of one
+    host. Each thread gets its own connection; writes that read first run in an
+    IMMEDIATE transaction so concurrent workers can't interleave them.
+    """
+
+    backend = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS turns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL,
+            ts REAL NOT NULL, user TEXT NOT NULL, assistant TEXT NOT NULL);
+        CREATE INDEX IF NOT EXISTS turns_by_key ON turns (key, id);
+        CREATE TABLE IF NOT EXISTS summaries (key TEXT PRIMARY KEY, summary TEXT, through_ts REAL);
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL,
+            owner TEXT, owner_expires REAL);
+        CREATE TABLE IF NOT EXISTS memory_generations (user_id TEXT PRIMARY KEY, generation INTEGER NOT NULL);
+    """
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            # Autocommit; multi-statement writes open their own transactions
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _transaction(self):
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        return db
+
+    def append_turn(self, key: str, user: str, assistant: str) -> dict:
+        record = {"ts": time.time(), "user": user, "assistant": assistant}
+        db = self._transaction()
+        try:
+            db.execute("INSERT INTO turns (key, ts, user, assistant) VALUES (?, ?, ?, ?)",
+                       (key, record["ts"], user, assistant))
+            # Only the last keep_turns turns are kept, like the compacted JSONL files
+            db.execute("""DELETE FROM turns WHERE key = ? AND id <= (
+                              SELECT id FROM turns WHERE key = ? ORDER BY id DESC LIMIT 1 OFFSET ?)""",
+                       (key, key, self.keep_turns))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return record
+
+    def _load_turns(self, key: str, turns: int) -> list[dict]:
+        rows = self._connection().execute(
+            "SELECT ts, user, assistant FROM turns WHERE key = ? ORDER BY id DESC LIMIT ?", (key, turns)
+        ).fetchall()
+        return [{"ts": ts, "user": user, "assistant": assistant} for ts, user, assistant in reversed(rows)]
+
+    def _store_turns(self, key: str, records: list[dict]):
+        db = self._transaction()
+        try:
+            if db.execute("SELECT 1 FROM turns WHERE key = ? LIMIT 1", (key,)).fetchone() is None:
+                db.executemany("INSERT INTO turns (key, ts, user, assistant) VALUES (?, ?, ?, ?)",
+                               [(key, r["ts"], r["user"], r["assistant"]) for r in records])
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def load_summary(self, key: str) -> tuple[str | None, float]:
+        row = self._connection().execute("SELECT summary, through_ts FROM summaries WHERE key = ?", (key,)).fetchone()
+        return (row[0], row[1] or 0.0) if row else (None, 0.0)
+
+    def save_summary(self, key: str, summary: str, through_ts: float):
+        self._connection().execute(
+            "INSERT INTO summaries (key, summary, through_ts) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET summary = excluded.summary, through_ts = excluded.through_ts",
+            (key, summary, through_ts),
+        )
+
+    def load_session(self, session_id: str) -> dict | None:
+        row = self._connection().execute(
+            "SELECT data FROM sessions WHERE id = ? AND expires > ?", (session_id, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _save(self, db: sqlite3.Connection, session_id: str, owner: str, data: dict):
+        now = time.time()
+        db.execute(
+            "INSERT INTO sessions (id, data, expires, owner, owner_expires) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET data = excluded.data, expires = excluded.expires, "
+            "owner = excluded.owner, owner_expires = excluded.owner_expires",
+            (session_id, json.dumps(data), now + self.session_ttl, owner, now + self.owner_lease),
+        )
+
+    def _owner(self, db: sqlite3.Connection, session_id: str) -> str | None:
+        row = db.execute("SELECT owner FROM sessions WHERE id = ? AND owner_expires > ?", (session_id, time.time())).fetchone()
+        return row[0] if row else None
+
+    def claim_session(self, session_id: str, owner: str, data: dict) -> str | None:
+        db = self._transaction()
+        try:
+            previous = self._owner(db, session_id)
+            self._save(db, session_id, owner, data)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return previous
+
+    def touch_session(self, session_id: str, owner: str, data: dict) -> bool:
+        db = self._transaction()
+        try:
+            current = self._owner(db, session_id)
+            if current not in (None, owner):
+                db.execute("ROLLBACK")
+                return False
+            self._save(db, session_id, owner, data)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return True
+
+    def release_session(self, session_id: str, owner: str):
+        self._connection().execute(
+            "UPDATE sessions SET owner = NULL, owner_expires = NULL WHERE id = ? AND owner = ?", (session_id, owner)
+        )
+
+    def memory_generation(self, user_id: str) -> int:
+        row = self._connection().execute(
+            "SELECT generation FROM memory_generations WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def bump_memory_generation(self, user_id: str) -> int:
+        return self._connection().execute(
+            "INSERT INTO memory_generations (user_id, generation) VALUES (?, 1) "
+            "ON CONFLICT (user_id) DO UPDATE SET generation = generation + 1 RETURNING generation",
+            (user_id,),
+        ).fetchone()[0]
+
+
+class RedisSessionState(SharedSessionState):
+    """
+    Session state on any server speaking the Redis protocol (Redis, Valkey, or the
+    stand-in in benchmarks/stub_redis_server.py), shared across hosts. A history
+    is a list trimmed to keep_turns; sessions and owner leases expire on their own.
+    """
+
+    backend = "redis"
+
+    def __init__(self, url: str, prefix: str = "waifu:", **kwargs):
+        super().__init__(**kwargs)
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("The redis state backend needs the redis package: pip install redis") from e
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    def _key(self, kind: str, name: str) -> str:
+        return f"{self.prefix}{kind}:{name}"
+
+    def append_turn(self, key: str, user: str, assistant: str) -> dict:
+        record = {"ts": time.time(), "user": user, "assistant": assistant}
+        list_key = self._key("history", key)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.rpush(list_key, json.dumps(record, ensure_ascii=False))
+        pipe.ltrim(list_key, -self.keep_turns, -1)
+        pipe.execute()
+        return record
+
+    def _load_turns(self, key: str, turns: int) -> list[dict]:
+        return [json.loads(item) for item in self.client.lrange(self._key("history", key), -turns, -1)]
+
+    def _store_turns(self, key: str, records: list[dict]):
+        if records and not self.client.exists(self._key("history", key)):
+            self.client.rpush(self._key("history", key), *(json.dumps(r, ensure_ascii=False) for r in records))
+
+    def load_summary(self, key: str) -> tuple[str | None, float]:
+        raw = self.client.get(self._key("summary", key))
+        if raw is None:
+            return None, 0.0
+        data = json.loads(raw)
+        return data.get("summary"), data.get("through_ts", 0.0)
+
+    def save_summary(self, key: str, summary: str, through_ts: float):
+        self.client.set(self._key("summary", key), json.dumps({"summary": summary, "through_ts": through_ts}, ensure_ascii=False))
+
+    def load_session(self, session_id: str) -> dict | None:
+        raw = self.client.get(self._key("session", session_id))
+        return json.loads(raw) if raw is not None else None
+
+    def _save(self, pipe, session_id: str, data: dict):
+        pipe.set(self._key("session", session_id), json.dumps(data), ex=int(self.session_ttl))
+
+    def claim_session(self, session_id: str, owner: str, data: dict) -> str | None:
+        pipe = self.client.pipeline(transaction=False)
+        # SET ... GET swaps the owner in one step and returns the one it replaced
+        pipe.set(self._key("owner", session_id), owner, ex=int(self.owner_lease), get=True)
+        self._save(pipe, session_id, data)
+        return pipe.execute()[0]
+
+    def touch_session(self, session_id: str, owner: str, data: dict) -> bool:
+        current = self.client.get(self._key("owner", session_id))
+        if current not in (None, owner):
+            return False
+        # A claim landing between the GET and this SET is caught at that connection's next turn
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(self._key("owner", session_id), owner, ex=int(self.owner_lease))
+        self._save(pipe, session_id, data)
+        pipe.execute()
+        return True
+
+    def release_session(self, session_id: str, owner: str):
+        if self.client.get(self._key("owner", session_id)) == owner:
+            self.client.delete(self._key("owner", session_id))
+
+    def memory_generation(self, user_id: str) -> int:
+        return int(self.client.get(self._key("memgen", user_id)) or 0)
+
+    def bump_memory_generation(self, user_id: str) -> int:
+        return self.client.incr(self._key("memgen", user_id))
+
+
+_state: SessionState | None = None
+_state_lock = threading.Lock()
+
+
+def create_session_state(config: dict) -> SessionState:
+    backend = config.get('backend', 'file')
+    common = {
+        'session_ttl_seconds': config.get('session_ttl_seconds', 86400),
+        'owner_lease_seconds': config.get('owner_lease_seconds', 300),
+    }
+    keep_turns = SERVICE_CONFIG.get('history', {}).get('keep_turns', 200)
+    if backend == 'sqlite':
+        return SQLiteSessionState(resolve_path(config.get('sqlite_path', 'state/waifu_state.db')), keep_turns=keep_turns, **common)
+    if backend == 'redis':
+        return RedisSessionState(config.get('redis_url', 'redis://localhost:6379/0'),
+                                 prefix=config.get('redis_prefix', 'waifu:'), keep_turns=keep_turns, **common)
+    if backend != 'file':
+        raise ValueError(f"Unknown session state backend: {backend}")
+    return LocalSessionState(**common)
+
+
+def get_session_state() -> SessionState:
+    """Returns the process-wide session state configured under `state` in services.yaml."""
+    global _state
+    if _state is None:
+        with _state_lock:
+            if _state is None:
+                _state = create_session_state(SERVICE_CONFIG.get('state', {}))
+                print(f"Session state: {_state.backend} (worker {WORKER_ID})")
+    return _state
@@ -0,0 +1,255 @@
+# waifu_core/services/streaming_asr.py
+import asyncio
+import math
+import time
+from collections import deque
+
+import numpy as np
+
+from waifu_core.executors import run_in_stage
+from waifu_core.services.asr_service import SAMPLE_RATE
+
+# Silero VAD scores 32 ms frames at 16 kHz
+FRAME_SAMPLES = 512
+FRAME_MS = FRAME_SAMPLES / SAMPLE_RATE * 1000
+# Once speech has started it takes a clearly lower score to count as silence again
+VAD_HYSTERESIS = 0.15
+
+
+class PCMDecoder:
+    """Little-endian 16-bit mono PCM at any sample rate, resampled to 16 kHz float32."""
+
+    def __init__(self, sample_rate: int = SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self._odd_byte = b""
+
+    def decode(self, chunk: bytes) -> np.ndarray:
+        data = self._odd_byte + bytes(chunk)
+        # A chunk may end in the middle of a sample
+        usable = len(data) - len(data) % 2
+        self._odd_byte = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+        if self.sample_rate == SAMPLE_RATE or not len(samples):
+            return samples
+        # Linear interpolation is plenty for speech recognition
+        duration = len(samples) / self.sample_rate
+        positions = np.arange(0, duration, 1 / SAMPLE_RATE) * self.sample_rate
+        return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+class OpusDecoder:
+    """Raw Opus packets (one per chunk, as produced by WebCodecs or libopus), decoded with PyAV."""
+
+    def __init__(self, sample_rate: int = 48000):
+        import av
+        self._av = av
+        self.codec = av.CodecContext.create("opus", "r")
+        self.codec.sample_rate = sample_rate
+        self.resampler = av.AudioResampler(format="flt", layout="mono", rate=SAMPLE_RATE)
+
+    def decode(self, chunk: bytes) -> np.ndarray:
+        pieces = []
+        for frame in self.codec.decode(self._av.Packet(bytes(chunk))):
+            for resampled in self.resampler.resample(frame):
+                pieces.append(resampled.to_ndarray().reshape(-1))
+        return np.concatenate(pieces).astype(np.float32, copy=False) if pieces else np.zeros(0, dtype=np.float32)
+
+
+DECODERS = {"pcm16": PCMDecoder, "opus": OpusDecoder}
+
+
+class BatchedVAD:
+    """
+    From faster-whisper 1.2.1 SileroVADModel scores a single 1-D stream per call; this gives it
+    the (batch, samples) -> (batch, frames, 1) signature of earlier versions, which StreamingASR uses.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, audio: np.ndarray) -> np.ndarray:
+        return np.stack([np.asarray(self.model(stream)).reshape(-1, 1) for stream in audio])
+
+
+class VADEndpointer:
+    """
+    Groups scored frames into speech regions and utterances. A short pause closes
+    a region (so it can be transcribed while the user keeps talking), a long one
+    ends the utterance. `push` returns events:
+      ("region", samples)  a finished stretch of speech,
+      ("end", None)        the utterance is over,
+      ("discard", None)    the utterance had too little speech to be more than noise.
+    """
+
+    def __init__(self, threshold: float = 0.5, end_silence_ms: float = 500, region_silence_ms: float = 250,
+                 min_region_seconds: float = 1.0, max_region_seconds: float = 10, min_speech_ms: float = 250,
+                 pre_roll_ms: float = 200, max_utterance_seconds: float = 30):
+        self.threshold = threshold
+        self.end_silence_frames = math.ceil(end_silence_ms / FRAME_MS)
+        self.region_silence_frames = math.ceil(region_silence_ms / FRAME_MS)
+        self.min_region_frames = math.ceil(min_region_seconds * 1000 / FRAME_MS)
+        self.max_region_frames = math.ceil(max_region_seconds * 1000 / FRAME_MS)
+        self.min_speech_frames = math.ceil(min_speech_ms / FRAME_MS)
+        self.max_utterance_frames = math.ceil(max_utterance_seconds * 1000 / FRAME_MS)
+        self._pre_roll: deque[np.ndarray] = deque(maxlen=math.ceil(pre_roll_ms / FRAME_MS))
+        self._reset()
+
+    def _reset(self):
+        self.in_utterance = False
+        self._speaking = False
+        self._region: list[np.ndarray] = []
+        self._region_speech = 0
+        self._silence = 0
+        self._speech_frames = 0
+        self._utterance_frames = 0
+
+    def push(self, frame: np.ndarray, probability: float) -> list[tuple[str, np.ndarray | None]]:
+        speech = probability >= (self.threshold - VAD_HYSTERESIS if self._speaking else self.threshold)
+        self._speaking = speech
+        if not self.in_utterance:
+            if not speech:
+                self._pre_roll.append(frame)
+                return []
+            self.in_utterance = True
+            self._region = list(self._pre_roll)
+            self._pre_roll.clear()
+
+        self._region.append(frame)
+        self._utterance_frames += 1
+        if speech:
+            self._speech_frames += 1
+            self._region_speech += 1
+            self._silence = 0
+        else:
+            self._silence += 1
+
+        if self._silence >= self.end_silence_frames or self._utterance_frames >= self.max_utterance_frames:
+            return self.flush()
+        if (self._silence == self.region_silence_frames and len(self._region) >= self.min_region_frames
+                and self._region_speech >= self.min_speech_frames) or len(self._region) >= self.max_region_frames:
+            return [("region", self._take_region())]
+        return []
+
+    def _take_region(self) -> np.ndarray:
+        samples = np.concatenate(self._region)
+        self._region = []
+        self._region_speech = 0
+        return samples
+
+    def flush(self) -> list[tuple[str, np.ndarray | None]]:
+        """Ends the current utterance, e.g. because the client says the user stopped talking."""
+        if not self.in_utterance:
+            return []
+        events = []
+        if self._speech_frames < self.min_speech_frames:
+            events.append(("discard", None))
+        else:
+            # Trailing silence beyond the region pause adds nothing for Whisper
+            trailing = max(self._silence - self.region_silence_frames, 0)
+            if trailing:
+                del self._region[-trailing:]
+            if self._region and self._region_speech:
+                events.append(("region", self._take_region()))
+            events.append(("end", None))
+        self._reset()
+        return events
+
+
+class StreamingASR:
+    """
+    Transcribes a microphone stream as it arrives. Chunks are decoded and scored by
+    the VAD on the `vad` executor; each finished speech region goes to Whisper (via
+    the cross-session batch scheduler) right away, so when the utterance ends only
+    its last region is left to transcribe.
+    """
+
+    def __init__(self, transcribe, vad_model, config: dict, audio_format: str = "pcm16", sample_rate: int | None = None):
+        if audio_format not in DECODERS:
+            raise ValueError(f"Unsupported audio stream format: {audio_format}")
+        self.transcribe = transcribe
+        self.vad_model = vad_model
+        self.decoder = DECODERS[audio_format](sample_rate) if sample_rate else DECODERS[audio_format]()
+        self.endpointer = VADEndpointer(
+            threshold=config.get('vad_threshold', 0.5),
+            end_silence_ms=config.get('end_silence_ms', 500),
+            region_silence_ms=config.get('region_silence_ms', 250),
+            min_region_seconds=config.get('min_region_seconds', 1.0),
+            max_region_seconds=config.get('max_region_seconds', 10),
+            min_speech_ms=config.get('min_speech_ms', 250),
+            pre_roll_ms=config.get('pre_roll_ms', 200),
+            max_utterance_seconds=config.get('max_utterance_seconds', 30),
+        )
+        self._pending = np.zeros(0, dtype=np.float32)
+        # The VAD sees a little of the previous frame as context
+        self._previous_frame = np.zeros(FRAME_SAMPLES, dtype=np.float32)
+        self._regions: list[asyncio.Task] = []
+        self._partial = ""
+        self.ended_at: float | None = None        # perf_counter() when the last utterance ended
+        self.final_wait_seconds = 0.0              # from then until its transcript was ready
+
+    def _process(self, chunk: bytes) -> list[tuple[str, np.ndarray | None]]:
+        samples = self.decoder.decode(chunk)
+        if len(self._pending):
+            samples = np.concatenate([self._pending, samples])
+        count = len(samples) // FRAME_SAMPLES
+        self._pending = samples[count * FRAME_SAMPLES:]
+        if not count:
+            return []
+        frames = samples[:count * FRAME_SAMPLES].reshape(count, FRAME_SAMPLES)
+        # A batch of one stream, (1, samples) -> (1, frames, 1); the first frame is only there as context
+        audio = np.concatenate([self._previous_frame, frames.reshape(-1)])
+        probabilities = self.vad_model(audio[None, :])[0].reshape(-1)[1:]
+        self._previous_frame = frames[-1]
+        events = []
+        for frame, probability in zip(frames, probabilities):
+            events.extend(self.endpointer.push(frame, float(probability)))
+        return events
+
+    async def feed(self, chunk: bytes) -> list[tuple[str, str]]:
+        """
+        Adds audio; returns transcript updates: ("partial", text) while the user talks,
+        ("final", text) once the utterance has ended.
+        """
+        events = await run_in_stage("vad", self._process, chunk)
+        return await self._handle(events)
+
+    async def finish(self) -> list[tuple[str, str]]:
+        """Ends the utterance now instead of waiting for the silence."""
+        events = await run_in_stage("vad", self.endpointer.flush)
+        return await self._handle(events)
+
+    async def _handle(self, events) -> list[tuple[str, str]]:
+        updates = []
+        for kind, samples in events:
+            if kind == "region":
+                self._regions.append(asyncio.create_task(self.transcribe(samples)))
+            elif kind == "discard":
+                self.close()
+            elif kind == "end":
+                self.ended_at = time.perf_counter()
+                texts = await asyncio.gather(*self._regions, return_exceptions=True)
+                self.final_wait_seconds = time.perf_counter() - self.ended_at
+                self._regions = []
+                self._partial = ""
+                final = " ".join(text.strip() for text in texts if isinstance(text, str) and text.strip())
+                updates.append(("final", final))
+        if not updates:
+            # The regions transcribed so far, in order
+            done = []
+            for task in self._regions:
+                if not task.done():
+                    break
+                if not task.cancelled() and task.exception() is None and task.result().strip():
+                    done.append(task.result().strip())
+            partial = " ".join(done)
+            if partial != self._partial:
+                self._partial = partial
+                updates.append(("partial", partial))
+        return updates
+
+    def close(self):
+        """Drops the utterance in progress."""
+        for task in self._regions:
+            task.cancel()
+        self._regions = []
+        self._partial = ""
@@ -0,0 +1,177 @@
+# waifu_core/services/tts/audio_cache.py
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from waifu_core.config import resolve_path, service_config
+
+SERVICE_CONFIG = service_config()
+
+
+class TTSAudioCache:
+    """
+    Content-addressed cache of synthesized audio, shared by every TTS provider.
+    Entries live in an in-memory LRU bounded by a byte budget, backed by an
+    on-disk store so rendered lines survive restarts. The disk store has a budget
+    of its own (`max_disk_bytes`, 0 for none); past it, the least recently used
+    files are deleted. Recency is kept in file modification times, so it
+    survives restarts too. Each process keeps its own account of the
+    directory, so with several workers sharing it the budget is approximate.
+    """
+
+    def __init__(self, max_memory_bytes: int, disk_dir: str | None = None, max_disk_bytes: int = 0):
+        self.max_memory_bytes = max_memory_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.max_disk_bytes = max_disk_bytes
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+        # key -> file size, least recently used first; the directory is scanned on first use
+        self._disk_entries: OrderedDict[str, int] | None = None
+        self._disk_lock = threading.Lock()
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.disk_evictions = 0
+
+    @staticmethod
+    def make_key(provider: str, voice: str, model: str, emotion: str, text: str) -> str:
+        normalized_text = " ".join(text.split())
+        raw = "\x1f".join([provider, str(voice), str(model), emotion or "", normalized_text])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.audio"
+
+    def _remember(self, key: str, audio: bytes):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            if len(audio) > self.max_memory_bytes:
+                return
+            self._entries[key] = audio
+            self.memory_bytes += len(audio)
+            while self.memory_bytes > self.max_memory_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.memory_bytes -= len(evicted)
+
+    def _scan_disk(self) -> OrderedDict[str, int]:
+        """Called with _disk_lock held."""
+        if self._disk_entries is None:
+            files = []
+            for path in self.disk_dir.glob("*/*.audio"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, path.stem, stat.st_size))
+            files.sort()
+            self._disk_entries = OrderedDict((key, size) for _, key, size in files)
+            self.disk_bytes = sum(self._disk_entries.values())
+        return self._disk_entries
+
+    def _read_disk(self, key: str) -> bytes | None:
+        path = self._disk_path(key)
+        try:
+            audio = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            # An unreadable entry is a miss like any other; the sentence is synthesized instead
+            print(f"Could not read TTS cache entry from disk: {e}")
+            return None
+        if self.max_disk_bytes:
+            with self._disk_lock:
+                entries = self._scan_disk()
+                if key in entries:
+                    entries.move_to_end(key)
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return audio
+
+    def _write_disk(self, key: str, audio: bytes):
+        path = self._disk_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so a concurrent reader never sees half a file
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(audio)
+        os.replace(tmp_path, path)
+        if self.max_disk_bytes:
+            self._account_disk(key, len(audio))
+
+    def _account_disk(self, key: str, size: int):
+        with self._disk_lock:
+            entries = self._scan_disk()
+            self.disk_bytes += size - entries.pop(key, 0)
+            entries[key] = size
+            # The newest entry stays even if it alone is over budget
+            while self.disk_bytes > self.max_disk_bytes and len(entries) > 1:
+                evicted, evicted_size = entries.popitem(last=False)
+                self._disk_path(evicted).unlink(missing_ok=True)
+                self.disk_bytes -= evicted_size
+                self.disk_evictions += 1
+
+    async def get(self, key: str) -> bytes | None:
+        with self._lock:
+            audio = self._entries.get(key)
+            if audio is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return audio
+        if self.disk_dir is not None:
+            audio = await asyncio.to_thread(self._read_disk, key)
+            if audio is not None:
+                self.disk_hits += 1
+                self._remember(key, audio)
+                return audio
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, audio: bytes):
+        self._remember(key, audio)
+        if self.disk_dir is not None:
+            try:
+                await asyncio.to_thread(self._write_disk, key, audio)
+            except OSError as e:
+                print(f"Could not write TTS cache entry to disk: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "memory_bytes": self.memory_bytes,
+            "disk_bytes": self.disk_bytes if self.max_disk_bytes else None,
+            "disk_evictions": self.disk_evictions,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+        }
+
+
+_cache: TTSAudioCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_tts_cache() -> TTSAudioCache | None:
+    """Returns the process-wide TTS cache, or None when it is disabled in services.yaml."""
+    global _cache
+    config = SERVICE_CONFIG['tts'].get('cache', {})
+    if not config.get('enabled', True):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TTSAudioCache(
+                    max_memory_bytes=config.get('memory_bytes', 64 * 1024 * 1024),
+                    disk_dir=resolve_path(config['disk_dir']) if config.get('disk_dir') else None,
+                    max_disk_bytes=config.get('max_disk_bytes', 0),
+                )
+    return _cache
@@ -0,0 +1,116 @@
+# waifu_core/services/tts/audio_encoding.py
+import io
+import wave
+from functools import lru_cache
+
+import numpy as np
+
+# Session audio formats -> (container, PyAV encoder); WAV needs no encoding
+ENCODERS = {"opus": ("ogg", "libopus"), "mp3": ("mp3", "libmp3lame")}
+# Opus only runs at these rates; anything else is resampled to 48 kHz
+OPUS_SAMPLE_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+@lru_cache(maxsize=None)
+def available_formats() -> tuple[str, ...]:
+    """Output formats this process can produce: WAV always, Opus/MP3 if PyAV has the encoders."""
+    try:
+        import av
+    except ImportError:
+        return ("wav",)
+    return tuple(name for name, (_, codec) in ENCODERS.items() if codec in av.codecs_available) + ("wav",)
+
+
+def negotiate_format(requested: str | None, config: dict, exclude: tuple[str, ...] = ()) -> str:
+    """
+    Picks the session's audio format from the client's comma-separated preference
+    list (e.g. "opus,mp3,wav"), or the configured default when it sent none.
+    Falls back to WAV, which every client can play.
+    """
+    allowed = [name for name in config.get('formats', ["opus", "mp3", "wav"])
+               if name in available_formats() and name not in exclude]
+    candidates = requested.split(",") if requested else [config.get('default_format', "wav")]
+    for name in (candidate.strip().lower() for candidate in candidates):
+        if name in allowed or name == "wav":
+            return name
+    return "wav"
+
+
+def is_wav(audio: bytes) -> bool:
+    return audio[:4] == b"RIFF" and audio[8:12] == b"WAVE"
+
+
+def encode_audio(audio: bytes, audio_format: str, bitrate: int) -> bytes:
+    """Encodes 16-bit PCM WAV to Opus-in-Ogg or MP3; anything else is returned unchanged."""
+    if audio_format not in ENCODERS or not is_wav(audio):
+        return audio
+    import av
+
+    with wave.open(io.BytesIO(audio)) as wav:
+        channels, sample_rate = wav.getnchannels(), wav.getframerate()
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype="<i2")
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype(np.int16)
+
+    container_format, codec = ENCODERS[audio_format]
+    out_rate = sample_rate if codec != "libopus" or sample_rate in OPUS_SAMPLE_RATES else 48000
+    buffer = io.BytesIO()
+    with av.open(buffer, "w", format=container_format) as container:
+        stream = container.add_stream(codec, rate=out_rate, layout="mono")
+        stream.bit_rate = bitrate
+        frame = av.AudioFrame.from_ndarray(samples.reshape(1, -1), format="s16", layout="mono")
+        frame.sample_rate = sample_rate
+        frame.pts = 0
+        resampler = av.AudioResampler(format=stream.format, layout="mono", rate=out_rate)
+        for resampled in resampler.resample(frame) + resampler.resample(None):
+            for packet in stream.encode(resampled):
+                container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+    return buffer.getvalue()
+
+
+def join_audio(chunks: list[bytes]) -> list[bytes]:
+    """
+    Joins a reply's audio chunks into as few clips as possible, for clients that play
+    one clip per reply: consecutive WAVs with the same parameters become one WAV and
+    MP3 frames simply follow each other. Ogg (Opus) clips are kept apart, since
+    browsers only decode the first stream of a chained file.
+    """
+    groups: list[list[bytes]] = []
+    for chunk in chunks:
+        if groups and _joinable(groups[-1][-1], chunk):
+            groups[-1].append(chunk)
+        else:
+            groups.append([chunk])
+    return [_join(group) for group in groups]
+
+
+def _wav_params(audio: bytes) -> tuple[int, int, int]:
+    with wave.open(io.BytesIO(audio)) as wav:
+        return wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+
+
+def _is_mp3(audio: bytes) -> bool:
+    return not is_wav(audio) and audio[:4] != b"OggS"
+
+
+def _joinable(previous: bytes, chunk: bytes) -> bool:
+    if is_wav(previous) and is_wav(chunk):
+        return _wav_params(previous) == _wav_params(chunk)
+    return _is_mp3(previous) and _is_mp3(chunk)
+
+
+def _join(group: list[bytes]) -> bytes:
+    if len(group) == 1 or not is_wav(group[0]):
+        return b"".join(group)
+    channels, sample_width, sample_rate = _wav_params(group[0])
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(channels)
+        out.setsampwidth(sample_width)
+        out.setframerate(sample_rate)
+        for audio in group:
+            with wave.open(io.BytesIO(audio)) as wav:
+                out.writeframes(wav.readframes(wav.getnframes()))
+    return buffer.getvalue()
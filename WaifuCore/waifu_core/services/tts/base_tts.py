@@ -1,13 +1,92 @@
 # waifu_core/services/tts/base_tts.py
+import time
 from abc import ABC, abstractmethod
 
+from waifu_core.config import service_config
+from waifu_core.executors import run_in_stage
+from waifu_core.metrics import get_metrics
+from .audio_cache import get_tts_cache
+from .audio_encoding import encode_audio
+
+SERVICE_CONFIG = service_config()
+
+
+def _synthesize_histogram():
+    return get_metrics().histogram(
+        "waifu_tts_synthesize_seconds", "TTS calls by provider and whether the audio cache answered", ("provider", "cache")
+    )
+
 class BaseTTSService(ABC):
+    # Providers whose audio doesn't change with the emotion share cache entries across emotions
+    uses_emotion = True
+    # What _synthesize returns; only WAV output is re-encoded for the session's audio format
+    output_format = "wav"
+
     @abstractmethod
     def __init__(self, config):
         self.config = config
         print(f"Initializing {self.__class__.__name__}...")
 
     @abstractmethod
-    async def synthesize(self, text: str, emotion: str) -> bytes | None:
-        """Takes text and returns WAV audio bytes."""
-        pass
\ No newline at end of file
+    def cache_identity(self) -> tuple[str, str, str]:
+        """(provider, voice, model): everything besides text and emotion that shapes the audio."""
+        pass
+
+    @abstractmethod
+    async def _synthesize(self, text: str, emotion: str) -> bytes | None:
+        """Takes text and returns audio bytes, without consulting the cache."""
+        pass
+
+    async def synthesize(self, text: str, emotion: str, audio_format: str = "wav") -> bytes | None:
+        """
+        Takes text and returns audio bytes in `audio_format` ("wav", "opus" or "mp3"),
+        served from the shared audio cache when possible. Encoded audio is cached
+        alongside the WAV it came from.
+        """
+        if audio_format == "wav" or self.output_format != "wav":
+            return await self._synthesize_cached(text, emotion)
+
+        bitrate = SERVICE_CONFIG['tts'].get('output', {}).get('bitrate', 32000)
+        cache = get_tts_cache()
+        key = None
+        if cache is not None:
+            provider, voice, model = self.cache_identity()
+            key = cache.make_key(provider, voice, f"{model}|{audio_format}@{bitrate}",
+                                 emotion if self.uses_emotion else "", text)
+            encoded = await cache.get(key)
+            if encoded is not None:
+                return encoded
+        audio = await self._synthesize_cached(text, emotion)
+        if not audio:
+            return audio
+        try:
+            encoded = await run_in_stage("encode", encode_audio, audio, audio_format, bitrate)
+        except Exception as e:
+            # E.g. a PyAV build without the encoder. Every chunk states its own format,
+            # so the client is told it got WAV and plays it as such.
+            print(f"Encoding TTS audio to {audio_format} failed, sending WAV instead: {e}")
+            return audio
+        if key is not None:
+            await cache.put(key, encoded)
+        return encoded
+
+    async def _synthesize_cached(self, text: str, emotion: str) -> bytes | None:
+        """The provider's own audio, served from the shared audio cache when possible."""
+        started = time.perf_counter()
+        provider = self.cache_identity()[0]
+        cache = get_tts_cache()
+        if cache is None:
+            audio = await self._synthesize(text, emotion)
+            _synthesize_histogram().observe(time.perf_counter() - started, provider=provider, cache="off")
+            return audio
+
+        key = cache.make_key(*self.cache_identity(), emotion if self.uses_emotion else "", text)
+        audio = await cache.get(key)
+        if audio is not None:
+            _synthesize_histogram().observe(time.perf_counter() - started, provider=provider, cache="hit")
+            return audio
+        audio = await self._synthesize(text, emotion)
+        if audio:
+            await cache.put(key, audio)
+        _synthesize_histogram().observe(time.perf_counter() - started, provider=provider, cache="miss")
+        return audio
@@ -5,6 +5,7 @@ import soundfile as sf
 import io
 from pathlib import Path
 from .base_tts import BaseTTSService
+from waifu_core.executors import run_in_stage
 
 try:
     # This is the official, high-level API for Coqui TTS
@@ -13,6 +14,8 @@ except ImportError:
     raise ImportError("Coqui TTS library not found. Please ensure it is correctly placed in site-packages.")
 
 class CoquiTTSService(BaseTTSService):
+    uses_emotion = False
+
     def __init__(self, config):
         super().__init__(config)
         self.reference_voice_path = config['reference_voice']
@@ -22,6 +25,7 @@ class CoquiTTSService(BaseTTSService):
 
         # --- Official Direct Integration Logic from README ---
         model_name = "tts_models/multilingual/multi-dataset/xtts_v2"
+        self.model_name = model_name
         device = "cuda" if torch.cuda.is_available() else "cpu"
         print(f"Loading Coqui TTS model '{model_name}' onto device '{device}'...")
         
@@ -30,7 +34,15 @@ class CoquiTTSService(BaseTTSService):
         
         print("Coqui TTS Service Initialized and model loaded directly via API.")
 
-    async def synthesize(self, text: str, emotion: str) -> bytes | None:
+    def cache_identity(self) -> tuple[str, str, str]:
+        # The language changes the pronunciation, so it is part of the model identity
+        return ("coqui", self.reference_voice_path, f"{self.model_name}:{self.config.get('language', 'en')}")
+
+    async def _synthesize(self, text: str, emotion: str) -> bytes | None:
+        # Synthesis blocks, so it runs on the bounded TTS executor instead of the event loop
+        return await run_in_stage("tts", self._synthesize_sync, text, emotion)
+
+    def _synthesize_sync(self, text: str, emotion: str) -> bytes | None:
         print(f"🗣️  Synthesizing speech with Coqui TTS (Direct API Call)...")
         
         try:
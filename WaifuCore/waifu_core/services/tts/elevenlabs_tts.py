@@ -1,6 +1,10 @@
 # waifu_core/services/tts/elevenlabs_tts.py
 import os
 from .base_tts import BaseTTSService
+from waifu_core.executors import run_in_stage
+from waifu_core.http_pool import get_http_pool
+
+ELEVENLABS_API_URL = "https://api.elevenlabs.io"
 
 try:
     import elevenlabs
@@ -11,6 +15,9 @@ except ImportError:
     # Don't raise an error here - let the class handle it
 
 class ElevenLabsTTSService(BaseTTSService):
+    # The API already returns compressed MP3, which every client can play
+    output_format = "mp3"
+
     def __init__(self, config):
         super().__init__(config)
         
@@ -31,22 +38,33 @@ class ElevenLabsTTSService(BaseTTSService):
                 "or add it to services.yaml"
             )
             
-        self.client = ElevenLabs(api_key=api_key)
+        # The SDK is blocking and runs on the tts_remote executor, so it gets the pooled sync client
+        self.client = ElevenLabs(api_key=api_key, httpx_client=get_http_pool().get_sync_client(ELEVENLABS_API_URL))
         self.voice_id = self.config.get('voice_id', 'Rachel')  # Default voice
         self.model_id = self.config.get('model_id', 'eleven_monolingual_v1')
         
         print("ElevenLabs TTS Service Initialized and ready.")
 
-    async def synthesize(self, text: str, emotion: str) -> bytes | None:
+    def cache_identity(self) -> tuple[str, str, str]:
+        # Voice settings change the rendering as much as the model does
+        settings = sorted(self.config.get('voice_settings', {}).items())
+        return ("elevenlabs", self.voice_id, f"{self.model_id}:{settings}")
+
+    async def _synthesize(self, text: str, emotion: str) -> bytes | None:
+        # The SDK call blocks on the network; it gets its own, wider executor than the local models
+        return await run_in_stage("tts_remote", self._synthesize_sync, text, emotion)
+
+    def _synthesize_sync(self, text: str, emotion: str) -> bytes | None:
         print(f"🗣️  Synthesizing speech with ElevenLabs...")
         try:
             # Map emotions to voice settings if needed
-            voice_settings = self.config.get('voice_settings', {
+            # Copy so the emotion tweaks below don't leak into the shared config
+            voice_settings = dict(self.config.get('voice_settings', {
                 'stability': 0.75,
                 'similarity_boost': 0.75,
                 'style': 0.0,
                 'use_speaker_boost': True
-            })
+            }))
             
             # Adjust voice settings based on emotion
             if emotion == 'happy':
@@ -5,6 +5,7 @@ import soundfile as sf
 import io
 from pathlib import Path
 from .base_tts import BaseTTSService
+from waifu_core.executors import run_in_stage
 
 try:
     from kokoro import KModel, KPipeline
@@ -12,12 +13,15 @@ except ImportError:
     raise ImportError("Kokoro library not found. Please ensure it is installed.")
 
 class KokoroTTSService(BaseTTSService):
+    uses_emotion = False
+
     def __init__(self, config):
         super().__init__(config)
         self.device = self.config.get('device', 'cuda' if torch.cuda.is_available() else 'cpu')
         
         model_dir = Path(self.config['model_dir'])
         model_file = model_dir / "kokoro-v1_0.pth"
+        self.model_file = model_file
         config_file = model_dir / "config.json"
 
         if not model_file.exists() or not config_file.exists():
@@ -33,7 +37,14 @@ class KokoroTTSService(BaseTTSService):
         self.pipeline = KPipeline(lang_code='a', model=k_model)
         print("Kokoro TTS Service Initialized and ready.")
 
-    async def synthesize(self, text: str, emotion: str) -> bytes | None:
+    def cache_identity(self) -> tuple[str, str, str]:
+        return ("kokoro", self.config.get('voice', 'af_heart'), self.model_file.name)
+
+    async def _synthesize(self, text: str, emotion: str) -> bytes | None:
+        # Synthesis blocks, so it runs on the bounded TTS executor instead of the event loop
+        return await run_in_stage("tts", self._synthesize_sync, text, emotion)
+
+    def _synthesize_sync(self, text: str, emotion: str) -> bytes | None:
         print(f"🗣️  Synthesizing speech with Kokoro...")
         try:
             voice = self.config.get('voice', 'af_heart')
@@ -1,11 +1,11 @@
 # waifu_core/services/tts_service.py
-import yaml
+from waifu_core.config import service_config, character_config
+from waifu_core.http_pool import get_http_pool
 from pathlib import Path
 import torch
 import numpy as np
 import soundfile as sf
 import io
-import aiohttp
 import asyncio
 import os
 
@@ -28,8 +28,8 @@ except ImportError:
     print("ElevenLabs library not found. Install with 'pip install elevenlabs'")
 
 # Load configs
-SERVICE_CONFIG = yaml.safe_load(Path("config/services.yaml").read_text())
-CHARACTER_CONFIG = yaml.safe_load(Path("config/character.yaml").read_text())
+SERVICE_CONFIG = service_config()
+CHARACTER_CONFIG = character_config()
 
 class TTSService:
     def __init__(self):
@@ -103,7 +103,9 @@ class TTSService:
                 "or add it to services.yaml"
             )
             
-        self.elevenlabs_client = ElevenLabs(api_key=api_key)
+        self.elevenlabs_client = ElevenLabs(
+            api_key=api_key, httpx_client=get_http_pool().get_sync_client("https://api.elevenlabs.io")
+        )
         self.voice_id = self.elevenlabs_config.get('voice_id', 'Rachel')  # Default voice
         self.model_id = self.elevenlabs_config.get('model_id', 'eleven_monolingual_v1')
 
@@ -203,19 +205,15 @@ class TTSService:
                 'reference_audio': self.coqui_config.get('reference_voice')
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.coqui_config['api_url'],
-                    json=payload,
-                    timeout=aiohttp.ClientTimeout(total=30)
-                ) as response:
-                    if response.status == 200:
-                        audio_bytes = await response.read()
-                        print("Coqui synthesis complete.")
-                        return audio_bytes
-                    else:
-                        print(f"Coqui TTS API error: {response.status}")
-                        return None
+            # Pooled keep-alive client: no new TCP connection per sentence
+            client = get_http_pool().get_async_client(self.coqui_config['api_url'])
+            response = await client.post(self.coqui_config['api_url'], json=payload, timeout=30)
+            if response.status_code == 200:
+                print("Coqui synthesis complete.")
+                return response.content
+            else:
+                print(f"Coqui TTS API error: {response.status_code}")
+                return None
                         
         except Exception as e:
             print(f"Coqui synthesis error: {e}")
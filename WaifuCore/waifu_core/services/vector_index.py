@@ -0,0 +1,111 @@
+# waifu_core/services/vector_index.py
+import json
+import re
+import threading
+from pathlib import Path
+
+import numpy as np
+
+
+class _UserMatrix:
+    """One user's rows: a memory-mapped float32 matrix plus the documents in the same order."""
+
+    def __init__(self, matrix_path: Path, documents_path: Path, dim: int):
+        self.matrix_path = matrix_path
+        self.documents_path = documents_path
+        self.dim = dim
+        self.documents: list[str] = []
+        self.ids: set[str] = set()
+        if documents_path.exists():
+            for line in documents_path.read_text(encoding="utf-8").splitlines():
+                if line.strip():
+                    record = json.loads(line)
+                    self.documents.append(record["document"])
+                    self.ids.add(record["id"])
+        self.matrix = None
+        self._map()
+
+    def _map(self):
+        rows = self.matrix_path.stat().st_size // (4 * self.dim) if self.matrix_path.exists() else 0
+        # A crash between the two appends can leave one file a row ahead; only complete rows count
+        rows = min(rows, len(self.documents))
+        self.documents = self.documents[:rows]
+        self.matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r", shape=(rows, self.dim)) if rows else None
+
+    def append(self, ids: list[str], documents: list[str], embeddings: np.ndarray):
+        # Plain appends: existing rows are never rewritten, the map is just reopened one size larger
+        with open(self.matrix_path, "ab") as f:
+            f.write(np.ascontiguousarray(embeddings, dtype=np.float32).tobytes())
+        with open(self.documents_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps({"id": i, "document": d}, ensure_ascii=False) + "\n" for i, d in zip(ids, documents)))
+        self.documents.extend(documents)
+        self.ids.update(ids)
+        self._map()
+
+    def search(self, query: np.ndarray, k: int) -> list[str]:
+        if self.matrix is None:
+            return []
+        scores = self.matrix @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [self.documents[i] for i in top[np.argsort(-scores[top])]]
+
+
+class MemmapVectorIndex:
+    """
+    Per-user memory index for the "memmap" MemoryService backend. Each user's
+    embeddings are normalized and stored as one contiguous float32 matrix in a
+    memory-mapped file, so retrieval is a single dot product and a top-k instead
+    of a filtered Chroma query. New memories are appended to the end of the file.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._meta_path = self.directory / "index.json"
+        self.dim = json.loads(self._meta_path.read_text())["dim"] if self._meta_path.exists() else None
+        self._users: dict[str, _UserMatrix] = {}
+        self._lock = threading.Lock()
+
+    def _file_stem(self, user_id: str) -> Path:
+        return self.directory / re.sub(r'[^A-Za-z0-9_.-]', '_', user_id)
+
+    def has_user(self, user_id: str) -> bool:
+        return user_id in self._users or self._file_stem(user_id).with_suffix(".jsonl").exists()
+
+    def _user(self, user_id: str) -> _UserMatrix | None:
+        user = self._users.get(user_id)
+        if user is None and self.dim is not None:
+            stem = self._file_stem(user_id)
+            user = self._users[user_id] = _UserMatrix(stem.with_suffix(".f32"), stem.with_suffix(".jsonl"), self.dim)
+        return user
+
+    def append(self, user_id: str, ids: list[str], documents: list[str], embeddings) -> None:
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1) if ids else None
+        with self._lock:
+            if embeddings is not None and self.dim is None:
+                self.dim = embeddings.shape[1]
+                self._meta_path.write_text(json.dumps({"dim": self.dim}))
+            if embeddings is None:
+                # Still record the user, so an empty Chroma history isn't backfilled again
+                self._file_stem(user_id).with_suffix(".jsonl").touch()
+                return
+            user = self._user(user_id)
+            keep = [i for i, memory_id in enumerate(ids) if memory_id not in user.ids]
+            if not keep:
+                return
+            rows = embeddings[keep]
+            rows /= np.maximum(np.linalg.norm(rows, axis=1, keepdims=True), 1e-12)
+            user.append([ids[i] for i in keep], [documents[i] for i in keep], rows)
+
+    def search(self, user_id: str, embedding, k: int) -> list[str]:
+        with self._lock:
+            user = self._user(user_id)
+        if user is None:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        return user.search(query / max(float(np.linalg.norm(query)), 1e-12), k)
+
+    def count(self, user_id: str) -> int:
+        user = self._user(user_id)
+        return len(user.documents) if user else 0